@@ -1,40 +1,715 @@
+import asyncio
+import atexit
+import functools
+import hashlib
 import json
+import logging
+import math
 import os
+import random
+import re
+import socket
 import sqlite3
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import Context, ContextVar, copy_context
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
 
+import anyio.to_thread
 import requests
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 
 DB_PATH = os.environ.get("INSIGHTS_DB_PATH", "/data/insights.db")
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", "65536"))
+# Postgres compartido por varias réplicas (esquema de serverless_lib/db.js); vacío = SQLite en INSIGHTS_DB_PATH
+POSTGRES_URL = os.environ.get("POSTGRES_URL") or os.environ.get("DATABASE_URL", "")
+POSTGRES_POOL_MIN = int(os.environ.get("POSTGRES_POOL_MIN", "1"))
+POSTGRES_POOL_MAX = int(os.environ.get("POSTGRES_POOL_MAX", "5"))
+POSTGRES_POOL_TIMEOUT = float(os.environ.get("POSTGRES_POOL_TIMEOUT", "30"))
+INSIGHTS_SERVICE_URL = os.environ.get("INSIGHTS_SERVICE_URL", "http://insights_service:8090")
 OPENAI_API_URL = os.environ.get("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 LLM_MODEL = os.environ.get("LLM_MODEL", "gpt-4o-mini")
 OPENAI_TIMEOUT = int(os.environ.get("OPENAI_TIMEOUT", "180"))
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "2"))
+OPENAI_RETRY_BASE_SECONDS = float(os.environ.get("OPENAI_RETRY_BASE_SECONDS", "1.0"))
+OPENAI_RETRY_MAX_SECONDS = float(os.environ.get("OPENAI_RETRY_MAX_SECONDS", "30"))
+OPENAI_HEDGE_ENABLED = os.environ.get("OPENAI_HEDGE_ENABLED", "false").lower() in {"1", "true", "yes"}
+OPENAI_HEDGE_QUANTILE = float(os.environ.get("OPENAI_HEDGE_QUANTILE", "0.95"))
+OPENAI_HEDGE_MIN_DELAY_SECONDS = float(os.environ.get("OPENAI_HEDGE_MIN_DELAY_SECONDS", "2.0"))
+OPENAI_HEDGE_BUDGET_PER_MINUTE = int(os.environ.get("OPENAI_HEDGE_BUDGET_PER_MINUTE", "10"))
 MAX_LIMIT = int(os.environ.get("ANALYSIS_MAX_LIMIT", "20"))
+CONTENT_TOKEN_BUDGET = int(os.environ.get("ANALYSIS_CONTENT_TOKEN_BUDGET", "250"))
+HIERARCHICAL_MAX_LIMIT = int(os.environ.get("ANALYSIS_HIERARCHICAL_MAX_LIMIT", "5000"))
+# Máximo `k` que acepta GET /insights/search de insights_service
+INSIGHTS_SEARCH_MAX_K = 100
+CHUNK_TOKEN_BUDGET = int(os.environ.get("ANALYSIS_CHUNK_TOKEN_BUDGET", "6000"))
+MAP_CONCURRENCY = int(os.environ.get("ANALYSIS_MAP_CONCURRENCY", "4"))
+REDUCE_FANIN = int(os.environ.get("ANALYSIS_REDUCE_FANIN", "8"))
+# Un lote termina, de media, cada N insights en un id "ancla" (hash del id), aunque no se agote el presupuesto
+CHUNK_ANCHOR_EVERY = int(os.environ.get("ANALYSIS_CHUNK_ANCHOR_EVERY", "24"))
+INCREMENTAL_MAX_DELTAS = int(os.environ.get("ANALYSIS_INCREMENTAL_MAX_DELTAS", "5"))
+FIELD_PROFILE = os.environ.get("ANALYSIS_FIELD_PROFILE", "standard")
+PAYLOAD_FORMAT = os.environ.get("ANALYSIS_PAYLOAD_FORMAT", "table")
+LLM_LEDGER_BATCH_SIZE = int(os.environ.get("LLM_LEDGER_BATCH_SIZE", "50"))
+LLM_LEDGER_FLUSH_SECONDS = float(os.environ.get("LLM_LEDGER_FLUSH_SECONDS", "5"))
+TERM_REQUESTS_FLUSH_SECONDS = float(os.environ.get("ANALYSIS_TERM_REQUESTS_FLUSH_SECONDS", "10"))
+# Trazas: fracción de peticiones muestreadas y destinos (JSONL y/o colector OTLP/HTTP, p. ej. :4318/v1/traces)
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.0"))
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH", "")
+TRACE_COLLECTOR_URL = os.environ.get("TRACE_COLLECTOR_URL", "")
+TRACE_FLUSH_SECONDS = float(os.environ.get("TRACE_FLUSH_SECONDS", "2"))
+TRACE_BATCH_SIZE = int(os.environ.get("TRACE_BATCH_SIZE", "1000"))
+TRACING_ENABLED = bool(TRACE_EXPORT_PATH or TRACE_COLLECTOR_URL)
+# false cuando insights_service importa el módulo para su /pipeline: el proceso anfitrión vacía sus buffers
+BACKGROUND_WORKERS_ENABLED = os.environ.get("SERVICE_BACKGROUND_WORKERS", "true").lower() in {"1", "true", "yes"}
+# Endpoints ligados al LLM: concurrencia máxima y cola de espera acotada; al desbordar responden 503 + Retry-After
+ADMISSION_LIMITS: Dict[str, Dict[str, int]] = json.loads(
+    os.environ.get(
+        "ADMISSION_LIMITS",
+        '{"/analysis": {"concurrency": 4, "queue": 8}, "/analysis/run": {"concurrency": 4, "queue": 8},'
+        ' "/analysis/run/stream": {"concurrency": 4, "queue": 8}}',
+    )
+)
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT_SECONDS", "15"))
+# Hilos del threadpool que quedan libres para lecturas baratas aunque los endpoints del LLM estén al límite
+ADMISSION_READ_THREADS = int(os.environ.get("ADMISSION_READ_THREADS", "16"))
+ADMISSION_RETRY_AFTER_MAX_SECONDS = 120
+SCHEDULER_ENABLED = os.environ.get("ANALYSIS_SCHEDULER_ENABLED", "true").lower() in {"1", "true", "yes"}
+# Ventana valle en horas UTC "inicio-fin" (fin excluido, admite cruzar medianoche); vacío = siempre
+SCHEDULER_HOURS = os.environ.get("ANALYSIS_SCHEDULER_HOURS", "1-6")
+SCHEDULER_INTERVAL_SECONDS = float(os.environ.get("ANALYSIS_SCHEDULER_INTERVAL_SECONDS", "600"))
+SCHEDULER_DAILY_TOKEN_BUDGET = int(os.environ.get("ANALYSIS_SCHEDULER_DAILY_TOKEN_BUDGET", "200000"))
+SCHEDULER_LIMIT = int(os.environ.get("ANALYSIS_SCHEDULER_LIMIT", "20"))
+HOT_TERMS = [term.strip() for term in os.environ.get("ANALYSIS_HOT_TERMS", "").split(",") if term.strip()]
+HOT_TERMS_TOP = int(os.environ.get("ANALYSIS_HOT_TERMS_TOP", "5"))
+HOT_TERMS_DAYS = int(os.environ.get("ANALYSIS_HOT_TERMS_DAYS", "7"))
+SCHEDULER_OUTPUT_TOKENS = 1500
+SCHEDULER_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+logger = logging.getLogger("uvicorn.error")
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?;])\s+|\n+")
 
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
 
-def get_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS analysis_results (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            term TEXT,
-            insight_ids TEXT NOT NULL,
-            result_json TEXT NOT NULL,
-            count INTEGER NOT NULL,
-            created_at TEXT NOT NULL
-        );
-        """
+LLM_USAGE_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS llm_usage (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at TEXT NOT NULL,
+        service TEXT NOT NULL,
+        endpoint TEXT,
+        term TEXT,
+        model TEXT NOT NULL,
+        prompt_tokens INTEGER,
+        cached_tokens INTEGER,
+        completion_tokens INTEGER,
+        latency_ms INTEGER NOT NULL,
+        retries INTEGER NOT NULL DEFAULT 0,
+        hedged INTEGER NOT NULL DEFAULT 0,
+        cache_hit INTEGER,
+        status TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_llm_usage_created_at ON llm_usage(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_llm_usage_term_created_at ON llm_usage(term, created_at)",
+)
+
+
+# Columnas añadidas después de la tabla original; se crean al arrancar si faltan
+ANALYSIS_RESULT_COLUMNS = {
+    "cache_key": "TEXT",
+    "llm_model": "TEXT",
+    "prompt_version": "TEXT",
+    "mode": "TEXT",
+    "parent_id": "INTEGER",
+    "delta_depth": "INTEGER NOT NULL DEFAULT 0",
+    "max_insight_id": "INTEGER",
+    "insights_count": "INTEGER",
+    "opportunities_count": "INTEGER",
+    "risks_count": "INTEGER",
+    "headline_titles": "TEXT",
+    # window: los `window_size` insights más recientes del término; ids/query: selección explícita
+    "selection": "TEXT",
+    "window_size": "INTEGER",
+}
+# Modos cuyo resultado cubre la ventana reciente del término y sirven de base a una revisión incremental
+TERM_WINDOW_MODES = ("full", "rebuild", "incremental")
+HISTORY_HEADLINES = 3
+
+
+def analysis_summary_values(result: Dict[str, Any]) -> Tuple[int, int, int, str]:
+    """Columns that let the history list skip ``result_json``: section counts and the first insight titles."""
+    insights = result.get("insights") or []
+    titles = [item.get("titulo") for item in insights[:HISTORY_HEADLINES] if isinstance(item, dict)]
+    return (
+        len(insights),
+        len(result.get("oportunidades_negocio") or []),
+        len(result.get("riesgos_reputacionales") or []),
+        json.dumps([title for title in titles if title], ensure_ascii=False),
+    )
+
+
+def backfill_analysis_summaries(db: sqlite3.Connection, batch_size: int = 500) -> None:
+    # Filas guardadas antes de existir las columnas de resumen: se decodifican una sola vez
+    while True:
+        rows = db.execute(
+            "SELECT id, result_json FROM analysis_results WHERE insights_count IS NULL LIMIT ?",
+            (batch_size,),
+        ).fetchall()
+        if not rows:
+            return
+        db.executemany(
+            """
+            UPDATE analysis_results
+            SET insights_count = ?, opportunities_count = ?, risks_count = ?, headline_titles = ?
+            WHERE id = ?
+            """,
+            [(*analysis_summary_values(json.loads(row["result_json"])), row["id"]) for row in rows],
+        )
+
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_OTLP_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+
+class Span:
+    """One timed step of a request trace (W3C trace-context ids); only sampled spans are exported."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "sampled", "attributes", "status", "start", "_clock")
+
+    def __init__(
+        self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool, kind: str, attributes: Dict[str, Any]
+    ):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.sampled = sampled
+        self.attributes = attributes
+        self.status = "ok"
+        self.start = time.time()
+        self._clock = time.perf_counter()
+
+    def fail(self, exc: BaseException) -> None:
+        self.status = "error"
+        self.attributes["error"] = f"{type(exc).__name__}: {getattr(exc, 'detail', exc)}"[:300]
+
+    def finish(self) -> None:
+        if not self.sampled:
+            return
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "service": SERVICE_NAME,
+            "name": self.name,
+            "kind": self.kind,
+            "start": round(self.start, 6),
+            "duration_ms": round((time.perf_counter() - self._clock) * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+        with _trace_lock:
+            _trace_buffer.append(record)
+            full = len(_trace_buffer) >= TRACE_BATCH_SIZE
+        if full:
+            flush_traces()
+
+
+# Span activo de la petición en curso; los hilos lanzados con copy_context lo heredan
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_trace_lock = threading.Lock()
+_trace_buffer: List[Dict[str, Any]] = []
+
+
+def start_trace(name: str, traceparent: Optional[str]) -> Span:
+    """Root span of an incoming request: continue the caller's trace or start one, sampled at TRACE_SAMPLE_RATE."""
+    match = _TRACEPARENT_RE.match((traceparent or "").strip().lower())
+    if match:
+        trace_id, parent_id, flags = match.groups()
+        return Span(name, trace_id, parent_id, bool(int(flags, 16) & 1), "server", {})
+    return Span(name, os.urandom(16).hex(), None, random.random() < TRACE_SAMPLE_RATE, "server", {})
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes: Any) -> Iterator[Optional[Span]]:
+    """Child of the current span; a no-op (yields None) outside a sampled request."""
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        yield None
+        return
+    current = Span(name, parent.trace_id, parent.span_id, True, kind, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.fail(exc)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish()
+
+
+def traced(name: Optional[str] = None, kind: str = "internal") -> Callable:
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name or func.__name__, kind):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def trace_headers() -> Dict[str, str]:
+    """``traceparent`` for outgoing calls to our other services, carrying the sampling decision."""
+    current = _current_span.get()
+    if current is None:
+        return {}
+    return {"traceparent": f"00-{current.trace_id}-{current.span_id}-{'01' if current.sampled else '00'}"}
+
+
+class TracedConnection(sqlite3.Connection):
+    """sqlite3 connection that records every statement as a span while a sampled request is running."""
+
+    def execute(self, sql: str, parameters: Any = (), /) -> sqlite3.Cursor:
+        with span(f"sqlite {sql.split(None, 1)[0].upper()}", statement=" ".join(sql.split())[:300]):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql: str, parameters: Any, /) -> sqlite3.Cursor:
+        with span(f"sqlite {sql.split(None, 1)[0].upper()}", statement=" ".join(sql.split())[:300], many=True):
+            return super().executemany(sql, parameters)
+
+
+def otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_span(record: Dict[str, Any]) -> Dict[str, Any]:
+    start = int(record["start"] * 1e9)
+    return {
+        "traceId": record["trace_id"],
+        "spanId": record["span_id"],
+        "parentSpanId": record["parent_id"] or "",
+        "name": record["name"],
+        "kind": _OTLP_KINDS.get(record["kind"], 1),
+        "startTimeUnixNano": str(start),
+        "endTimeUnixNano": str(start + int(record["duration_ms"] * 1e6)),
+        "attributes": [{"key": key, "value": otlp_value(value)} for key, value in record["attributes"].items()],
+        "status": {"code": 2 if record["status"] == "error" else 1},
+    }
+
+
+def flush_traces() -> None:
+    """Append buffered spans to TRACE_EXPORT_PATH (JSONL) and/or POST them to an OTLP/HTTP collector."""
+    with _trace_lock:
+        records = list(_trace_buffer)
+        _trace_buffer.clear()
+    if not records:
+        return
+    if TRACE_EXPORT_PATH:
+        lines = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+        try:
+            # Un único write con O_APPEND: varios workers pueden compartir el archivo sin mezclar líneas
+            fd = os.open(TRACE_EXPORT_PATH, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, lines.encode("utf-8"))
+            finally:
+                os.close(fd)
+        except OSError as exc:
+            logger.warning("Could not write %s spans to %s: %s", len(records), TRACE_EXPORT_PATH, exc)
+    if TRACE_COLLECTOR_URL:
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                    "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": [otlp_span(record) for record in records]}],
+                }
+            ]
+        }
+        try:
+            requests.post(TRACE_COLLECTOR_URL, json=payload, timeout=5).raise_for_status()
+        except requests.RequestException as exc:
+            logger.warning("Could not export %s spans to %s: %s", len(records), TRACE_COLLECTOR_URL, exc)
+
+
+def trace_flush_loop() -> None:
+    while True:
+        time.sleep(TRACE_FLUSH_SECONDS)
+        flush_traces()
+
+
+class Database:
+    """WAL-mode access to the shared ``insights.db``: one read connection per thread and a single serialized writer.
+
+    Other processes (insights_service, extra uvicorn workers) open their own ``Database``; WAL lets their
+    readers proceed during writes, and ``BEGIN IMMEDIATE`` plus ``busy_timeout`` queue the writers.
+    """
+
+    dialect = "sqlite"
+    Error = sqlite3.Error
+
+    def __init__(self, path: str, setup: Optional[Callable[[sqlite3.Connection], None]] = None):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._writer = self._open()
+        # journal_mode se guarda en el archivo: basta con fijarlo desde la conexión de escritura
+        self.journal_mode = self._writer.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        if setup is not None:
+            with self._write_lock:
+                setup(self._writer)
+
+    def _open(self, query_only: bool = False) -> sqlite3.Connection:
+        db = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+            isolation_level=None,
+            factory=TracedConnection if TRACING_ENABLED else sqlite3.Connection,
+        )
+        db.row_factory = sqlite3.Row
+        db.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        db.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        db.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        db.execute(f"PRAGMA cache_size = {-SQLITE_CACHE_SIZE_KB}")
+        db.execute("PRAGMA temp_store = MEMORY")
+        if query_only:
+            db.execute("PRAGMA query_only = ON")
+        return db
+
+    def reader(self) -> sqlite3.Connection:
+        """Connection for the calling thread; inside ``write()`` it is the writer, so reads see own changes."""
+        if getattr(self._local, "writing", False):
+            return self._writer
+        db = getattr(self._local, "conn", None)
+        if db is None:
+            db = self._local.conn = self._open(query_only=True)
+        return db
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        """Serialize writers of this process and run the block in one ``BEGIN IMMEDIATE`` transaction."""
+        with span("sqlite.write"), self._write_lock:
+            if self._writer.in_transaction:
+                # Bloque anidado: la transacción exterior confirma o deshace
+                yield self._writer
+                return
+            self._writer.execute("BEGIN IMMEDIATE")
+            self._local.writing = True
+            try:
+                yield self._writer
+            except BaseException:
+                self._writer.rollback()
+                raise
+            else:
+                self._writer.commit()
+            finally:
+                self._local.writing = False
+
+    def columns(self, table: str) -> List[str]:
+        return [row[1] for row in self.reader().execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+class PostgresRow(tuple):
+    """Result row readable by position, by column name and as ``dict(row)``, like ``sqlite3.Row``."""
+
+    def __new__(cls, values: Iterable[Any], index: Dict[str, int]) -> "PostgresRow":
+        row = super().__new__(cls, values)
+        row._index = index
+        return row
+
+    def __getitem__(self, key: Any) -> Any:
+        return super().__getitem__(self._index[key] if isinstance(key, str) else key)
+
+    def keys(self) -> List[str]:
+        return list(self._index)
+
+
+def postgres_value(value: Any) -> Any:
+    """Values as the SQLite code reads them: naive UTC ISO timestamps, JSON/arrays as text, plain numbers."""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def postgres_row_factory(cursor: Any) -> Callable[[Any], PostgresRow]:
+    index = {column.name: position for position, column in enumerate(cursor.description or [])}
+    return lambda values: PostgresRow((postgres_value(value) for value in values), index)
+
+
+_POSTGRES_PARAM_RE = re.compile(r"'(?:[^']|'')*'|\?|%")
+
+
+def postgres_sql(sql: str) -> str:
+    """``?`` placeholders to psycopg's ``%s``; every literal ``%`` (also inside quotes) is doubled."""
+    return _POSTGRES_PARAM_RE.sub(lambda match: "%s" if match.group() == "?" else match.group().replace("%", "%%"), sql)
+
+
+class PostgresConnection:
+    """The part of ``sqlite3.Connection`` the service uses (``execute``/``executemany``) over a psycopg connection."""
+
+    def __init__(self, conn: Any):
+        self.conn = conn
+
+    def execute(self, sql: str, parameters: Any = ()) -> Any:
+        with span(f"postgres {sql.split(None, 1)[0].upper()}", statement=" ".join(sql.split())[:300]):
+            cursor = self.conn.cursor()
+            if parameters:
+                cursor.execute(postgres_sql(sql), parameters)
+            else:
+                cursor.execute(sql)
+            return cursor
+
+    def executemany(self, sql: str, parameters: Any) -> Any:
+        with span(f"postgres {sql.split(None, 1)[0].upper()}", statement=" ".join(sql.split())[:300], many=True):
+            cursor = self.conn.cursor()
+            cursor.executemany(postgres_sql(sql), parameters)
+            return cursor
+
+
+class PostgresRows:
+    """Fully fetched result of an autocommit read; the pooled connection is already back in the pool."""
+
+    def __init__(self, rows: List[PostgresRow], rowcount: int):
+        self._rows = rows
+        self._position = 0
+        self.rowcount = rowcount
+
+    def fetchmany(self, size: int = 1) -> List[PostgresRow]:
+        batch = self._rows[self._position : self._position + size]
+        self._position += len(batch)
+        return batch
+
+    def fetchone(self) -> Optional[PostgresRow]:
+        batch = self.fetchmany(1)
+        return batch[0] if batch else None
+
+    def fetchall(self) -> List[PostgresRow]:
+        return self.fetchmany(len(self._rows))
+
+    def __iter__(self) -> Iterator[PostgresRow]:
+        return iter(self.fetchall())
+
+
+class PostgresReader:
+    """``reader()`` outside a write: each statement borrows a pooled connection only while it runs."""
+
+    def __init__(self, pool: Any):
+        self._pool = pool
+
+    def execute(self, sql: str, parameters: Any = ()) -> PostgresRows:
+        with self._pool.connection() as conn:
+            cursor = PostgresConnection(conn).execute(sql, parameters)
+            return PostgresRows(cursor.fetchall() if cursor.description else [], cursor.rowcount)
+
+
+class PostgresDatabase:
+    """Pooled access to a shared Postgres, so several replicas (and their workers) use one store.
+
+    Same interface as ``Database``: ``reader()`` runs autocommit reads on any pooled connection and
+    ``write()`` one transaction; queries are written once with ``?`` placeholders for both backends.
+    """
+
+    dialect = "postgres"
+
+    def __init__(self, url: str, setup: Optional[Callable[[PostgresConnection], None]] = None):
+        import psycopg
+        from psycopg_pool import ConnectionPool
+
+        self.Error = psycopg.Error
+        self.path = url.rsplit("@", 1)[-1]
+        self._local = threading.local()
+        self._pool = ConnectionPool(
+            url,
+            min_size=POSTGRES_POOL_MIN,
+            max_size=POSTGRES_POOL_MAX,
+            timeout=POSTGRES_POOL_TIMEOUT,
+            # Sesión en UTC: los TIMESTAMPTZ se leen como el texto ISO sin zona que escribe SQLite
+            kwargs={"autocommit": True, "row_factory": postgres_row_factory, "options": "-c TimeZone=UTC"},
+            check=ConnectionPool.check_connection,
+            name=SERVICE_NAME,
+            open=True,
+        )
+        self._reader = PostgresReader(self._pool)
+        if setup is not None:
+            with self.write() as db:
+                # Réplicas que arrancan a la vez: el DDL se aplica de una en una
+                db.execute("SELECT pg_advisory_xact_lock(?)", (POSTGRES_SCHEMA_LOCK,))
+                setup(db)
+
+    def reader(self) -> Any:
+        """Inside ``write()`` the thread's transaction, so reads see own changes; otherwise pooled autocommit reads."""
+        return getattr(self._local, "conn", None) or self._reader
+
+    @contextmanager
+    def write(self) -> Iterator[PostgresConnection]:
+        """Run the block in one transaction on a pooled connection; a nested block joins the outer one."""
+        current = getattr(self._local, "conn", None)
+        if current is not None:
+            yield current
+            return
+        with span("postgres.write"), self._pool.connection() as conn, conn.transaction():
+            self._local.conn = PostgresConnection(conn)
+            try:
+                yield self._local.conn
+            finally:
+                self._local.conn = None
+
+    def columns(self, table: str) -> List[str]:
+        rows = self.reader().execute(
+            """
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = ?
+            ORDER BY ordinal_position
+            """,
+            (table,),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+
+def ensure_analysis_schema(db: sqlite3.Connection) -> None:
+    # Varios procesos pueden arrancar a la vez: el DDL y el backfill van en una sola transacción de escritura
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS analysis_results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                term TEXT,
+                insight_ids TEXT NOT NULL,
+                result_json TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                created_at TEXT NOT NULL
+            );
+            """
+        )
+        # user_version pertenece a insights_service (dueño del esquema de insights.db); aquí basta DDL idempotente
+        existing = {row[1] for row in db.execute("PRAGMA table_info(analysis_results)").fetchall()}
+        for column, ddl in ANALYSIS_RESULT_COLUMNS.items():
+            if column not in existing:
+                db.execute(f"ALTER TABLE analysis_results ADD COLUMN {column} {ddl}")
+        backfill_analysis_summaries(db)
+        db.execute("CREATE INDEX IF NOT EXISTS idx_analysis_results_term_id ON analysis_results(term, id);")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_analysis_results_cache_key ON analysis_results(cache_key, id);")
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS analysis_partials (
+                cache_key TEXT PRIMARY KEY,
+                level INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                summary_json TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS analysis_term_requests (
+                day TEXT NOT NULL,
+                term TEXT NOT NULL,
+                requests INTEGER NOT NULL,
+                PRIMARY KEY (day, term)
+            ) WITHOUT ROWID
+            """
+        )
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS analysis_scheduler_lease (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        for statement in LLM_USAGE_DDL:
+            db.execute(statement)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+# Postgres: `analysis_results` con el esquema de serverless_lib/db.js (ids como BIGINT[], resultado JSONB)
+# más las columnas y tablas propias de este servicio; DDL idempotente como en ensure_analysis_schema
+POSTGRES_ANALYSIS_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS analysis_results (
+        id BIGSERIAL PRIMARY KEY,
+        term TEXT,
+        insight_ids BIGINT[] NOT NULL,
+        result_json JSONB NOT NULL,
+        count INT NOT NULL,
+        created_at TIMESTAMPTZ DEFAULT NOW()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_analysis_created ON analysis_results(created_at DESC)",
+    *(f"ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS {column} {ddl}" for column, ddl in ANALYSIS_RESULT_COLUMNS.items()),
+    "CREATE INDEX IF NOT EXISTS idx_analysis_results_term_id ON analysis_results(term, id)",
+    "CREATE INDEX IF NOT EXISTS idx_analysis_results_cache_key ON analysis_results(cache_key, id)",
+    """
+    CREATE TABLE IF NOT EXISTS analysis_partials (
+        cache_key TEXT PRIMARY KEY,
+        level INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        summary_json TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS analysis_term_requests (
+        day TEXT NOT NULL,
+        term TEXT NOT NULL,
+        requests INTEGER NOT NULL,
+        PRIMARY KEY (day, term)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS analysis_scheduler_lease (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at DOUBLE PRECISION NOT NULL
     )
-    return conn
+    """,
+    *(statement.replace("INTEGER PRIMARY KEY AUTOINCREMENT", "BIGSERIAL PRIMARY KEY") for statement in LLM_USAGE_DDL),
+)
+
+
+def ensure_postgres_analysis_schema(db: "PostgresConnection") -> None:
+    for statement in POSTGRES_ANALYSIS_SCHEMA:
+        db.execute(statement)
+    # Análisis guardados por serverless_lib no traen las columnas de resumen
+    backfill_analysis_summaries(db)
 
 
 def parse_llm_json(raw_text: str) -> Dict[str, Any]:
@@ -47,49 +722,393 @@ def parse_llm_json(raw_text: str) -> Dict[str, Any]:
     return json.loads(cleaned)
 
 
-def format_articles(rows: List[sqlite3.Row]) -> List[Dict[str, Any]]:
+def estimate_tokens(text: str) -> int:
+    """Offline BPE approximation: one token per punctuation mark, ~5 characters per word piece."""
+    return sum(1 if not piece[0].isalnum() else 1 + (len(piece) - 1) // 5 for piece in _TOKEN_RE.findall(text))
+
+
+def trim_to_token_budget(text: Optional[str], budget: int, known_texts: List[Optional[str]]) -> Optional[str]:
+    """Keep the lead sentences of ``text`` that fit in ``budget``, skipping ones already in ``known_texts``."""
+    if not text or estimate_tokens(text) <= budget:
+        return text
+    known = " ".join(item for item in known_texts if item).lower()
+    kept: List[str] = []
+    used = 0
+    for sentence in _SENTENCE_SPLIT_RE.split(text):
+        sentence = sentence.strip()
+        if not sentence or sentence.lower() in known:
+            continue
+        cost = estimate_tokens(sentence)
+        if used + cost > budget:
+            break
+        kept.append(sentence)
+        used += cost
+    return " ".join(kept) or None
+
+
+# Campos enviados al LLM por insight; "full" reproduce el payload original
+FIELD_PROFILES: Dict[str, Tuple[str, ...]] = {
+    "full": (
+        "term",
+        "sentimiento",
+        "resumen",
+        "resumen_ejecutivo",
+        "categoria",
+        "etiquetas",
+        "marca",
+        "entidad",
+        "tono",
+        "temas_principales",
+        "subtemas",
+        "stakeholders",
+        "impacto_social",
+        "impacto_economico",
+        "impacto_politico",
+        "palabras_clave_contextuales",
+        "trending_topics",
+        "analisis_competitivo",
+        "credibilidad_fuente",
+        "sesgo_detectado",
+        "localizacion_geografica",
+        "fuentes_citadas",
+        "datos_numericos",
+        "urgencia",
+        "audiencia_objetivo",
+        "titulo",
+        "descripcion",
+        "contenido",
+        "url",
+        "imagen",
+        "cita_clave",
+        "created_at",
+    ),
+    "standard": (
+        "term",
+        "fecha",
+        "titulo",
+        "sentimiento",
+        "tono",
+        "categoria",
+        "resumen_ejecutivo",
+        "marca",
+        "entidad",
+        "temas_principales",
+        "subtemas",
+        "stakeholders",
+        "impacto_social",
+        "impacto_economico",
+        "impacto_politico",
+        "analisis_competitivo",
+        "credibilidad_fuente",
+        "sesgo_detectado",
+        "localizacion_geografica",
+        "fuentes_citadas",
+        "datos_numericos",
+        "urgencia",
+        "cita_clave",
+        "contenido",
+    ),
+    "compact": (
+        "term",
+        "fecha",
+        "titulo",
+        "sentimiento",
+        "tono",
+        "resumen_ejecutivo",
+        "marca",
+        "entidad",
+        "temas_principales",
+        "stakeholders",
+        "datos_numericos",
+        "urgencia",
+        "cita_clave",
+    ),
+}
+PAYLOAD_FORMATS = ("json", "table")
+
+
+def format_articles(rows: List[sqlite3.Row], profile: Optional[str] = None) -> List[Dict[str, Any]]:
+    fields = FIELD_PROFILES.get(profile or FIELD_PROFILE, FIELD_PROFILES["standard"])
     articles: List[Dict[str, Any]] = []
     for row in rows:
         record = dict(row)
-        articles.append(
-            {
-                "term": record.get("term"),
-                "sentimiento": record.get("sentimiento"),
-                "resumen": record.get("resumen"),
-                "resumen_ejecutivo": record.get("resumen_ejecutivo"),
-                "categoria": record.get("categoria"),
-                "etiquetas": record.get("etiquetas"),
-                "marca": record.get("marca"),
-                "entidad": record.get("entidad"),
-                "tono": record.get("tono"),
-                "temas_principales": record.get("temas_principales"),
-                "subtemas": record.get("subtemas"),
-                "stakeholders": record.get("stakeholders"),
-                "impacto_social": record.get("impacto_social"),
-                "impacto_economico": record.get("impacto_economico"),
-                "impacto_politico": record.get("impacto_politico"),
-                "palabras_clave_contextuales": record.get("palabras_clave_contextuales"),
-                "trending_topics": record.get("trending_topics"),
-                "analisis_competitivo": record.get("analisis_competitivo"),
-                "credibilidad_fuente": record.get("credibilidad_fuente"),
-                "sesgo_detectado": record.get("sesgo_detectado"),
-                "localizacion_geografica": record.get("localizacion_geografica"),
-                "fuentes_citadas": record.get("fuentes_citadas"),
-                "datos_numericos": record.get("datos_numericos"),
-                "urgencia": record.get("urgencia"),
-                "audiencia_objetivo": record.get("audiencia_objetivo"),
-                "titulo": record.get("article_title"),
-                "descripcion": record.get("article_description"),
-                "contenido": record.get("article_content"),
-                "url": record.get("article_url"),
-                "imagen": record.get("article_image"),
-                "cita_clave": record.get("cita_clave"),
-                "created_at": record.get("created_at"),
-            }
-        )
+        article = {
+            "term": record.get("term"),
+            "sentimiento": record.get("sentimiento"),
+            "resumen": record.get("resumen"),
+            "resumen_ejecutivo": record.get("resumen_ejecutivo"),
+            "categoria": record.get("categoria"),
+            "etiquetas": record.get("etiquetas"),
+            "marca": record.get("marca"),
+            "entidad": record.get("entidad"),
+            "tono": record.get("tono"),
+            "temas_principales": record.get("temas_principales"),
+            "subtemas": record.get("subtemas"),
+            "stakeholders": record.get("stakeholders"),
+            "impacto_social": record.get("impacto_social"),
+            "impacto_economico": record.get("impacto_economico"),
+            "impacto_politico": record.get("impacto_politico"),
+            "palabras_clave_contextuales": record.get("palabras_clave_contextuales"),
+            "trending_topics": record.get("trending_topics"),
+            "analisis_competitivo": record.get("analisis_competitivo"),
+            "credibilidad_fuente": record.get("credibilidad_fuente"),
+            "sesgo_detectado": record.get("sesgo_detectado"),
+            "localizacion_geografica": record.get("localizacion_geografica"),
+            "fuentes_citadas": record.get("fuentes_citadas"),
+            "datos_numericos": record.get("datos_numericos"),
+            "urgencia": record.get("urgencia"),
+            "audiencia_objetivo": record.get("audiencia_objetivo"),
+            "titulo": record.get("article_title"),
+            "descripcion": record.get("article_description"),
+            "url": record.get("article_url"),
+            "imagen": record.get("article_image"),
+            "cita_clave": record.get("cita_clave"),
+            "created_at": record.get("created_at"),
+            "fecha": (record.get("created_at") or "")[:10] or None,
+        }
+        if "contenido" in fields:
+            article["contenido"] = trim_to_token_budget(
+                record.get("article_content"),
+                CONTENT_TOKEN_BUDGET,
+                [record.get("article_title"), record.get("article_description"), record.get("resumen_ejecutivo")],
+            )
+        # Sin nulos ni vacíos: el LLM los interpreta igual que un campo ausente
+        articles.append({field: article[field] for field in fields if article.get(field) not in (None, "")})
     return articles
 
 
+def encode_articles(articles: List[Dict[str, Any]], payload_format: Optional[str] = None) -> str:
+    """Serialise for the prompt. ``table`` hoists values shared by every row and sends one list per row."""
+    if (payload_format or PAYLOAD_FORMAT) != "table":
+        return json.dumps(articles, ensure_ascii=False, separators=(",", ":"))
+    columns: List[str] = []
+    for article in articles:
+        columns.extend(key for key in article if key not in columns)
+    common: Dict[str, Any] = {}
+    if len(articles) > 1:
+        for column in columns:
+            values = {json.dumps(article.get(column), ensure_ascii=False) for article in articles}
+            if len(values) == 1 and articles[0].get(column) is not None:
+                common[column] = articles[0][column]
+    columns = [column for column in columns if column not in common]
+    table = {
+        "comunes": common,
+        "columnas": columns,
+        "filas": [[article.get(column) for column in columns] for article in articles],
+    }
+    return json.dumps(table, ensure_ascii=False, separators=(",", ":"))
+
+
+SERVICE_NAME = "analysis_service"
+# Clave de pg_advisory_xact_lock con la que todos los servicios serializan su DDL al arrancar
+POSTGRES_SCHEMA_LOCK = 720451
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+HEDGE_MIN_SAMPLES = 20
+
+_llm_stats_lock = threading.Lock()
+_llm_latencies: Deque[float] = deque(maxlen=500)
+_hedges_fired_at: Deque[float] = deque()
+llm_call_stats = {"calls": 0, "retries": 0, "hedges_fired": 0, "hedges_won": 0, "hedges_over_budget": 0}
+_hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+
+
+class LLMUnavailableError(HTTPException):
+    """Transient LLM failure (429/5xx/timeout) that already used up its transport retries."""
+
+
+def count_llm_event(name: str) -> None:
+    with _llm_stats_lock:
+        llm_call_stats[name] += 1
+
+
+def latency_quantile(ordered: List[float], quantile: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+def hedge_delay() -> Optional[float]:
+    with _llm_stats_lock:
+        if len(_llm_latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(_llm_latencies)
+    return max(latency_quantile(ordered, OPENAI_HEDGE_QUANTILE), OPENAI_HEDGE_MIN_DELAY_SECONDS)
+
+
+def acquire_hedge_slot() -> bool:
+    now = time.monotonic()
+    with _llm_stats_lock:
+        while _hedges_fired_at and now - _hedges_fired_at[0] > 60:
+            _hedges_fired_at.popleft()
+        if len(_hedges_fired_at) >= OPENAI_HEDGE_BUDGET_PER_MINUTE:
+            llm_call_stats["hedges_over_budget"] += 1
+            return False
+        _hedges_fired_at.append(now)
+        llm_call_stats["hedges_fired"] += 1
+    return True
+
+
+def retry_after_seconds(response: Optional[requests.Response]) -> Optional[float]:
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def send_openai_request(payload: Dict[str, Any], headers: Dict[str, str]) -> requests.Response:
+    started = time.monotonic()
+    response = requests.post(OPENAI_API_URL, json=payload, headers=headers, timeout=OPENAI_TIMEOUT)
+    response.raise_for_status()
+    with _llm_stats_lock:
+        _llm_latencies.append(time.monotonic() - started)
+    return response
+
+
+def send_with_hedge(payload: Dict[str, Any], headers: Dict[str, str]) -> Tuple[requests.Response, bool]:
+    """Send once; if no answer after the recent p95 latency, race a duplicate and keep the first success."""
+    delay = hedge_delay() if OPENAI_HEDGE_ENABLED else None
+    if delay is None:
+        return send_openai_request(payload, headers), False
+    primary = _hedge_executor.submit(send_openai_request, payload, headers)
+    done, _ = wait([primary], timeout=delay)
+    if done or not acquire_hedge_slot():
+        return primary.result(), False
+    hedge = _hedge_executor.submit(send_openai_request, payload, headers)
+    pending = {primary, hedge}
+    error: Optional[requests.RequestException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                response = future.result()
+            except requests.RequestException as exc:
+                error = exc
+                continue
+            if future is hedge:
+                count_llm_event("hedges_won")
+            return response, True
+    raise error
+
+
+def llm_stats_snapshot() -> Dict[str, Any]:
+    with _llm_stats_lock:
+        stats: Dict[str, Any] = dict(llm_call_stats)
+        ordered = sorted(_llm_latencies)
+    for label, quantile in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        value = latency_quantile(ordered, quantile)
+        stats[f"latency_{label}_seconds"] = round(value, 3) if value is not None else None
+    stats["hedge_win_rate"] = round(stats["hedges_won"] / stats["hedges_fired"], 3) if stats["hedges_fired"] else None
+    return stats
+
+
+# Endpoint y término de la petición en curso; lo fijan los endpoints para etiquetar el ledger
+llm_call_context: ContextVar[Dict[str, Optional[str]]] = ContextVar("llm_call_context", default={})
+_ledger_lock = threading.Lock()
+_ledger_buffer: List[tuple] = []
+
+
+def record_llm_usage(
+    usage: Optional[Dict[str, Any]], latency: float, retries: int, hedged: bool, status: str
+) -> None:
+    context = llm_call_context.get()
+    usage = usage or {}
+    cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    row = (
+        datetime.utcnow().isoformat(),
+        SERVICE_NAME,
+        context.get("endpoint"),
+        context.get("term"),
+        LLM_MODEL,
+        usage.get("prompt_tokens"),
+        cached_tokens,
+        usage.get("completion_tokens"),
+        int(latency * 1000),
+        retries,
+        int(hedged),
+        None if cached_tokens is None else int(cached_tokens > 0),
+        status,
+    )
+    with _ledger_lock:
+        _ledger_buffer.append(row)
+        full = len(_ledger_buffer) >= LLM_LEDGER_BATCH_SIZE
+    if full:
+        flush_llm_ledger()
+
+
+def flush_llm_ledger() -> None:
+    with _ledger_lock:
+        rows = list(_ledger_buffer)
+        _ledger_buffer.clear()
+    if not rows:
+        return
+    try:
+        with database.write() as db:
+            db.executemany(
+                """
+                INSERT INTO llm_usage (
+                    created_at, service, endpoint, term, model, prompt_tokens, cached_tokens,
+                    completion_tokens, latency_ms, retries, hedged, cache_hit, status
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+    except database.Error as exc:
+        logger.warning("Could not write %s LLM ledger rows: %s", len(rows), exc)
+
+
+def llm_ledger_flush_loop() -> None:
+    while True:
+        time.sleep(LLM_LEDGER_FLUSH_SECONDS)
+        flush_llm_ledger()
+
+
+_term_requests_lock = threading.Lock()
+_term_requests_buffer: Counter[Tuple[str, str]] = Counter()
+
+
+def note_term_request(term: Optional[str]) -> None:
+    """Count interactive requests per term and day in memory; the scheduler derives hot terms from it.
+
+    Counts reach ``analysis_term_requests`` in batches, so read endpoints never wait on the writer.
+    """
+    if not term:
+        return
+    with _term_requests_lock:
+        _term_requests_buffer[(datetime.utcnow().date().isoformat(), term)] += 1
+
+
+def flush_term_requests() -> None:
+    with _term_requests_lock:
+        counts = list(_term_requests_buffer.items())
+        _term_requests_buffer.clear()
+    if not counts:
+        return
+    try:
+        with database.write() as db:
+            db.executemany(
+                """
+                INSERT INTO analysis_term_requests (day, term, requests) VALUES (?, ?, ?)
+                ON CONFLICT(day, term) DO UPDATE SET requests = analysis_term_requests.requests + excluded.requests
+                """,
+                [(day, term, requests) for (day, term), requests in counts],
+            )
+    except database.Error as exc:
+        logger.warning("Could not write %s term request counts: %s", len(counts), exc)
+
+
+def term_requests_flush_loop() -> None:
+    while True:
+        time.sleep(TERM_REQUESTS_FLUSH_SECONDS)
+        flush_term_requests()
+
+
 def post_openai_json(system_prompt: str, user_prompt: str) -> Dict[str, Any]:
     if not OPENAI_API_KEY:
         raise HTTPException(status_code=500, detail="OPENAI_API_KEY is not configured")
@@ -107,17 +1126,48 @@ def post_openai_json(system_prompt: str, user_prompt: str) -> Dict[str, Any]:
         "Authorization": f"Bearer {OPENAI_API_KEY}",
         "Content-Type": "application/json",
     }
+    count_llm_event("calls")
+    started = time.monotonic()
+    retries = 0
+    hedged = False
     try:
-        response = requests.post(OPENAI_API_URL, json=payload, headers=headers, timeout=OPENAI_TIMEOUT)
-        response.raise_for_status()
-    except requests.RequestException as exc:
-        raise HTTPException(status_code=502, detail=f"Failed to reach OpenAI API: {exc}") from exc
+        for attempt in range(OPENAI_MAX_RETRIES + 1):
+            try:
+                with span("llm.request", "client", model=LLM_MODEL, attempt=attempt + 1):
+                    response, hedged = send_with_hedge(payload, headers)
+                break
+            except requests.RequestException as exc:
+                failed = exc.response
+                if failed is not None and failed.status_code not in RETRYABLE_STATUS:
+                    raise HTTPException(status_code=502, detail=f"Failed to reach OpenAI API: {exc}") from exc
+                if attempt == OPENAI_MAX_RETRIES:
+                    raise LLMUnavailableError(status_code=502, detail=f"Failed to reach OpenAI API: {exc}") from exc
+                delay = retry_after_seconds(failed)
+                if delay is None:
+                    delay = random.uniform(0, OPENAI_RETRY_BASE_SECONDS * 2**attempt)
+                delay = min(delay, OPENAI_RETRY_MAX_SECONDS)
+                retries += 1
+                count_llm_event("retries")
+                logger.warning("OpenAI request failed (%s); retry %s in %.2fs", exc, attempt + 1, delay)
+                time.sleep(delay)
 
-    try:
-        body = response.json()
-        content = body["choices"][0]["message"]["content"]
-    except (ValueError, KeyError, IndexError, TypeError) as exc:
-        raise HTTPException(status_code=502, detail="OpenAI response missing expected content") from exc
+        try:
+            body = response.json()
+            content = body["choices"][0]["message"]["content"]
+        except (ValueError, KeyError, IndexError, TypeError) as exc:
+            raise HTTPException(status_code=502, detail="OpenAI response missing expected content") from exc
+    except HTTPException:
+        record_llm_usage(None, time.monotonic() - started, retries, hedged, "error")
+        raise
+
+    usage = body.get("usage") or {}
+    record_llm_usage(usage, time.monotonic() - started, retries, hedged, "ok")
+    logger.info(
+        "LLM usage: prompt_tokens=%s cached_tokens=%s completion_tokens=%s",
+        usage.get("prompt_tokens"),
+        (usage.get("prompt_tokens_details") or {}).get("cached_tokens"),
+        usage.get("completion_tokens"),
+    )
 
     try:
         return parse_llm_json(content)
@@ -125,19 +1175,143 @@ def post_openai_json(system_prompt: str, user_prompt: str) -> Dict[str, Any]:
         raise HTTPException(status_code=502, detail=f"Invalid JSON from OpenAI: {exc}") from exc
 
 
-def call_llm_for_summary(articles: List[Dict[str, Any]]) -> Dict[str, Any]:
-    articles_json = json.dumps(articles, ensure_ascii=False)
-    system_prompt = (
-        "Eres un analista periodístico senior experto en análisis de cobertura mediática. "
-        "Recibirás un conjunto de noticias previamente clasificadas y debes generar un análisis "
-        "periodístico completo del conjunto, identificando narrativas, actores, sesgos y tendencias. "
-        "Siempre devuelve únicamente JSON válido."
-    )
-    user_prompt = f"""
-Analiza este conjunto de noticias y genera un análisis periodístico completo.
-Devuelve exclusivamente JSON con esta estructura:
+ANALYSIS_SYSTEM_PROMPT = (
+    "Eres un analista periodístico senior experto en análisis de cobertura mediática. "
+    "Recibirás un conjunto de noticias previamente clasificadas y debes generar un análisis "
+    "periodístico completo del conjunto, identificando narrativas, actores, sesgos y tendencias. "
+    "Siempre devuelve únicamente JSON válido."
+)
+
+
+def stream_openai_completion(system_prompt: str, user_prompt: str) -> Iterator[str]:
+    """Yield content deltas of a streamed chat completion; retries only happen before the first byte."""
+    if not OPENAI_API_KEY:
+        raise HTTPException(status_code=500, detail="OPENAI_API_KEY is not configured")
 
-{{
+    payload = {
+        "model": LLM_MODEL,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        "response_format": {"type": "json_object"},
+        "temperature": 0.3,
+        "stream": True,
+        "stream_options": {"include_usage": True},
+    }
+    headers = {
+        "Authorization": f"Bearer {OPENAI_API_KEY}",
+        "Content-Type": "application/json",
+    }
+    count_llm_event("calls")
+    started = time.monotonic()
+    retries = 0
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        try:
+            with span("llm.stream.connect", "client", model=LLM_MODEL, attempt=attempt + 1):
+                response = requests.post(
+                    OPENAI_API_URL, json=payload, headers=headers, timeout=OPENAI_TIMEOUT, stream=True
+                )
+                response.raise_for_status()
+            break
+        except requests.RequestException as exc:
+            failed = exc.response
+            retryable = failed is None or failed.status_code in RETRYABLE_STATUS
+            if not retryable or attempt == OPENAI_MAX_RETRIES:
+                record_llm_usage(None, time.monotonic() - started, retries, False, "error")
+                error = LLMUnavailableError if retryable else HTTPException
+                raise error(status_code=502, detail=f"Failed to reach OpenAI API: {exc}") from exc
+            delay = retry_after_seconds(failed)
+            if delay is None:
+                delay = random.uniform(0, OPENAI_RETRY_BASE_SECONDS * 2**attempt)
+            retries += 1
+            count_llm_event("retries")
+            time.sleep(min(delay, OPENAI_RETRY_MAX_SECONDS))
+
+    usage: Dict[str, Any] = {}
+    try:
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                usage = chunk.get("usage") or usage
+                for choice in chunk.get("choices") or []:
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        yield content
+    except (requests.RequestException, ValueError) as exc:
+        record_llm_usage(usage, time.monotonic() - started, retries, False, "error")
+        raise HTTPException(status_code=502, detail=f"OpenAI stream interrupted: {exc}") from exc
+    record_llm_usage(usage, time.monotonic() - started, retries, False, "ok")
+
+
+class JsonArrayItemScanner:
+    """Incremental scanner over a streamed JSON object.
+
+    ``feed`` returns every element of the watched top-level arrays that became complete with the new
+    text, so items can be forwarded before the whole document has arrived.
+    """
+
+    def __init__(self, keys: Iterable[str]):
+        self.keys = set(keys)
+        self.buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._current_key: Optional[str] = None
+        self._active_key: Optional[str] = None
+        self._item_start: Optional[int] = None
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        self.buffer += text
+        completed: List[Tuple[str, Any]] = []
+        while self._pos < len(self.buffer):
+            char = self.buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = self.buffer[self._string_start : self._pos]
+            elif char == '"':
+                self._in_string = True
+                self._string_start = self._pos + 1
+            elif char == ":" and self._depth == 1:
+                self._current_key = self._last_string
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 2 and char == "[" and self._current_key in self.keys:
+                    self._active_key = self._current_key
+                elif self._depth == 3 and self._active_key and self._item_start is None:
+                    self._item_start = self._pos
+            elif char in "}]":
+                if self._depth == 3 and self._item_start is not None:
+                    try:
+                        completed.append((self._active_key, json.loads(self.buffer[self._item_start : self._pos + 1])))
+                    except ValueError:
+                        pass
+                    self._item_start = None
+                elif self._depth == 2:
+                    self._active_key = None
+                self._depth -= 1
+            self._pos += 1
+        return completed
+
+
+ANALYSIS_SECTIONS = ("insights", "oportunidades_negocio", "riesgos_reputacionales")
+
+# Esquema de salida compartido por el análisis directo y por la reducción final del modo jerárquico
+ANALYSIS_OUTPUT_SCHEMA = """{
   "sintesis_general": "Párrafo de 200-300 palabras resumiendo qué está pasando, los hechos principales y por qué es relevante",
   "narrativa_principal": "La historia o ángulo dominante en la cobertura (1-2 frases)",
   "narrativas_alternativas": "Otros ángulos o perspectivas presentes, separados por coma",
@@ -175,23 +1349,359 @@ Devuelve exclusivamente JSON con esta estructura:
   "eventos_por_vigilar": "Próximos acontecimientos clave, fechas importantes",
   "aspectos_ignorados": "Perspectivas importantes que faltan, preguntas sin responder o null",
   "audiencia_objetivo_agregada": "A quién está dirigida la cobertura: general|especializada|academica|etc",
-  "nivel_tecnico": "basico|intermedio|avanzado|especializado"
-}}
+  "nivel_tecnico": "basico|intermedio|avanzado|especializado",
+  "insights": [{"titulo": "hallazgo clave en pocas palabras", "descripcion": "explicación de 1-2 frases basada en las noticias"}],
+  "oportunidades_negocio": [{"titulo": "oportunidad concreta", "descripcion": "por qué y cómo aprovecharla"}],
+  "riesgos_reputacionales": [{"titulo": "riesgo concreto", "descripcion": "qué lo origina y a quién afecta"}]
+}
+
+"""
 
+ANALYSIS_RULES = """
 IMPORTANTE:
 - Analiza el conjunto completo de noticias como un todo, no individualmente
 - Si un campo no aplica o no hay suficiente información, usa null
+- Devuelve entre 3 y 5 elementos en insights, oportunidades_negocio y riesgos_reputacionales
 - Sé específico y basado en evidencia de las noticias proporcionadas
 - No inventes información que no esté en las noticias
+"""
 
+# Formato "table" de encode_articles; se explica en todos los prompts que reciben noticias
+TABLE_FORMAT_NOTE = """
+Las noticias pueden llegar como tabla: `comunes` tiene los valores compartidos por todas, `columnas` los
+nombres de campo y `filas` una lista de valores por noticia en ese orden. Los campos ausentes no aplican.
+"""
+
+# Prefijos estáticos: deben ser idénticos byte a byte entre llamadas para aprovechar el prompt caching
+ANALYSIS_PROMPT_PREFIX = (
+    """
+Analiza este conjunto de noticias y genera un análisis periodístico completo.
+Devuelve exclusivamente JSON con esta estructura:
+
+"""
+    + ANALYSIS_OUTPUT_SCHEMA
+    + ANALYSIS_RULES
+    + TABLE_FORMAT_NOTE
+    + """
 Noticias a analizar (JSON con insights enriquecidos):
-{articles_json}
 """
-    return post_openai_json(system_prompt, user_prompt)
+)
+
+ANALYSIS_REDUCE_PREFIX = (
+    """
+Recibirás resúmenes parciales, cada uno de un lote distinto de noticias del mismo conjunto.
+Combínalos en un único análisis periodístico completo del conjunto. Pondera cada resumen por su
+número de noticias (`n`) y elimina duplicados entre lotes.
+Devuelve exclusivamente JSON con esta estructura:
+
+"""
+    + ANALYSIS_OUTPUT_SCHEMA
+    + ANALYSIS_RULES
+    + """
+Resúmenes parciales a combinar (JSON):
+"""
+)
+
+PARTIAL_OUTPUT_SCHEMA = """
+{
+  "resumen_parcial": "100-150 palabras con los hechos, narrativas y tono del lote",
+  "hechos_clave": ["hecho concreto con cifras o fechas si existen"],
+  "actores": ["persona u organización: papel"],
+  "temas": ["tema recurrente"],
+  "citas": ["cita textual relevante"],
+  "sentimiento": {"positivo": 0, "negativo": 0, "neutro": 0},
+  "insights": [{"titulo": "...", "descripcion": "..."}],
+  "oportunidades_negocio": [{"titulo": "...", "descripcion": "..."}],
+  "riesgos_reputacionales": [{"titulo": "...", "descripcion": "..."}]
+}
+"""
+
+PARTIAL_CHUNK_PREFIX = (
+    """
+Resume este lote de noticias (parte de un conjunto mayor) para un análisis posterior.
+Devuelve exclusivamente JSON con esta estructura, máximo 5 elementos por lista:
+"""
+    + PARTIAL_OUTPUT_SCHEMA
+    + """
+No inventes información que no esté en las noticias.
+"""
+    + TABLE_FORMAT_NOTE
+    + """
+Noticias del lote (JSON con insights enriquecidos):
+"""
+)
+
+PARTIAL_MERGE_PREFIX = (
+    """
+Combina estos resúmenes parciales (lotes de un mismo conjunto de noticias) en un único resumen parcial.
+Suma los conteos de sentimiento, elimina duplicados y conserva lo más relevante.
+Devuelve exclusivamente JSON con esta estructura, máximo 5 elementos por lista:
+"""
+    + PARTIAL_OUTPUT_SCHEMA
+    + """
+Resúmenes parciales (JSON):
+"""
+)
+
+ANALYSIS_REVISE_PREFIX = (
+    """
+Recibirás un análisis periodístico previo de un conjunto de noticias y las noticias nuevas publicadas
+después. Actualiza el análisis para que cubra el conjunto completo: conserva lo que sigue vigente,
+corrige lo que las noticias nuevas contradicen y añade narrativas, actores, datos y riesgos nuevos.
+Devuelve exclusivamente JSON con esta estructura:
+
+"""
+    + ANALYSIS_OUTPUT_SCHEMA
+    + ANALYSIS_RULES
+    + TABLE_FORMAT_NOTE
+    + """
+Análisis previo y noticias nuevas (JSON con `analisis_previo` y `noticias_nuevas`):
+"""
+)
+
+# Versión de los prompts de análisis: invalida los resúmenes intermedios cacheados cuando cambian
+ANALYSIS_PROMPT_VERSION = hashlib.sha256(
+    "".join(
+        (
+            ANALYSIS_SYSTEM_PROMPT,
+            ANALYSIS_PROMPT_PREFIX,
+            ANALYSIS_REDUCE_PREFIX,
+            ANALYSIS_REVISE_PREFIX,
+            PARTIAL_CHUNK_PREFIX,
+            PARTIAL_MERGE_PREFIX,
+            FIELD_PROFILE,
+            PAYLOAD_FORMAT,
+        )
+    ).encode("utf-8")
+).hexdigest()[:12]
+
+
+def build_summary_prompt(articles: List[Dict[str, Any]]) -> str:
+    user_prompt = f"{ANALYSIS_PROMPT_PREFIX}{encode_articles(articles)}\n"
+    logger.info(
+        "Analysis prompt ~%s input tokens for %s insights",
+        estimate_tokens(ANALYSIS_SYSTEM_PROMPT) + estimate_tokens(user_prompt),
+        len(articles),
+    )
+    return user_prompt
+
+
+def call_llm_for_revision(previous: Dict[str, Any], articles: List[Dict[str, Any]]) -> Dict[str, Any]:
+    payload = (
+        f'{{"analisis_previo":{json.dumps(previous, ensure_ascii=False, separators=(",", ":"))},'
+        f'"noticias_nuevas":{encode_articles(articles)}}}'
+    )
+    user_prompt = f"{ANALYSIS_REVISE_PREFIX}{payload}\n"
+    logger.info(
+        "Incremental analysis prompt ~%s input tokens for %s new insights",
+        estimate_tokens(ANALYSIS_SYSTEM_PROMPT) + estimate_tokens(user_prompt),
+        len(articles),
+    )
+    return post_openai_json(ANALYSIS_SYSTEM_PROMPT, user_prompt)
+
+
+def is_chunk_anchor(insight_id: int) -> bool:
+    return zlib.crc32(str(insight_id).encode("ascii")) % max(CHUNK_ANCHOR_EVERY, 1) == 0
+
+
+def chunk_articles(
+    ids: List[int], articles: List[Dict[str, Any]], budget: int
+) -> List[Tuple[List[int], List[Dict[str, Any]]]]:
+    """Split id-ordered articles into chunks under ``budget`` tokens with boundaries anchored to ids.
+
+    A chunk closes after an anchor id, or earlier when the next article would overflow the budget.
+    Since anchors do not depend on where the window starts, adding new insights or dropping the
+    oldest ones only changes the first and last chunks, and the summaries of the rest are reused.
+    """
+    chunks: List[Tuple[List[int], List[Dict[str, Any]]]] = []
+    current_ids: List[int] = []
+    current: List[Dict[str, Any]] = []
+    used = 0
+    for insight_id, article in zip(ids, articles):
+        cost = estimate_tokens(encode_articles([article], "json"))
+        if current and used + cost > budget:
+            chunks.append((current_ids, current))
+            current_ids, current, used = [], [], 0
+        current_ids.append(insight_id)
+        current.append(article)
+        used += cost
+        if is_chunk_anchor(insight_id):
+            chunks.append((current_ids, current))
+            current_ids, current, used = [], [], 0
+    if current:
+        chunks.append((current_ids, current))
+    return chunks
+
+
+def partial_cache_key(level: int, parts: List[str]) -> str:
+    raw = json.dumps([ANALYSIS_PROMPT_VERSION, LLM_MODEL, level, parts])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def cached_partial(key: str) -> Optional[Dict[str, Any]]:
+    row = database.reader().execute("SELECT summary_json FROM analysis_partials WHERE cache_key = ?", (key,)).fetchone()
+    return json.loads(row["summary_json"]) if row else None
+
+
+def store_partial(key: str, level: int, summary: Dict[str, Any]) -> None:
+    with database.write() as db:
+        db.execute(
+            """
+            INSERT INTO analysis_partials (cache_key, level, size, summary_json, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (cache_key) DO UPDATE SET
+                level = excluded.level,
+                size = excluded.size,
+                summary_json = excluded.summary_json,
+                created_at = excluded.created_at
+            """,
+            (key, level, summary.get("n", 0), json.dumps(summary, ensure_ascii=False), datetime.utcnow().isoformat()),
+        )
+
+
+@traced()
+def summarize_chunk(chunk: Tuple[List[int], List[Dict[str, Any]]]) -> Tuple[str, Dict[str, Any]]:
+    ids, articles = chunk
+    key = partial_cache_key(0, [str(insight_id) for insight_id in ids])
+    summary = cached_partial(key)
+    if summary is None:
+        user_prompt = f"{PARTIAL_CHUNK_PREFIX}{encode_articles(articles)}\n"
+        summary = post_openai_json(ANALYSIS_SYSTEM_PROMPT, user_prompt)
+        summary["n"] = len(articles)
+        store_partial(key, 0, summary)
+    return key, summary
+
 
+@traced()
+def merge_partials(group: Tuple[int, List[Tuple[str, Dict[str, Any]]]]) -> Tuple[str, Dict[str, Any]]:
+    level, partials = group
+    key = partial_cache_key(level, [child_key for child_key, _ in partials])
+    summary = cached_partial(key)
+    if summary is None:
+        payload = json.dumps([partial for _, partial in partials], ensure_ascii=False)
+        summary = post_openai_json(ANALYSIS_SYSTEM_PROMPT, f"{PARTIAL_MERGE_PREFIX}{payload}\n")
+        summary["n"] = sum(partial.get("n", 0) for _, partial in partials)
+        store_partial(key, level, summary)
+    return key, summary
 
-conn = get_connection()
-app = FastAPI(title="Insights Aggregator", version="0.2.0")
+
+def run_bounded(func: Callable[[Any], Any], items: List[Any]) -> List[Any]:
+    if len(items) == 1:
+        return [func(items[0])]
+    with ThreadPoolExecutor(max_workers=MAP_CONCURRENCY, thread_name_prefix="analysis-map") as pool:
+        # copy_context: el ledger necesita el endpoint/término de la petición en cada hilo
+        futures = [pool.submit(copy_context().run, func, item) for item in items]
+        return [future.result() for future in futures]
+
+
+def build_hierarchical_prompt(ids: List[int], articles: List[Dict[str, Any]]) -> str:
+    """Map-reduce: summarise token-budgeted chunks in parallel and merge partials by fan-in.
+
+    Returns the prompt of the final reduce so the caller can send it blocking or streamed.
+    """
+    chunks = chunk_articles(ids, articles, CHUNK_TOKEN_BUDGET)
+    partials = run_bounded(summarize_chunk, chunks)
+    level = 1
+    while len(partials) > REDUCE_FANIN:
+        groups = [(level, partials[i : i + REDUCE_FANIN]) for i in range(0, len(partials), REDUCE_FANIN)]
+        partials = run_bounded(merge_partials, groups)
+        level += 1
+    logger.info(
+        "Hierarchical analysis: %s insights, %s chunks, %s merge levels", len(articles), len(chunks), level - 1
+    )
+    payload = json.dumps([partial for _, partial in partials], ensure_ascii=False)
+    return f"{ANALYSIS_REDUCE_PREFIX}{payload}\n"
+
+
+class AdmissionGate:
+    """Concurrency limit with a bounded FIFO queue for one LLM-bound endpoint.
+
+    Waiting happens on the event loop, so queued requests do not hold threadpool slots.
+    """
+
+    def __init__(self, route: str, concurrency: int, queue_size: int) -> None:
+        self.route = route
+        self.concurrency = max(concurrency, 1)
+        self.queue_size = max(queue_size, 0)
+        self.in_flight = 0
+        self.waiting = 0
+        self.avg_seconds: Optional[float] = None
+        self.stats = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0, "max_waiting": 0}
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def acquire(self) -> bool:
+        if self._semaphore.locked():
+            if self.waiting >= self.queue_size:
+                self.stats["rejected_queue_full"] += 1
+                return False
+            self.waiting += 1
+            self.stats["queued"] += 1
+            self.stats["max_waiting"] = max(self.stats["max_waiting"], self.waiting)
+            try:
+                with span("admission.wait", route=self.route, waiting=self.waiting):
+                    await asyncio.wait_for(self._semaphore.acquire(), ADMISSION_QUEUE_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                self.stats["rejected_timeout"] += 1
+                return False
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        self.stats["admitted"] += 1
+        return True
+
+    def release(self, seconds: float) -> None:
+        self.in_flight -= 1
+        self.avg_seconds = seconds if self.avg_seconds is None else 0.8 * self.avg_seconds + 0.2 * seconds
+        self._semaphore.release()
+
+    def retry_after(self) -> int:
+        """Seconds until the queue ahead should have drained, from the recent average service time."""
+        per_request = self.avg_seconds if self.avg_seconds is not None else ADMISSION_QUEUE_TIMEOUT_SECONDS
+        estimate = per_request * (self.waiting + 1) / self.concurrency
+        return max(1, min(math.ceil(estimate), ADMISSION_RETRY_AFTER_MAX_SECONDS))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "avg_seconds": round(self.avg_seconds, 3) if self.avg_seconds is not None else None,
+            **self.stats,
+        }
+
+
+if POSTGRES_URL:
+    database = PostgresDatabase(POSTGRES_URL, setup=ensure_postgres_analysis_schema)
+else:
+    database = Database(DB_PATH, setup=ensure_analysis_schema)
+if BACKGROUND_WORKERS_ENABLED:
+    threading.Thread(target=llm_ledger_flush_loop, name="llm-ledger", daemon=True).start()
+    threading.Thread(target=term_requests_flush_loop, name="term-requests", daemon=True).start()
+atexit.register(flush_llm_ledger)
+atexit.register(flush_term_requests)
+if TRACING_ENABLED:
+    if BACKGROUND_WORKERS_ENABLED:
+        threading.Thread(target=trace_flush_loop, name="trace-flush", daemon=True).start()
+    atexit.register(flush_traces)
+admission_gates = {
+    route: AdmissionGate(route, int(limits.get("concurrency", 1)), int(limits.get("queue", 0)))
+    for route, limits in ADMISSION_LIMITS.items()
+}
+
+
+@asynccontextmanager
+async def reserve_read_threads(_: FastAPI) -> AsyncIterator[None]:
+    # Los endpoints del LLM nunca ocupan más de la suma de sus límites; el resto del threadpool queda para lecturas
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    reserved = sum(gate.concurrency for gate in admission_gates.values()) + ADMISSION_READ_THREADS
+    limiter.total_tokens = max(limiter.total_tokens, reserved)
+    yield
+
+
+app = FastAPI(title="Insights Aggregator", version="0.2.0", lifespan=reserve_read_threads)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -201,6 +1711,86 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def admission_control(request: Request, call_next: Callable) -> Response:
+    gate = admission_gates.get(request.url.path)
+    if gate is None or request.method == "OPTIONS":
+        return await call_next(request)
+    if not await gate.acquire():
+        return JSONResponse(
+            status_code=503,
+            content={"detail": f"{request.url.path} is overloaded, retry later"},
+            headers={"Retry-After": str(gate.retry_after())},
+        )
+    started = time.monotonic()
+    released = False
+
+    def release() -> None:
+        nonlocal released
+        if not released:
+            released = True
+            gate.release(time.monotonic() - started)
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        release()
+        raise
+    if not response.headers.get("content-type", "").startswith("text/event-stream"):
+        release()
+        return response
+    # SSE: la llamada al LLM sigue mientras se emite el cuerpo, así que el cupo se libera al terminar
+    body = response.body_iterator
+
+    async def release_after_body() -> AsyncIterator[bytes]:
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            release()
+
+    response.body_iterator = release_after_body()
+    return response
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next: Callable) -> Response:
+    if not TRACING_ENABLED:
+        return await call_next(request)
+    root = start_trace(f"{request.method} {request.url.path}", request.headers.get("traceparent"))
+    root.attributes.update({"http.method": request.method, "http.target": str(request.url.path)})
+    if request.url.query:
+        root.attributes["http.query"] = request.url.query[:300]
+    token = _current_span.set(root)
+    try:
+        response = await call_next(request)
+    except Exception as exc:
+        root.fail(exc)
+        root.finish()
+        raise
+    finally:
+        _current_span.reset(token)
+    root.attributes["http.status_code"] = response.status_code
+    if response.status_code >= 500:
+        root.status = "error"
+    body = getattr(response, "body_iterator", None)
+    if body is None:
+        root.finish()
+    else:
+        # Respuestas en streaming (SSE/NDJSON): el span raíz cubre hasta el último byte enviado
+        async def finish_after_body() -> AsyncIterator[bytes]:
+            try:
+                async for chunk in body:
+                    yield chunk
+            finally:
+                root.finish()
+
+        response.body_iterator = finish_after_body()
+    # El cliente puede buscar la traza de una petición lenta por este id
+    response.headers["traceparent"] = f"00-{root.trace_id}-{root.span_id}-{'01' if root.sampled else '00'}"
+    return response
+
+
 class SummaryItem(BaseModel):
     titulo: Optional[str]
     descripcion: Optional[str]
@@ -219,6 +1809,10 @@ class AnalysisRequest(BaseModel):
     term: Optional[str] = None
     limit: Optional[int] = 10
     insight_ids: Optional[List[int]] = None
+    query: Optional[str] = None
+    hierarchical: Optional[bool] = None
+    force: bool = False
+    incremental: bool = False
 
 
 class AnalysisHistoryItem(BaseModel):
@@ -232,17 +1826,75 @@ class AnalysisHistoryItem(BaseModel):
     created_at: str
 
 
+class AnalysisSummary(BaseModel):
+    id: int
+    term: Optional[str]
+    count: int
+    mode: Optional[str] = None
+    llm_model: Optional[str] = None
+    insights_count: int
+    opportunities_count: int
+    risks_count: int
+    headline_titles: List[str]
+    created_at: str
+
+
+class AnalysisHistoryPage(BaseModel):
+    items: List[AnalysisSummary]
+    next_cursor: Optional[int] = None
+
+
+class SchedulerStatus(BaseModel):
+    enabled: bool
+    hours_utc: str
+    in_window: bool
+    hot_terms: List[str]
+    tokens_used_today: int
+    daily_token_budget: int
+
+
+class PayloadEncodingStats(BaseModel):
+    profile: str
+    format: str
+    tokens: int
+    tokens_per_insight: float
+
+
+class PayloadStatsResponse(BaseModel):
+    term: Optional[str]
+    count: int
+    active_profile: str
+    active_format: str
+    items: List[PayloadEncodingStats]
+
+
+class AnalysisLineageItem(BaseModel):
+    id: int
+    mode: Optional[str] = None
+    parent_id: Optional[int] = None
+    delta_depth: int = 0
+    count: int
+    created_at: str
+
+
 @app.get("/health")
 def health() -> Dict[str, Any]:
-    return {"status": "ok", "db_path": DB_PATH}
+    return {
+        "status": "ok",
+        "db_backend": database.dialect,
+        "db_path": database.path,
+        "llm": llm_stats_snapshot(),
+        "admission": {route: gate.snapshot() for route, gate in admission_gates.items()},
+    }
 
 
+@traced()
 def fetch_insight_rows(
     term: Optional[str], limit: int, insight_ids: Optional[List[int]]
 ) -> List[sqlite3.Row]:
     if insight_ids:
         placeholders = ",".join("?" for _ in insight_ids)
-        rows = conn.execute(
+        rows = database.reader().execute(
             f"SELECT * FROM insights WHERE id IN ({placeholders})",
             insight_ids,
         ).fetchall()
@@ -258,15 +1910,43 @@ def fetch_insight_rows(
         params.append(term)
     query += " ORDER BY id DESC LIMIT ?"
     params.append(limit)
-    rows = conn.execute(query, params).fetchall()
+    rows = database.reader().execute(query, params).fetchall()
     if not rows:
         raise HTTPException(status_code=404, detail="No insights stored for given criteria")
     return rows
 
 
-def execute_analysis(term: Optional[str], rows: List[sqlite3.Row]) -> Dict[str, Any]:
+@traced("insights.search", "client")
+def search_insight_ids(query: str, term: Optional[str], limit: int) -> List[int]:
+    params: Dict[str, Any] = {"q": query, "k": min(limit, INSIGHTS_SEARCH_MAX_K)}
+    if term:
+        params["term"] = term
+    try:
+        response = requests.get(
+            f"{INSIGHTS_SERVICE_URL}/insights/search", params=params, headers=trace_headers(), timeout=30
+        )
+        response.raise_for_status()
+    except requests.RequestException as exc:
+        raise HTTPException(status_code=502, detail=f"Failed to reach insights service: {exc}") from exc
+    ids = [item["insight"]["id"] for item in response.json().get("items", [])]
+    if not ids:
+        raise HTTPException(status_code=404, detail="No insights match the given query")
+    return ids
+
+
+@traced()
+def prepare_analysis_prompt(rows: List[sqlite3.Row], hierarchical: Optional[bool] = None) -> str:
+    # Orden ascendente por id: los lotes antiguos no cambian al llegar insights nuevos y su resumen se reutiliza
+    rows = sorted(rows, key=lambda row: row["id"])
     articles = format_articles(rows)
-    llm_result = call_llm_for_summary(articles)
+    if hierarchical is None:
+        hierarchical = len(articles) > MAX_LIMIT or estimate_tokens(encode_articles(articles)) > CHUNK_TOKEN_BUDGET
+    if hierarchical:
+        return build_hierarchical_prompt([row["id"] for row in rows], articles)
+    return build_summary_prompt(articles)
+
+
+def validate_analysis_result(llm_result: Dict[str, Any]) -> Dict[str, Any]:
     insights = llm_result.get("insights")
     oportunidades = llm_result.get("oportunidades_negocio")
     riesgos = llm_result.get("riesgos_reputacionales")
@@ -274,35 +1954,282 @@ def execute_analysis(term: Optional[str], rows: List[sqlite3.Row]) -> Dict[str,
     if not isinstance(insights, list) or not isinstance(oportunidades, list) or not isinstance(riesgos, list):
         raise HTTPException(status_code=502, detail="LLM JSON missing required arrays")
 
-    return {
-        "insights": insights,
-        "oportunidades_negocio": oportunidades,
-        "riesgos_reputacionales": riesgos,
-    }
+    return llm_result
+
 
+@traced()
+def execute_analysis(
+    term: Optional[str], rows: List[sqlite3.Row], hierarchical: Optional[bool] = None
+) -> Dict[str, Any]:
+    user_prompt = prepare_analysis_prompt(rows, hierarchical)
+    return validate_analysis_result(post_openai_json(ANALYSIS_SYSTEM_PROMPT, user_prompt))
 
-def persist_analysis(term: Optional[str], insight_ids: List[int], result: Dict[str, Any], count: int) -> int:
+
+def analysis_cache_key(insight_ids: List[int]) -> str:
+    raw = json.dumps([sorted(insight_ids), LLM_MODEL, ANALYSIS_PROMPT_VERSION])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def cached_analysis(cache_key: str) -> Optional[sqlite3.Row]:
+    return database.reader().execute(
+        "SELECT id, result_json FROM analysis_results WHERE cache_key = ? ORDER BY id DESC LIMIT 1",
+        (cache_key,),
+    ).fetchone()
+
+
+@traced()
+def persist_analysis(
+    term: Optional[str],
+    insight_ids: List[int],
+    result: Dict[str, Any],
+    count: int,
+    cache_key: Optional[str] = None,
+    mode: str = "full",
+    parent_id: Optional[int] = None,
+    delta_depth: int = 0,
+    selection: Optional[str] = None,
+    window_size: Optional[int] = None,
+) -> int:
     now = datetime.utcnow().isoformat()
-    cursor = conn.execute(
-        """
-        INSERT INTO analysis_results (term, insight_ids, result_json, count, created_at)
-        VALUES (?, ?, ?, ?, ?)
+    with database.write() as db:
+        cursor = db.execute(
+            """
+            INSERT INTO analysis_results (
+                term, insight_ids, result_json, count, cache_key, llm_model, prompt_version,
+                mode, parent_id, delta_depth, max_insight_id, insights_count, opportunities_count,
+                risks_count, headline_titles, selection, window_size, created_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            RETURNING id
+            """,
+            (
+                term,
+                # Postgres guarda los ids como BIGINT[] (esquema serverless); SQLite como JSON
+                insight_ids if database.dialect == "postgres" else json.dumps(insight_ids),
+                json.dumps(result, ensure_ascii=False),
+                count,
+                cache_key,
+                LLM_MODEL,
+                ANALYSIS_PROMPT_VERSION,
+                mode,
+                parent_id,
+                delta_depth,
+                max(insight_ids) if insight_ids else None,
+                *analysis_summary_values(result),
+                selection,
+                window_size,
+                now,
+            ),
+        )
+        return cursor.fetchone()[0]
+
+
+def latest_term_analysis(term: str) -> Optional[sqlite3.Row]:
+    """Newest analysis of the term's recent-insights window made with the current model and prompt.
+
+    Analyses of hand-picked ids or search results (including every ``/pipeline`` run) cover a subset
+    and never serve as the term's latest analysis.
+    """
+    placeholders = ",".join("?" for _ in TERM_WINDOW_MODES)
+    return database.reader().execute(
+        f"""
+        SELECT * FROM analysis_results
+        WHERE term = ? AND selection = 'window' AND mode IN ({placeholders})
+          AND llm_model = ? AND prompt_version = ?
+        ORDER BY id DESC LIMIT 1
         """,
-        (
+        (term, *TERM_WINDOW_MODES, LLM_MODEL, ANALYSIS_PROMPT_VERSION),
+    ).fetchone()
+
+
+def fetch_insights_since(term: str, after_id: int, limit: int) -> List[sqlite3.Row]:
+    return database.reader().execute(
+        "SELECT * FROM insights WHERE term = ? AND id > ? ORDER BY id LIMIT ?",
+        (term, after_id, limit),
+    ).fetchall()
+
+
+def plan_incremental_analysis(term: str, limit: int, previous: sqlite3.Row) -> Tuple[List[sqlite3.Row], bool]:
+    """Insights stored after ``previous`` (at most ``limit``) and whether they call for a full rebuild."""
+    previous_ids: List[int] = json.loads(previous["insight_ids"])
+    after_id = previous["max_insight_id"] or max(previous_ids, default=0)
+    new_rows = fetch_insights_since(term, after_id, max(limit, 1))
+    if previous["window_size"] != limit:
+        # Otra ventana: sus ids no son los `limit` más recientes, hay que partir de cero
+        return new_rows, True
+    if not new_rows:
+        return new_rows, False
+    depth = (previous["delta_depth"] or 0) + 1
+    rebuild = (
+        depth > INCREMENTAL_MAX_DELTAS
+        # La ventana entera es nueva: revisar no aporta nada frente a reconstruir
+        or len(new_rows) >= limit
+        or estimate_tokens(encode_articles(format_articles(new_rows))) > CHUNK_TOKEN_BUDGET
+    )
+    return new_rows, rebuild
+
+
+def run_incremental_analysis(term: str, limit: int, hierarchical: Optional[bool]) -> "AggregatedResponse":
+    """Revise the term's latest analysis with only the insights stored after it; rebuild every N deltas.
+
+    The analysis covers a sliding window of the newest ``limit`` insights: each revision drops the oldest ids.
+    """
+    limit = max(limit, 1)
+    previous = latest_term_analysis(term)
+    rebuild = previous is None
+    if previous is not None:
+        new_rows, rebuild = plan_incremental_analysis(term, limit, previous)
+        previous_result = json.loads(previous["result_json"])
+        if not new_rows and not rebuild:
+            previous_ids = json.loads(previous["insight_ids"])
+            return build_response(term, previous_ids, previous_result, analysis_id=previous["id"])
+    if rebuild:
+        # Reconstrucción completa: evita que las revisiones encadenadas deriven del contenido real
+        rows = fetch_insight_rows(term, limit, None)
+        ids = [row["id"] for row in rows]
+        result = execute_analysis(term, rows, hierarchical)
+        stored_id = persist_analysis(
             term,
-            json.dumps(insight_ids),
-            json.dumps(result, ensure_ascii=False),
-            count,
-            now,
-        ),
+            ids,
+            result,
+            len(rows),
+            analysis_cache_key(ids),
+            mode="full" if previous is None else "rebuild",
+            parent_id=previous["id"] if previous is not None else None,
+            selection="window",
+            window_size=limit,
+        )
+        return build_response(term, rows, result, analysis_id=stored_id)
+
+    ids = sorted(set(json.loads(previous["insight_ids"])) | {row["id"] for row in new_rows}, reverse=True)[:limit]
+    depth = (previous["delta_depth"] or 0) + 1
+    result = validate_analysis_result(call_llm_for_revision(previous_result, format_articles(new_rows)))
+    stored_id = persist_analysis(
+        term,
+        ids,
+        result,
+        len(ids),
+        mode="incremental",
+        parent_id=previous["id"],
+        delta_depth=depth,
+        selection="window",
+        window_size=limit,
     )
-    conn.commit()
-    return cursor.lastrowid
+    return build_response(term, ids, result, analysis_id=stored_id)
+
+
+def hot_terms() -> List[str]:
+    flush_term_requests()
+    since = (datetime.utcnow() - timedelta(days=HOT_TERMS_DAYS)).date().isoformat()
+    rows = database.reader().execute(
+        """
+        SELECT term, SUM(requests) AS total FROM analysis_term_requests
+        WHERE day >= ?
+        GROUP BY term
+        ORDER BY total DESC
+        LIMIT ?
+        """,
+        (since, HOT_TERMS_TOP),
+    ).fetchall()
+    # Los términos configurados van primero; dict.fromkeys quita duplicados conservando el orden
+    return list(dict.fromkeys(HOT_TERMS + [row["term"] for row in rows]))
+
+
+def in_scheduler_window(now: datetime) -> bool:
+    if not SCHEDULER_HOURS.strip():
+        return True
+    start, end = (int(part) for part in SCHEDULER_HOURS.split("-", 1))
+    if start <= end:
+        return start <= now.hour < end
+    return now.hour >= start or now.hour < end
+
+
+def acquire_scheduler_lease(ttl: float) -> bool:
+    """Only one process (of any service replica or uvicorn worker) precomputes per interval."""
+    now = time.time()
+    with database.write() as db:
+        # Un solo upsert condicional: atómico también entre réplicas que no comparten el lock de SQLite
+        cursor = db.execute(
+            """
+            INSERT INTO analysis_scheduler_lease (name, owner, expires_at) VALUES ('analysis', ?, ?)
+            ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE analysis_scheduler_lease.owner = excluded.owner OR analysis_scheduler_lease.expires_at <= ?
+            """,
+            (SCHEDULER_OWNER, now + ttl, now),
+        )
+        return cursor.rowcount == 1
+
+
+def scheduler_tokens_today() -> int:
+    flush_llm_ledger()
+    row = database.reader().execute(
+        """
+        SELECT COALESCE(SUM(COALESCE(prompt_tokens, 0) + COALESCE(completion_tokens, 0)), 0) AS tokens
+        FROM llm_usage
+        WHERE created_at >= ? AND endpoint = 'scheduler'
+        """,
+        (datetime.utcnow().date().isoformat(),),
+    ).fetchone()
+    return row["tokens"]
+
+
+def newest_insight_id(term: str) -> Optional[int]:
+    return database.reader().execute("SELECT MAX(id) FROM insights WHERE term = ?", (term,)).fetchone()[0]
+
+
+def run_scheduled_analyses(now: Optional[datetime] = None) -> List[str]:
+    """Refresh the latest analysis of every hot term with new insights while the token budget lasts."""
+    if not in_scheduler_window(now or datetime.utcnow()):
+        return []
+    if not acquire_scheduler_lease(SCHEDULER_INTERVAL_SECONDS * 2):
+        return []
+    refreshed: List[str] = []
+    remaining = SCHEDULER_DAILY_TOKEN_BUDGET - scheduler_tokens_today()
+    for term in hot_terms():
+        newest = newest_insight_id(term)
+        previous = latest_term_analysis(term)
+        if newest is None or (previous is not None and (previous["max_insight_id"] or 0) >= newest):
+            continue
+        # Coste aproximado: el prompt que se enviaría más la salida típica del análisis. Se aplica la misma
+        # regla que run_incremental_analysis: una reconstrucción reenvía toda la ventana, no sólo lo nuevo
+        estimate = SCHEDULER_OUTPUT_TOKENS
+        if previous is None:
+            pending, rebuild = [], True
+        else:
+            pending, rebuild = plan_incremental_analysis(term, SCHEDULER_LIMIT, previous)
+            if not rebuild:
+                estimate += estimate_tokens(previous["result_json"])
+        if rebuild:
+            pending = fetch_insight_rows(term, SCHEDULER_LIMIT, None)
+        estimate += estimate_tokens(encode_articles(format_articles(pending)))
+        if estimate > remaining:
+            logger.info("Scheduled analysis of %r skipped: ~%s tokens left of the daily budget", term, remaining)
+            continue
+        llm_call_context.set({"endpoint": "scheduler", "term": term})
+        try:
+            run_incremental_analysis(term, SCHEDULER_LIMIT, None)
+        except HTTPException as exc:
+            logger.warning("Scheduled analysis of %r failed: %s", term, exc.detail)
+            continue
+        refreshed.append(term)
+        remaining = SCHEDULER_DAILY_TOKEN_BUDGET - scheduler_tokens_today()
+    if refreshed:
+        logger.info("Precomputed analyses for %s", ", ".join(refreshed))
+    return refreshed
+
+
+def analysis_scheduler_loop() -> None:
+    while True:
+        time.sleep(SCHEDULER_INTERVAL_SECONDS)
+        try:
+            run_scheduled_analyses()
+        except Exception:
+            logger.exception("Scheduled analysis tick failed")
 
 
 def build_response(
     term: Optional[str],
-    rows: List[sqlite3.Row],
+    rows: List[Any],
     result: Dict[str, Any],
     analysis_id: Optional[int] = None,
 ) -> AggregatedResponse:
@@ -319,62 +2246,270 @@ def build_response(
 @app.get("/analysis", response_model=AggregatedResponse)
 def analyze(
     term: Optional[str] = Query(None, min_length=1, max_length=200),
-    limit: int = Query(10, ge=2, le=MAX_LIMIT),
+    limit: int = Query(10, ge=2, le=HIERARCHICAL_MAX_LIMIT),
+    query: Optional[str] = Query(None, min_length=1, max_length=500),
+    hierarchical: Optional[bool] = Query(None),
+    force: bool = Query(False, description="Ignore a stored analysis of the same insight set"),
 ) -> AggregatedResponse:
-    rows = fetch_insight_rows(term, limit, None)
-    result = execute_analysis(term, rows)
+    llm_call_context.set({"endpoint": "/analysis", "term": term})
+    note_term_request(term)
+    insight_ids = search_insight_ids(query, term, limit) if query else None
+    rows = fetch_insight_rows(term, limit, insight_ids)
+    cached = None if force else cached_analysis(analysis_cache_key([row["id"] for row in rows]))
+    if cached:
+        return build_response(term, rows, json.loads(cached["result_json"]), analysis_id=cached["id"])
+    result = execute_analysis(term, rows, hierarchical)
     return build_response(term, rows, result)
 
 
-@app.post("/analysis/run", response_model=AggregatedResponse)
-def run_persistent_analysis(request: AnalysisRequest) -> AggregatedResponse:
-    limit = min(request.limit or 10, MAX_LIMIT)
+def select_analysis_rows(
+    request: AnalysisRequest, limit: int
+) -> Tuple[List[sqlite3.Row], Optional[str], str]:
+    """Rows to analyze, the term they belong to and the selection kind stored with the result."""
     insight_ids = request.insight_ids
+    selection = "ids"
+    if not insight_ids and request.query:
+        insight_ids = search_insight_ids(request.query, request.term, limit)
+        selection = "query"
     if insight_ids:
-        if len(insight_ids) > MAX_LIMIT:
-            raise HTTPException(status_code=400, detail=f"A maximum of {MAX_LIMIT} insights can be analyzed at once")
+        if len(insight_ids) > HIERARCHICAL_MAX_LIMIT:
+            raise HTTPException(
+                status_code=400,
+                detail=f"A maximum of {HIERARCHICAL_MAX_LIMIT} insights can be analyzed at once",
+            )
         rows = fetch_insight_rows(None, limit, insight_ids)
-        inferred_term = request.term or (rows[0]["term"] if rows else None)
-    else:
-        rows = fetch_insight_rows(request.term, limit, None)
-        inferred_term = request.term
-    result = execute_analysis(inferred_term, rows)
+        return rows, request.term or (rows[0]["term"] if rows else None), selection
+    return fetch_insight_rows(request.term, limit, None), request.term, "window"
+
+
+@app.post("/analysis/run", response_model=AggregatedResponse)
+def run_persistent_analysis(request: AnalysisRequest) -> AggregatedResponse:
+    limit = min(request.limit or 10, HIERARCHICAL_MAX_LIMIT)
+    if request.incremental:
+        if not request.term or request.insight_ids or request.query:
+            raise HTTPException(status_code=400, detail="Incremental analysis needs a term and no insight_ids/query")
+        llm_call_context.set({"endpoint": "/analysis/run", "term": request.term})
+        note_term_request(request.term)
+        return run_incremental_analysis(request.term, limit, request.hierarchical)
+    rows, inferred_term, selection = select_analysis_rows(request, limit)
+    llm_call_context.set({"endpoint": "/analysis/run", "term": inferred_term})
+    note_term_request(inferred_term)
+    cache_key = analysis_cache_key([row["id"] for row in rows])
+    cached = None if request.force else cached_analysis(cache_key)
+    if cached:
+        logger.info("Analysis cache hit for %s insights (analysis %s)", len(rows), cached["id"])
+        return build_response(inferred_term, rows, json.loads(cached["result_json"]), analysis_id=cached["id"])
+    result = execute_analysis(inferred_term, rows, request.hierarchical)
     stored_id = persist_analysis(
         inferred_term,
         [row["id"] for row in rows],
         result,
         len(rows),
+        cache_key,
+        selection=selection,
+        window_size=limit if selection == "window" else None,
     )
     return build_response(inferred_term, rows, result, analysis_id=stored_id)
 
 
-@app.get("/analysis/history", response_model=List[AnalysisHistoryItem])
-def analysis_history(limit: int = Query(20, ge=1, le=100)) -> List[AnalysisHistoryItem]:
-    rows = conn.execute(
-        "SELECT * FROM analysis_results ORDER BY id DESC LIMIT ?",
-        (limit,),
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def iterate_in_context(context: Context, iterator: Iterator[str]) -> Iterator[str]:
+    """Advance ``iterator`` inside ``context`` so context variables set by the endpoint reach every step."""
+    while True:
+        try:
+            yield context.run(next, iterator)
+        except StopIteration:
+            return
+
+
+@app.post("/analysis/run/stream")
+def run_streaming_analysis(request: AnalysisRequest) -> StreamingResponse:
+    """Same as ``/analysis/run`` but streams each finished insight/opportunity/risk as an SSE ``item`` event.
+
+    Events: ``meta`` (selection), ``item`` (``section`` + ``item``), ``done`` (the stored response)
+    and ``error``. Incremental runs are not streamed.
+    """
+    if request.incremental:
+        raise HTTPException(status_code=400, detail="Incremental analysis cannot be streamed")
+    limit = min(request.limit or 10, HIERARCHICAL_MAX_LIMIT)
+    rows, inferred_term, selection = select_analysis_rows(request, limit)
+    note_term_request(inferred_term)
+    insight_ids = [row["id"] for row in rows]
+    cache_key = analysis_cache_key(insight_ids)
+    cached = None if request.force else cached_analysis(cache_key)
+    # Starlette avanza el generador en copias del contexto: se fija aquí y se reutiliza en cada next()
+    llm_call_context.set({"endpoint": "/analysis/run/stream", "term": inferred_term})
+    context = copy_context()
+
+    def events() -> Iterator[str]:
+        yield sse_event("meta", {"term": inferred_term, "count": len(rows), "cached": cached is not None})
+        try:
+            if cached:
+                result = json.loads(cached["result_json"])
+                for section in ANALYSIS_SECTIONS:
+                    for item in result.get(section) or []:
+                        yield sse_event("item", {"section": section, "item": item})
+                response = build_response(inferred_term, rows, result, analysis_id=cached["id"])
+                yield sse_event("done", response.model_dump())
+                return
+            user_prompt = prepare_analysis_prompt(rows, request.hierarchical)
+            scanner = JsonArrayItemScanner(ANALYSIS_SECTIONS)
+            for delta in stream_openai_completion(ANALYSIS_SYSTEM_PROMPT, user_prompt):
+                for section, item in scanner.feed(delta):
+                    yield sse_event("item", {"section": section, "item": item})
+            try:
+                result = validate_analysis_result(parse_llm_json(scanner.buffer))
+            except (ValueError, json.JSONDecodeError) as exc:
+                raise HTTPException(status_code=502, detail=f"Invalid JSON from OpenAI: {exc}") from exc
+            stored_id = persist_analysis(
+                inferred_term,
+                insight_ids,
+                result,
+                len(rows),
+                cache_key,
+                selection=selection,
+                window_size=limit if selection == "window" else None,
+            )
+            yield sse_event("done", build_response(inferred_term, rows, result, analysis_id=stored_id).model_dump())
+        except HTTPException as exc:
+            yield sse_event("error", {"status_code": exc.status_code, "detail": exc.detail})
+
+    return StreamingResponse(
+        iterate_in_context(context, events()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/analysis/history", response_model=AnalysisHistoryPage)
+def analysis_history(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[int] = Query(None, ge=1, description="next_cursor of the previous page"),
+    term: Optional[str] = Query(None, min_length=1, max_length=200),
+) -> AnalysisHistoryPage:
+    """Newest-first summaries read from indexed columns only; ``GET /analysis/{id}`` has the full result."""
+    filters, params = [], []
+    if cursor is not None:
+        filters.append("id < ?")
+        params.append(cursor)
+    if term:
+        filters.append("term = ?")
+        params.append(term)
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+    rows = database.reader().execute(
+        f"""
+        SELECT id, term, count, mode, llm_model, insights_count, opportunities_count, risks_count,
+               headline_titles, created_at
+        FROM analysis_results {where}
+        ORDER BY id DESC
+        LIMIT ?
+        """,
+        (*params, limit + 1),
     ).fetchall()
-    history: List[AnalysisHistoryItem] = []
-    for row in rows:
-        insight_ids = json.loads(row["insight_ids"])
-        result_payload = json.loads(row["result_json"])
-        history.append(
-            AnalysisHistoryItem(
-                id=row["id"],
-                term=row["term"],
-                count=row["count"],
-                insight_ids=insight_ids,
-                insights=[SummaryItem(**item) for item in result_payload.get("insights", [])],
-                oportunidades_negocio=[
-                    SummaryItem(**item) for item in result_payload.get("oportunidades_negocio", [])
-                ],
-                riesgos_reputacionales=[
-                    SummaryItem(**item) for item in result_payload.get("riesgos_reputacionales", [])
-                ],
-                created_at=row["created_at"],
+    items = [
+        AnalysisSummary(**{**dict(row), "headline_titles": json.loads(row["headline_titles"] or "[]")})
+        for row in rows[:limit]
+    ]
+    next_cursor = items[-1].id if len(rows) > limit else None
+    return AnalysisHistoryPage(items=items, next_cursor=next_cursor)
+
+
+@app.get("/analysis/payload-stats", response_model=PayloadStatsResponse)
+def payload_stats(
+    term: Optional[str] = Query(None, min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=500),
+) -> PayloadStatsResponse:
+    """Estimated prompt tokens of the same insight set under every field profile and encoding."""
+    rows = fetch_insight_rows(term, limit, None)
+    items: List[PayloadEncodingStats] = []
+    for profile in FIELD_PROFILES:
+        articles = format_articles(rows, profile)
+        for payload_format in PAYLOAD_FORMATS:
+            tokens = estimate_tokens(encode_articles(articles, payload_format))
+            items.append(
+                PayloadEncodingStats(
+                    profile=profile,
+                    format=payload_format,
+                    tokens=tokens,
+                    tokens_per_insight=round(tokens / len(rows), 1),
+                )
             )
-        )
-    return history
+    return PayloadStatsResponse(
+        term=term, count=len(rows), active_profile=FIELD_PROFILE, active_format=PAYLOAD_FORMAT, items=items
+    )
+
+
+@app.get("/analysis/{analysis_id}/lineage", response_model=List[AnalysisLineageItem])
+def analysis_lineage(analysis_id: int) -> List[AnalysisLineageItem]:
+    """Chain from ``analysis_id`` back to the full analysis it was incrementally derived from."""
+    chain: List[AnalysisLineageItem] = []
+    current: Optional[int] = analysis_id
+    while current is not None and len(chain) < 100:
+        row = database.reader().execute(
+            "SELECT id, mode, parent_id, delta_depth, count, created_at FROM analysis_results WHERE id = ?",
+            (current,),
+        ).fetchone()
+        if row is None:
+            break
+        chain.append(AnalysisLineageItem(**dict(row)))
+        current = row["parent_id"] if row["delta_depth"] else None
+    if not chain:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return chain
+
+
+def history_item(row: sqlite3.Row) -> AnalysisHistoryItem:
+    result_payload = json.loads(row["result_json"])
+    return AnalysisHistoryItem(
+        id=row["id"],
+        term=row["term"],
+        count=row["count"],
+        insight_ids=json.loads(row["insight_ids"]),
+        insights=[SummaryItem(**item) for item in result_payload.get("insights", [])],
+        oportunidades_negocio=[SummaryItem(**item) for item in result_payload.get("oportunidades_negocio", [])],
+        riesgos_reputacionales=[SummaryItem(**item) for item in result_payload.get("riesgos_reputacionales", [])],
+        created_at=row["created_at"],
+    )
+
+
+@app.get("/analysis/latest", response_model=AnalysisHistoryItem)
+def latest_analysis(term: str = Query(..., min_length=1, max_length=200)) -> AnalysisHistoryItem:
+    """Newest stored analysis of ``term`` (usually precomputed by the scheduler); never calls the LLM."""
+    note_term_request(term)
+    row = latest_term_analysis(term)
+    if row is None:
+        raise HTTPException(status_code=404, detail="No analysis stored for term")
+    return history_item(row)
+
+
+@app.get("/analysis/scheduler", response_model=SchedulerStatus)
+def scheduler_status() -> SchedulerStatus:
+    return SchedulerStatus(
+        enabled=SCHEDULER_ENABLED,
+        hours_utc=SCHEDULER_HOURS,
+        in_window=in_scheduler_window(datetime.utcnow()),
+        hot_terms=hot_terms(),
+        tokens_used_today=scheduler_tokens_today(),
+        daily_token_budget=SCHEDULER_DAILY_TOKEN_BUDGET,
+    )
+
+
+@app.get("/analysis/{analysis_id}", response_model=AnalysisHistoryItem)
+def analysis_detail(analysis_id: int) -> AnalysisHistoryItem:
+    row = database.reader().execute(
+        "SELECT id, term, count, insight_ids, result_json, created_at FROM analysis_results WHERE id = ?",
+        (analysis_id,),
+    ).fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return history_item(row)
+
+
+if SCHEDULER_ENABLED and BACKGROUND_WORKERS_ENABLED:
+    threading.Thread(target=analysis_scheduler_loop, name="analysis-scheduler", daemon=True).start()
 
 
 if __name__ == "__main__":
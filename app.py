@@ -1,9 +1,97 @@
+"""Cliente del LLM local y banco de pruebas de rendimiento.
+
+Sin argumentos envía un prompt de prueba a Ollama y muestra la respuesta en streaming (lo que ejecuta
+el contenedor `client`). Con `bench` reproduce prompts de clasificación y análisis construidos con los
+mismos builders que insights_service y analysis_service contra uno o varios backends/modelos y a
+distintas concurrencias, y escribe un informe JSON con TTFT, tokens/s, percentiles de latencia y
+tasa de JSON válido:
+
+    python app.py bench --target ollama=qwen2.5:14b --target openai=gpt-4o-mini --concurrency 1,4,8
+    python app.py bench --target stub=fake --requests 32 --output bench_report.json
+    python app.py bench --export-prompts prompts.json   # en el repo; luego --prompts prompts.json
+"""
+
+import argparse
+import importlib.util
 import json
 import os
+import sqlite3
 import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import requests
 
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OLLAMA_URL = os.environ.get("LLM_API_URL", "http://host.docker.internal:11434/api/generate")
+DEFAULT_OPENAI_URL = os.environ.get("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
+
+# Noticias de ejemplo para cuando no se indica --db; cubren los sectores que más se monitorizan
+SAMPLE_ARTICLES = [
+    {
+        "title": "Banco Andino lanza una línea de crédito verde para pymes",
+        "description": "La entidad destinará 500 millones a financiar proyectos de eficiencia energética.",
+        "content": (
+            "Banco Andino anunció este martes una línea de crédito de 500 millones de dólares dirigida a "
+            "pequeñas y medianas empresas que inviertan en eficiencia energética y energías renovables. "
+            "Según la presidenta de la entidad, las tasas serán hasta 2 puntos inferiores a las de un "
+            "crédito comercial tradicional. Analistas del sector consideran que la medida responde a la "
+            "presión regulatoria y a la competencia de los bancos digitales. "
+        )
+        * 4,
+    },
+    {
+        "title": "Caída del servicio de TeleNova deja sin conexión a miles de usuarios",
+        "description": "La operadora atribuye la interrupción a un fallo en un centro de datos de Bogotá.",
+        "content": (
+            "Durante más de seis horas, clientes de TeleNova en cinco ciudades reportaron la caída del "
+            "servicio de internet móvil y fijo. La superintendencia abrió una investigación y anunció "
+            "posibles sanciones. En redes sociales, el hashtag #SinTeleNova fue tendencia nacional y "
+            "varias empresas denunciaron pérdidas por la interrupción. "
+        )
+        * 4,
+    },
+    {
+        "title": "El Gobierno aprueba la reforma tarifaria del sector eléctrico",
+        "description": "Las nuevas tarifas entrarán en vigor en enero y afectarán a hogares e industria.",
+        "content": (
+            "El Ministerio de Energía aprobó la reforma que modifica la fórmula de cálculo de las tarifas "
+            "eléctricas. Los gremios industriales advirtieron de un aumento de costes del 8% mientras "
+            "que las asociaciones de consumidores celebraron los subsidios para estratos bajos. La "
+            "oposición anunció que llevará la medida al Congreso. "
+        )
+        * 4,
+    },
+    {
+        "title": "MercadoSur reporta ventas récord en su temporada de descuentos",
+        "description": "La cadena minorista creció un 23% interanual impulsada por el canal online.",
+        "content": (
+            "La cadena MercadoSur informó que sus ventas durante la temporada de descuentos superaron "
+            "en un 23% las del año anterior, con el comercio electrónico representando ya el 40% del "
+            "total. La compañía atribuyó el resultado a su nueva aplicación móvil y a acuerdos con "
+            "marcas locales, aunque algunos clientes se quejaron por retrasos en las entregas. "
+        )
+        * 4,
+    },
+]
+SAMPLE_CLASSIFICATION = {
+    "sentimiento": "neutro",
+    "categoria": "finanzas",
+    "tono": "formal",
+    "urgencia": "media",
+    "etiquetas": "mercado,regulacion,consumidores",
+    "temas_principales": "regulacion,competencia",
+    "stakeholders": "clientes,reguladores,inversionistas",
+    "impacto_economico": "Moderado en el corto plazo",
+    "confianza": 0.8,
+    "relevancia": 4,
+}
+
 
 def stream_completion(api_url: str, model: str, prompt: str) -> None:
     payload = {
@@ -34,8 +122,361 @@ def stream_completion(api_url: str, model: str, prompt: str) -> None:
         sys.exit(1)
 
 
+def load_service(name: str, directory: str, db_path: str):
+    """Import a service's app.py against a throwaway DB, only to reuse its prompt builders."""
+    os.environ["INSIGHTS_DB_PATH"] = db_path
+    os.environ["ANALYSIS_SCHEDULER_ENABLED"] = "false"
+    service_dir = os.path.join(ROOT, directory)
+    sys.path.insert(0, service_dir)
+    try:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(service_dir, "app.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(service_dir)
+    return module
+
+
+def sample_insight_rows(db_path: Optional[str], count: int) -> List[Dict[str, Any]]:
+    if db_path:
+        db = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        db.row_factory = sqlite3.Row
+        rows = [dict(row) for row in db.execute("SELECT * FROM insights ORDER BY id DESC LIMIT ?", (count,))]
+        db.close()
+        if rows:
+            return rows
+    now = datetime.utcnow().isoformat()
+    return [
+        {
+            "id": index + 1,
+            "term": "benchmark",
+            "article_title": article["title"],
+            "article_description": article["description"],
+            "article_content": article["content"],
+            "resumen": article["description"],
+            "resumen_ejecutivo": article["content"][:300],
+            "marca": article["title"].split()[0],
+            "created_at": now,
+            **SAMPLE_CLASSIFICATION,
+        }
+        for index, article in enumerate(SAMPLE_ARTICLES[index % len(SAMPLE_ARTICLES)] for index in range(count))
+    ]
+
+
+def build_prompts(db_path: Optional[str], classification: int, analysis: int, analysis_size: int) -> List[Dict[str, str]]:
+    """Classification and analysis prompts exactly as the services would send them today."""
+    workdir = tempfile.mkdtemp(prefix="llm-bench-")
+    scratch_db = os.path.join(workdir, "insights.db")
+    insights = load_service("insights_app", "insights_service", scratch_db)
+    analysis_app = load_service("analysis_app", "analysis_service", scratch_db)
+
+    rows = sample_insight_rows(db_path, max(classification, analysis * analysis_size))
+    prompts: List[Dict[str, str]] = []
+    for index in range(classification):
+        row = rows[index % len(rows)]
+        article = {
+            "title": row.get("article_title"),
+            "description": row.get("article_description"),
+            "content": row.get("article_content"),
+        }
+        prompts.append(
+            {
+                "kind": "classification",
+                "system": insights.CLASSIFICATION_SYSTEM_PROMPT,
+                "user": insights.build_classification_prompt(article),
+            }
+        )
+    for index in range(analysis):
+        window = [rows[(index * analysis_size + offset) % len(rows)] for offset in range(analysis_size)]
+        window = [{**row, "id": position} for position, row in enumerate(window, start=1)]
+        prompts.append(
+            {
+                "kind": "analysis",
+                "system": analysis_app.ANALYSIS_SYSTEM_PROMPT,
+                "user": analysis_app.prepare_analysis_prompt(window, hierarchical=False),
+            }
+        )
+    return prompts
+
+
+def extract_json(text: str) -> Optional[Dict[str, Any]]:
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end == -1:
+        return None
+    try:
+        data = json.loads(text[start : end + 1])
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def is_valid_answer(kind: str, text: str) -> bool:
+    data = extract_json(text)
+    if data is None:
+        return False
+    if kind == "classification":
+        return bool(data.get("sentimiento"))
+    return all(isinstance(data.get(key), list) for key in ("insights", "oportunidades_negocio", "riesgos_reputacionales"))
+
+
+def stream_openai(url: str, model: str, prompt: Dict[str, str], timeout: float) -> Iterator[Tuple[str, Optional[int]]]:
+    """Yield (content delta, completion tokens once known) from an OpenAI-compatible streaming endpoint."""
+    headers = {"Content-Type": "application/json"}
+    if os.environ.get("OPENAI_API_KEY"):
+        headers["Authorization"] = f"Bearer {os.environ['OPENAI_API_KEY']}"
+    payload = {
+        "model": model,
+        "messages": [{"role": "system", "content": prompt["system"]}, {"role": "user", "content": prompt["user"]}],
+        "response_format": {"type": "json_object"},
+        "temperature": 0.3,
+        "stream": True,
+        "stream_options": {"include_usage": True},
+    }
+    with requests.post(url, json=payload, headers=headers, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                return
+            chunk = json.loads(data)
+            usage = chunk.get("usage") or {}
+            for choice in chunk.get("choices") or []:
+                content = (choice.get("delta") or {}).get("content")
+                if content:
+                    yield content, None
+            if usage.get("completion_tokens") is not None:
+                yield "", usage["completion_tokens"]
+
+
+def stream_ollama(url: str, model: str, prompt: Dict[str, str], timeout: float) -> Iterator[Tuple[str, Optional[int]]]:
+    base = url.split("/api/", 1)[0].rstrip("/")
+    payload = {
+        "model": model,
+        "messages": [{"role": "system", "content": prompt["system"]}, {"role": "user", "content": prompt["user"]}],
+        "format": "json",
+        "options": {"temperature": 0.3},
+        "stream": True,
+    }
+    with requests.post(f"{base}/api/chat", json=payload, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            content = (chunk.get("message") or {}).get("content")
+            if content:
+                yield content, None
+            if chunk.get("done"):
+                yield "", chunk.get("eval_count")
+                return
+
+
+BACKENDS = {"openai": stream_openai, "ollama": stream_ollama, "stub": stream_openai}
+
+
+class StubLLM(BaseHTTPRequestHandler):
+    """OpenAI-style SSE stream with configurable time-to-first-token and tokens/second."""
+
+    ttft = 0.2
+    tokens_per_second = 50.0
+    answer = json.dumps(
+        {
+            **SAMPLE_CLASSIFICATION,
+            "insights": [{"titulo": f"Insight {i}", "descripcion": "Detalle del hallazgo"} for i in range(5)],
+            "oportunidades_negocio": [{"titulo": "Oportunidad", "descripcion": "Detalle"}] * 5,
+            "riesgos_reputacionales": [{"titulo": "Riesgo", "descripcion": "Detalle"}] * 5,
+        },
+        ensure_ascii=False,
+    )
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        time.sleep(self.ttft)
+        # ~4 caracteres por token, como la estimación de los servicios
+        pieces = [self.answer[i : i + 4] for i in range(0, len(self.answer), 4)]
+        for piece in pieces:
+            self.wfile.write(f"data: {json.dumps({'choices': [{'delta': {'content': piece}}]})}\n\n".encode("utf-8"))
+            time.sleep(1 / self.tokens_per_second)
+        usage = {"choices": [], "usage": {"prompt_tokens": 0, "completion_tokens": len(pieces)}}
+        self.wfile.write(f"data: {json.dumps(usage)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def start_stub(ttft_ms: float, tokens_per_second: float) -> str:
+    StubLLM.ttft = ttft_ms / 1000
+    StubLLM.tokens_per_second = tokens_per_second
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLLM)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+
+
+def run_request(backend: str, url: str, model: str, prompt: Dict[str, str], timeout: float) -> Dict[str, Any]:
+    started = time.perf_counter()
+    first_token: Optional[float] = None
+    parts: List[str] = []
+    completion_tokens: Optional[int] = None
+    error: Optional[str] = None
+    try:
+        for content, tokens in BACKENDS[backend](url, model, prompt, timeout):
+            if content:
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                parts.append(content)
+            if tokens is not None:
+                completion_tokens = tokens
+    except (requests.RequestException, ValueError) as exc:
+        error = str(exc)
+    total = time.perf_counter() - started
+    text = "".join(parts)
+    # Sin usage del backend se cuentan los fragmentos recibidos (≈ 1 token cada uno)
+    tokens = completion_tokens if completion_tokens is not None else len(parts)
+    generation = total - (first_token or 0)
+    return {
+        "kind": prompt["kind"],
+        "error": error,
+        "ttft": first_token,
+        "latency": total,
+        "completion_tokens": tokens,
+        "tokens_per_second": tokens / generation if tokens and generation > 0 else None,
+        "json_valid": error is None and is_valid_answer(prompt["kind"], text),
+    }
+
+
+def percentiles(values: List[float], scale: float = 1000.0) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * scale  # noqa: E731
+    return {
+        "p50": round(pick(0.50), 1),
+        "p90": round(pick(0.90), 1),
+        "p95": round(pick(0.95), 1),
+        "p99": round(pick(0.99), 1),
+        "max": round(ordered[-1] * scale, 1),
+    }
+
+
+def summarize(results: List[Dict[str, Any]], wall: float) -> Dict[str, Any]:
+    ok = [result for result in results if result["error"] is None]
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "wall_seconds": round(wall, 2),
+        "throughput_rps": round(len(ok) / wall, 3) if wall else None,
+        "output_tokens_per_second": round(sum(result["completion_tokens"] for result in ok) / wall, 1) if wall else None,
+        "ttft_ms": percentiles([result["ttft"] for result in ok if result["ttft"] is not None]),
+        "latency_ms": percentiles([result["latency"] for result in ok]),
+        "tokens_per_second": percentiles(
+            [result["tokens_per_second"] for result in ok if result["tokens_per_second"]], scale=1.0
+        ),
+        "json_valid_rate": round(sum(result["json_valid"] for result in results) / len(results), 3) if results else None,
+        "sample_errors": sorted({result["error"] for result in results if result["error"]})[:3],
+    }
+
+
+def parse_target(raw: str) -> Dict[str, str]:
+    """``backend=model[@url]``, e.g. ``ollama=qwen2.5:14b`` or ``openai=gpt-4o-mini@http://vllm:8000/v1/chat/completions``."""
+    backend, _, rest = raw.partition("=")
+    if backend not in BACKENDS or not rest:
+        raise argparse.ArgumentTypeError(f"Invalid target {raw!r}; expected backend=model[@url] with backend in {sorted(BACKENDS)}")
+    model, _, url = rest.partition("@")
+    if not url:
+        url = DEFAULT_OLLAMA_URL if backend == "ollama" else DEFAULT_OPENAI_URL
+    return {"backend": backend, "model": model, "url": url}
+
+
+def run_benchmark(args: argparse.Namespace) -> int:
+    if args.prompts:
+        with open(args.prompts, "r", encoding="utf-8") as handle:
+            prompts = json.load(handle)
+    else:
+        prompts = build_prompts(args.db, args.classification, args.analysis, args.analysis_size)
+    if args.export_prompts:
+        with open(args.export_prompts, "w", encoding="utf-8") as handle:
+            json.dump(prompts, handle, ensure_ascii=False, indent=2)
+        print(f"{len(prompts)} prompts escritos en {args.export_prompts}")
+        return 0
+
+    targets = args.target or [parse_target(f"ollama={os.environ.get('LLM_MODEL', 'qwen2.5:14b')}")]
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    report: Dict[str, Any] = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "prompts": {kind: sum(prompt["kind"] == kind for prompt in prompts) for kind in ("classification", "analysis")},
+        "requests_per_level": args.requests,
+        "targets": [],
+    }
+    for target in targets:
+        if target["backend"] == "stub":
+            target = {**target, "url": start_stub(args.stub_ttft_ms, args.stub_tokens_per_second)}
+        entry = {**target, "levels": []}
+        for level in levels:
+            batch = [prompts[index % len(prompts)] for index in range(args.requests)]
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=level) as pool:
+                results = list(
+                    pool.map(
+                        lambda prompt: run_request(target["backend"], target["url"], target["model"], prompt, args.timeout),
+                        batch,
+                    )
+                )
+            wall = time.perf_counter() - started
+            summary = {"concurrency": level, **summarize(results, wall)}
+            summary["by_kind"] = {
+                kind: summarize([result for result in results if result["kind"] == kind], wall)
+                for kind in ("classification", "analysis")
+                if any(result["kind"] == kind for result in results)
+            }
+            entry["levels"].append(summary)
+            ttft = (summary["ttft_ms"] or {}).get("p50")
+            latency = summary["latency_ms"] or {}
+            print(
+                f"{target['backend']}={target['model']} c={level:<3} ok={summary['requests'] - summary['errors']}/{summary['requests']} "
+                f"ttft_p50={ttft}ms lat_p50={latency.get('p50')}ms lat_p95={latency.get('p95')}ms "
+                f"tok/s={summary['output_tokens_per_second']} json={summary['json_valid_rate']}",
+                flush=True,
+            )
+        report["targets"].append(entry)
+
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, ensure_ascii=False, indent=2)
+    print(f"Informe escrito en {args.output}")
+    return 0
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Cliente de prueba y benchmark del LLM.")
+    commands = parser.add_subparsers(dest="command")
+    bench = commands.add_parser("bench", help="mide TTFT, tokens/s, latencia y JSON válido por modelo/concurrencia")
+    bench.add_argument("--target", action="append", type=parse_target, help="backend=model[@url]; repetible")
+    bench.add_argument("--concurrency", default="1,4,8", help="niveles de concurrencia separados por comas")
+    bench.add_argument("--requests", type=int, default=16, help="peticiones por objetivo y nivel")
+    bench.add_argument("--classification", type=int, default=8, help="prompts de clasificación a generar")
+    bench.add_argument("--analysis", type=int, default=2, help="prompts de análisis a generar")
+    bench.add_argument("--analysis-size", type=int, default=10, help="insights por prompt de análisis")
+    bench.add_argument("--db", default=None, help="insights.db real del que tomar las noticias (sólo lectura)")
+    bench.add_argument("--prompts", default=None, help="JSON de prompts exportado previamente")
+    bench.add_argument("--export-prompts", default=None, help="escribe los prompts generados y termina")
+    bench.add_argument("--timeout", type=float, default=300, help="timeout por petición en segundos")
+    bench.add_argument("--stub-ttft-ms", type=float, default=200, help="TTFT del backend stub")
+    bench.add_argument("--stub-tokens-per-second", type=float, default=50, help="velocidad del backend stub")
+    bench.add_argument("--output", default="bench_report.json", help="ruta del informe JSON")
+    return parser.parse_args(argv)
+
+
 def main() -> None:
-    api_url = os.environ.get("LLM_API_URL", "http://host.docker.internal:11434/api/generate")
+    args = parse_args()
+    if args.command == "bench":
+        sys.exit(run_benchmark(args))
+
+    api_url = DEFAULT_OLLAMA_URL
     model = os.environ.get("LLM_MODEL", "qwen2.5:14b")
     prompt = (
         "Explain why connecting Docker to localhost logic requires host.docker.internal on macOS."
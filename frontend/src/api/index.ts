@@ -2,6 +2,8 @@ import axios from 'axios'
 import type {
   AggregatedAnalysis,
   AnalysisHistoryItem,
+  AnalysisHistoryPage,
+  AnalysisStreamItem,
   Insight,
   InsightResponse,
   NewsArticle,
@@ -76,7 +78,15 @@ export const classifyByTerm = async (term: string, language?: string) => {
 }
 
 export const fetchInsightsList = async (
-  options: { term?: string; limit?: number; offset?: number } = {},
+  options: {
+    term?: string
+    limit?: number
+    offset?: number
+    cursor?: number
+    view?: 'summary' | 'detail' | 'full'
+    fields?: string
+    include_total?: boolean
+  } = {},
 ) => {
   const client = insightsClient ?? requireClient(insightsApiBase, 'INSIGHTS')
   const { data } = await client.get<PaginatedInsights>('/insights/list', {
@@ -92,21 +102,66 @@ export const fetchInsightsHistory = async (limit = 100) => {
 }
 
 export const runAnalysis = async (
-  payload: { term?: string; limit?: number; insight_ids?: number[] },
+  payload: { term?: string; limit?: number; insight_ids?: number[]; force?: boolean; incremental?: boolean },
 ) => {
   const client = analysisClient ?? requireClient(analysisApiBase, 'ANALYSIS')
   const { data } = await client.post<AggregatedAnalysis>('/analysis/run', payload)
   return data
 }
 
-export const fetchAnalysisHistory = async (limit = 20) => {
+// Consume el SSE de /analysis/run/stream: avisa de cada insight/oportunidad/riesgo y resuelve con el análisis guardado
+export const runAnalysisStream = async (
+  payload: { term?: string; limit?: number; insight_ids?: number[]; force?: boolean },
+  onItem: (item: AnalysisStreamItem) => void,
+) => {
+  if (!analysisApiBase) {
+    throw new Error('ANALYSIS_API_UNAVAILABLE')
+  }
+  const response = await fetch(`${analysisApiBase}/analysis/run/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+    body: JSON.stringify(payload),
+  })
+  if (!response.ok || !response.body) {
+    throw new Error(`Analysis stream failed with status ${response.status}`)
+  }
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  for (;;) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    let boundary = buffer.indexOf('\n\n')
+    while (boundary !== -1) {
+      const block = buffer.slice(0, boundary)
+      buffer = buffer.slice(boundary + 2)
+      boundary = buffer.indexOf('\n\n')
+      const event = block.match(/^event: (.*)$/m)?.[1]
+      const data = block.match(/^data: (.*)$/m)?.[1]
+      if (!event || !data) continue
+      if (event === 'item') onItem(JSON.parse(data) as AnalysisStreamItem)
+      if (event === 'done') return JSON.parse(data) as AggregatedAnalysis
+      if (event === 'error') throw new Error(JSON.parse(data).detail ?? 'Analysis stream failed')
+    }
+  }
+  throw new Error('Analysis stream ended before completion')
+}
+
+export const fetchAnalysisHistory = async (limit = 20, cursor?: number | null) => {
   const client = analysisClient ?? requireClient(analysisApiBase, 'ANALYSIS')
-  const { data } = await client.get<AnalysisHistoryItem[]>('/analysis/history', {
-    params: { limit },
+  const { data } = await client.get<AnalysisHistoryPage>('/analysis/history', {
+    params: { limit, cursor: cursor ?? undefined },
   })
   return data
 }
 
+export const fetchAnalysisDetail = async (analysisId: number) => {
+  const client = analysisClient ?? requireClient(analysisApiBase, 'ANALYSIS')
+  const { data } = await client.get<AnalysisHistoryItem>(`/analysis/${analysisId}`)
+  return data
+}
+
 export const fetchNewsArchive = async (
   options: { term?: string; source?: string; category?: string; order?: 'asc' | 'desc'; limit?: number; offset?: number } = {},
 ) => {
@@ -126,5 +181,5 @@ export const getInsights = fetchInsightsList
 export const getAnalysisHistory = fetchAnalysisHistory
 export const getAnalysis = async () => {
   const history = await fetchAnalysisHistory(1)
-  return history[0] || null
+  return history.items[0] ? fetchAnalysisDetail(history.items[0].id) : null
 }
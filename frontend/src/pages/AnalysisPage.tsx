@@ -25,21 +25,26 @@ import {
   CheckCircleOutlined,
   BulbOutlined,
 } from '@ant-design/icons'
-import { getAnalysisHistory } from '../api'
-import type { AnalysisHistoryItem } from '../types'
+import { fetchAnalysisDetail, getAnalysisHistory } from '../api'
+import type { AnalysisHistoryItem, AnalysisSummary } from '../types'
 import { motion } from 'framer-motion'
 
 const { Title, Text, Paragraph } = Typography
 
 const AnalysisPage = () => {
-  const [history, setHistory] = useState<AnalysisHistoryItem[]>([])
+  const [history, setHistory] = useState<AnalysisSummary[]>([])
+  const [nextCursor, setNextCursor] = useState<number | null>(null)
+  const [details, setDetails] = useState<Record<number, AnalysisHistoryItem>>({})
+  const [loadingDetail, setLoadingDetail] = useState<number | null>(null)
   const [loading, setLoading] = useState(false)
 
-  const fetchHistory = async () => {
+  // La lista sólo trae resúmenes; el detalle completo se pide al abrir cada análisis
+  const fetchHistory = async (cursor?: number | null) => {
     try {
       setLoading(true)
-      const data = await getAnalysisHistory(20)
-      setHistory(data)
+      const data = await getAnalysisHistory(20, cursor)
+      setHistory((prev) => (cursor ? [...prev, ...data.items] : data.items))
+      setNextCursor(data.next_cursor ?? null)
     } catch (error) {
       console.error(error)
       message.error('Error al cargar los análisis')
@@ -48,12 +53,33 @@ const AnalysisPage = () => {
     }
   }
 
+  const toggleDetail = async (analysisId: number) => {
+    if (details[analysisId]) {
+      setDetails((prev) => {
+        const next = { ...prev }
+        delete next[analysisId]
+        return next
+      })
+      return
+    }
+    try {
+      setLoadingDetail(analysisId)
+      const detail = await fetchAnalysisDetail(analysisId)
+      setDetails((prev) => ({ ...prev, [analysisId]: detail }))
+    } catch (error) {
+      console.error(error)
+      message.error('Error al cargar el análisis')
+    } finally {
+      setLoadingDetail(null)
+    }
+  }
+
   useEffect(() => {
     fetchHistory()
   }, [])
 
   const groupedAnalyses = useMemo(() => {
-    const map = new Map<string, AnalysisHistoryItem[]>()
+    const map = new Map<string, AnalysisSummary[]>()
     history.forEach((item) => {
       const key = item.term || 'Multiples términos'
       const list = map.get(key) ?? []
@@ -153,6 +179,158 @@ const AnalysisPage = () => {
     )
   }
 
+  const renderDetail = (analysis: AnalysisHistoryItem) => (
+    <>
+      {/* Síntesis General */}
+      {analysis.sintesis_general && (
+        <Alert
+          message="📰 Síntesis General"
+          description={<Paragraph style={{ marginTop: 8, marginBottom: 0 }}>{analysis.sintesis_general}</Paragraph>}
+          type="info"
+          showIcon
+          style={{ marginBottom: 16 }}
+        />
+      )}
+
+      {/* Narrativas */}
+      <Row gutter={[16, 16]}>
+        <Col xs={24} lg={12}>
+          {renderInfoCard('📖 Narrativa Principal', analysis.narrativa_principal, <BulbOutlined />)}
+          {renderTagList('🎭 Framing', analysis.framing_predominante, 'purple')}
+          {renderTagList('📍 Narrativas Alternativas', analysis.narrativas_alternativas, 'geekblue')}
+        </Col>
+        <Col xs={24} lg={12}>
+          {renderInfoCard('⏱️ Línea Temporal', analysis.linea_temporal)}
+          {renderInfoCard('📚 Contexto Necesario', analysis.contexto_necesario)}
+        </Col>
+      </Row>
+
+      {/* Actores y Voces */}
+      <Card size="small" title={<><TeamOutlined /> Actores y Voces</>} style={{ background: '#fafafa' }}>
+        <Row gutter={[16, 16]}>
+          <Col xs={24} md={8}>
+            {renderTagList('Actores Principales', analysis.actores_principales, 'blue')}
+          </Col>
+          <Col xs={24} md={8}>
+            <div style={{ marginBottom: 16 }}>
+              <Text strong style={{ display: 'block', marginBottom: 8 }}>
+                <CheckCircleOutlined style={{ color: '#059669' }} /> Voces Presentes
+              </Text>
+              <Text>{analysis.voces_presentes || '—'}</Text>
+            </div>
+          </Col>
+          <Col xs={24} md={8}>
+            <div style={{ marginBottom: 16 }}>
+              <Text strong style={{ display: 'block', marginBottom: 8 }}>
+                <ExclamationCircleOutlined style={{ color: '#dc2626' }} /> Voces Ausentes
+              </Text>
+              <Text type="secondary">{analysis.voces_ausentes || 'Ninguna identificada'}</Text>
+            </div>
+          </Col>
+        </Row>
+      </Card>
+
+      {/* Posiciones */}
+      {analysis.posiciones_enfrentadas && (
+        <Card size="small" title="⚖️ Posiciones Enfrentadas" style={{ background: '#fef2f2' }}>
+          <Paragraph style={{ whiteSpace: 'pre-line', marginBottom: 0 }}>{analysis.posiciones_enfrentadas}</Paragraph>
+        </Card>
+      )}
+
+      {/* Datos y Citas */}
+      <Row gutter={[16, 16]}>
+        <Col xs={24} lg={12}>
+          {renderTagList('📊 Datos Clave', analysis.datos_clave, 'orange')}
+          {renderTagList('📄 Fuentes Primarias', analysis.fuentes_primarias, 'cyan')}
+        </Col>
+        <Col xs={24} lg={12}>
+          {renderQuotes(analysis.citas_destacadas)}
+        </Col>
+      </Row>
+
+      {/* Credibilidad y Calidad */}
+      <Card size="small" title={<><SafetyOutlined /> Credibilidad y Calidad</>}>
+        <Row gutter={[16, 16]}>
+          <Col xs={24} md={8}>
+            <Text strong>Credibilidad:</Text>
+            <Paragraph>{analysis.nivel_credibilidad || '—'}</Paragraph>
+          </Col>
+          <Col xs={24} md={8}>
+            <Text strong>Equilibrio:</Text>
+            <Paragraph>{analysis.equilibrio_cobertura || '—'}</Paragraph>
+          </Col>
+          <Col xs={24} md={8}>
+            <Text strong>Calidad Periodística:</Text>
+            <Paragraph>{analysis.calidad_periodistica || '—'}</Paragraph>
+          </Col>
+        </Row>
+        {analysis.verificacion_necesaria && (
+          <Alert
+            message="⚠️ Verificación Necesaria"
+            description={analysis.verificacion_necesaria}
+            type="warning"
+            showIcon
+            style={{ marginTop: 12 }}
+          />
+        )}
+      </Card>
+
+      {/* Sesgos */}
+      {analysis.sesgos_identificados && (
+        <Alert
+          message="🎭 Sesgos Identificados"
+          description={analysis.sesgos_identificados}
+          type="warning"
+          showIcon
+        />
+      )}
+
+      {/* Geografía */}
+      <Card size="small" title={<><GlobalOutlined /> Dimensión Geográfica</>}>
+        <Row gutter={[16, 16]}>
+          <Col xs={24} md={8}>
+            <Text strong>Epicentro:</Text>
+            <Paragraph>{analysis.epicentro_geografico || '—'}</Paragraph>
+          </Col>
+          <Col xs={24} md={8}>
+            <Text strong>Alcance:</Text>
+            <Tag color="blue">{analysis.alcance_geografico || 'No especificado'}</Tag>
+          </Col>
+          <Col xs={24} md={8}>
+            {renderTagList('Zonas Afectadas', analysis.zonas_afectadas, 'green')}
+          </Col>
+        </Row>
+      </Card>
+
+      {/* Temas y Tendencias */}
+      <Card size="small" title={<><FireOutlined /> Temas y Tendencias</>}>
+        {renderTagList('🔥 Temas Dominantes', analysis.temas_dominantes, 'red')}
+        {renderTagList('✨ Temas Emergentes', analysis.temas_emergentes, 'gold')}
+        {renderTagList('🔑 Palabras Clave', analysis.palabras_clave_frecuentes, 'purple')}
+        {renderTagList('#️⃣ Hashtags Tendencia', analysis.hashtags_tendencia, 'magenta')}
+      </Card>
+
+      {/* Impactos */}
+      {renderImpacts(analysis)}
+
+      {/* Escenarios */}
+      {renderScenarios(analysis.escenarios_posibles)}
+
+      {/* Eventos por Vigilar */}
+      {analysis.eventos_por_vigilar && renderInfoCard('📅 Eventos por Vigilar', analysis.eventos_por_vigilar)}
+
+      {/* Aspectos Ignorados */}
+      {analysis.aspectos_ignorados && (
+        <Alert
+          message="💡 Aspectos No Cubiertos"
+          description={analysis.aspectos_ignorados}
+          type="info"
+          showIcon
+        />
+      )}
+    </>
+  )
+
   return (
     <Space direction="vertical" size="large" style={{ width: '100%' }}>
       <motion.div initial={{ opacity: 0, y: 20 }} animate={{ opacity: 1, y: 0 }} transition={{ duration: 0.4 }}>
@@ -163,7 +341,7 @@ const AnalysisPage = () => {
             </Title>
             <Text type="secondary">Análisis de cobertura mediática y narrativas emergentes</Text>
           </div>
-          <Button icon={<ReloadOutlined />} onClick={fetchHistory} loading={loading}>
+          <Button icon={<ReloadOutlined />} onClick={() => fetchHistory()} loading={loading}>
             Actualizar
           </Button>
         </div>
@@ -171,193 +349,81 @@ const AnalysisPage = () => {
 
       <motion.div initial={{ opacity: 0, y: 10 }} animate={{ opacity: 1, y: 0 }} transition={{ delay: 0.2 }}>
         {groupedAnalyses.length ? (
-          <Collapse
-            bordered={false}
-            defaultActiveKey={groupedAnalyses[0]?.[0]}
-            expandIconPosition="end"
-            items={groupedAnalyses.map(([term, analyses]) => ({
-              key: term,
-              label: (
-                <Space>
-                  <FolderOpenOutlined style={{ color: 'var(--accent-color)' }} />
-                  <Text strong>{term}</Text>
-                  <Tag color="volcano">{analyses.length}</Tag>
-                </Space>
-              ),
-              children: (
-                <Space direction="vertical" style={{ width: '100%' }} size="large">
-                  {analyses.map((analysis) => (
-                    <Card
-                      key={analysis.id}
-                      style={{ borderRadius: 16, border: '1px solid #f3f4f6' }}
-                    >
-                      <Space direction="vertical" style={{ width: '100%' }} size="middle">
-                        {/* Header */}
-                        <div style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center' }}>
-                          <Space>
-                            <BarChartOutlined style={{ fontSize: 20, color: 'var(--accent-color)' }} />
-                            <Title level={4} style={{ margin: 0 }}>Análisis #{analysis.id}</Title>
+          <>
+            <Collapse
+              bordered={false}
+              defaultActiveKey={groupedAnalyses[0]?.[0]}
+              expandIconPosition="end"
+              items={groupedAnalyses.map(([term, analyses]) => ({
+                key: term,
+                label: (
+                  <Space>
+                    <FolderOpenOutlined style={{ color: 'var(--accent-color)' }} />
+                    <Text strong>{term}</Text>
+                    <Tag color="volcano">{analyses.length}</Tag>
+                  </Space>
+                ),
+                children: (
+                  <Space direction="vertical" style={{ width: '100%' }} size="large">
+                    {analyses.map((analysis) => (
+                      <Card
+                        key={analysis.id}
+                        style={{ borderRadius: 16, border: '1px solid #f3f4f6' }}
+                      >
+                        <Space direction="vertical" style={{ width: '100%' }} size="middle">
+                          {/* Header */}
+                          <div style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center' }}>
+                            <Space>
+                              <BarChartOutlined style={{ fontSize: 20, color: 'var(--accent-color)' }} />
+                              <Title level={4} style={{ margin: 0 }}>Análisis #{analysis.id}</Title>
+                            </Space>
+                            <Text type="secondary">{new Date(analysis.created_at).toLocaleString()}</Text>
+                          </div>
+
+                          <Divider style={{ margin: '12px 0' }} />
+
+                          <Space wrap>
+                            <Tag color="blue">{analysis.count} insights analizados</Tag>
+                            <Tag color="green">{analysis.insights_count} hallazgos</Tag>
+                            <Tag color="gold">{analysis.opportunities_count} oportunidades</Tag>
+                            <Tag color="red">{analysis.risks_count} riesgos</Tag>
+                            {analysis.llm_model && <Tag>{analysis.llm_model}</Tag>}
                           </Space>
-                          <Text type="secondary">{new Date(analysis.created_at).toLocaleString()}</Text>
-                        </div>
-
-                        <Divider style={{ margin: '12px 0' }} />
-
-                        {/* Síntesis General */}
-                        {analysis.sintesis_general && (
-                          <Alert
-                            message="📰 Síntesis General"
-                            description={<Paragraph style={{ marginTop: 8, marginBottom: 0 }}>{analysis.sintesis_general}</Paragraph>}
-                            type="info"
-                            showIcon
-                            style={{ marginBottom: 16 }}
-                          />
-                        )}
-
-                        {/* Narrativas */}
-                        <Row gutter={[16, 16]}>
-                          <Col xs={24} lg={12}>
-                            {renderInfoCard('📖 Narrativa Principal', analysis.narrativa_principal, <BulbOutlined />)}
-                            {renderTagList('🎭 Framing', analysis.framing_predominante, 'purple')}
-                            {renderTagList('📍 Narrativas Alternativas', analysis.narrativas_alternativas, 'geekblue')}
-                          </Col>
-                          <Col xs={24} lg={12}>
-                            {renderInfoCard('⏱️ Línea Temporal', analysis.linea_temporal)}
-                            {renderInfoCard('📚 Contexto Necesario', analysis.contexto_necesario)}
-                          </Col>
-                        </Row>
-
-                        {/* Actores y Voces */}
-                        <Card size="small" title={<><TeamOutlined /> Actores y Voces</>} style={{ background: '#fafafa' }}>
-                          <Row gutter={[16, 16]}>
-                            <Col xs={24} md={8}>
-                              {renderTagList('Actores Principales', analysis.actores_principales, 'blue')}
-                            </Col>
-                            <Col xs={24} md={8}>
-                              <div style={{ marginBottom: 16 }}>
-                                <Text strong style={{ display: 'block', marginBottom: 8 }}>
-                                  <CheckCircleOutlined style={{ color: '#059669' }} /> Voces Presentes
-                                </Text>
-                                <Text>{analysis.voces_presentes || '—'}</Text>
-                              </div>
-                            </Col>
-                            <Col xs={24} md={8}>
-                              <div style={{ marginBottom: 16 }}>
-                                <Text strong style={{ display: 'block', marginBottom: 8 }}>
-                                  <ExclamationCircleOutlined style={{ color: '#dc2626' }} /> Voces Ausentes
-                                </Text>
-                                <Text type="secondary">{analysis.voces_ausentes || 'Ninguna identificada'}</Text>
-                              </div>
-                            </Col>
-                          </Row>
-                        </Card>
-
-                        {/* Posiciones */}
-                        {analysis.posiciones_enfrentadas && (
-                          <Card size="small" title="⚖️ Posiciones Enfrentadas" style={{ background: '#fef2f2' }}>
-                            <Paragraph style={{ whiteSpace: 'pre-line', marginBottom: 0 }}>{analysis.posiciones_enfrentadas}</Paragraph>
-                          </Card>
-                        )}
-
-                        {/* Datos y Citas */}
-                        <Row gutter={[16, 16]}>
-                          <Col xs={24} lg={12}>
-                            {renderTagList('📊 Datos Clave', analysis.datos_clave, 'orange')}
-                            {renderTagList('📄 Fuentes Primarias', analysis.fuentes_primarias, 'cyan')}
-                          </Col>
-                          <Col xs={24} lg={12}>
-                            {renderQuotes(analysis.citas_destacadas)}
-                          </Col>
-                        </Row>
-
-                        {/* Credibilidad y Calidad */}
-                        <Card size="small" title={<><SafetyOutlined /> Credibilidad y Calidad</>}>
-                          <Row gutter={[16, 16]}>
-                            <Col xs={24} md={8}>
-                              <Text strong>Credibilidad:</Text>
-                              <Paragraph>{analysis.nivel_credibilidad || '—'}</Paragraph>
-                            </Col>
-                            <Col xs={24} md={8}>
-                              <Text strong>Equilibrio:</Text>
-                              <Paragraph>{analysis.equilibrio_cobertura || '—'}</Paragraph>
-                            </Col>
-                            <Col xs={24} md={8}>
-                              <Text strong>Calidad Periodística:</Text>
-                              <Paragraph>{analysis.calidad_periodistica || '—'}</Paragraph>
-                            </Col>
-                          </Row>
-                          {analysis.verificacion_necesaria && (
-                            <Alert
-                              message="⚠️ Verificación Necesaria"
-                              description={analysis.verificacion_necesaria}
-                              type="warning"
-                              showIcon
-                              style={{ marginTop: 12 }}
-                            />
+                          {analysis.headline_titles.length > 0 && (
+                            <ul style={{ margin: 0, paddingLeft: 20 }}>
+                              {analysis.headline_titles.map((title, idx) => (
+                                <li key={idx}>
+                                  <Text>{title}</Text>
+                                </li>
+                              ))}
+                            </ul>
                           )}
-                        </Card>
-
-                        {/* Sesgos */}
-                        {analysis.sesgos_identificados && (
-                          <Alert
-                            message="🎭 Sesgos Identificados"
-                            description={analysis.sesgos_identificados}
-                            type="warning"
-                            showIcon
-                          />
-                        )}
-
-                        {/* Geografía */}
-                        <Card size="small" title={<><GlobalOutlined /> Dimensión Geográfica</>}>
-                          <Row gutter={[16, 16]}>
-                            <Col xs={24} md={8}>
-                              <Text strong>Epicentro:</Text>
-                              <Paragraph>{analysis.epicentro_geografico || '—'}</Paragraph>
-                            </Col>
-                            <Col xs={24} md={8}>
-                              <Text strong>Alcance:</Text>
-                              <Tag color="blue">{analysis.alcance_geografico || 'No especificado'}</Tag>
-                            </Col>
-                            <Col xs={24} md={8}>
-                              {renderTagList('Zonas Afectadas', analysis.zonas_afectadas, 'green')}
-                            </Col>
-                          </Row>
-                        </Card>
-
-                        {/* Temas y Tendencias */}
-                        <Card size="small" title={<><FireOutlined /> Temas y Tendencias</>}>
-                          {renderTagList('🔥 Temas Dominantes', analysis.temas_dominantes, 'red')}
-                          {renderTagList('✨ Temas Emergentes', analysis.temas_emergentes, 'gold')}
-                          {renderTagList('🔑 Palabras Clave', analysis.palabras_clave_frecuentes, 'purple')}
-                          {renderTagList('#️⃣ Hashtags Tendencia', analysis.hashtags_tendencia, 'magenta')}
-                        </Card>
-
-                        {/* Impactos */}
-                        {renderImpacts(analysis)}
-
-                        {/* Escenarios */}
-                        {renderScenarios(analysis.escenarios_posibles)}
-
-                        {/* Eventos por Vigilar */}
-                        {analysis.eventos_por_vigilar && renderInfoCard('📅 Eventos por Vigilar', analysis.eventos_por_vigilar)}
-
-                        {/* Aspectos Ignorados */}
-                        {analysis.aspectos_ignorados && (
-                          <Alert
-                            message="💡 Aspectos No Cubiertos"
-                            description={analysis.aspectos_ignorados}
-                            type="info"
-                            showIcon
-                          />
-                        )}
-                      </Space>
-                    </Card>
-                  ))}
-                </Space>
-              ),
-              style: { background: '#fff', marginBottom: 12, borderRadius: 16, border: '1px solid #f3f4f6' },
-            }))}
-          />
+                          <Button
+                            type="link"
+                            style={{ padding: 0, alignSelf: 'flex-start' }}
+                            loading={loadingDetail === analysis.id}
+                            onClick={() => toggleDetail(analysis.id)}
+                          >
+                            {details[analysis.id] ? 'Ocultar detalle' : 'Ver detalle'}
+                          </Button>
+
+                          {details[analysis.id] && renderDetail(details[analysis.id])}
+                        </Space>
+                      </Card>
+                    ))}
+                  </Space>
+                ),
+                style: { background: '#fff', marginBottom: 12, borderRadius: 16, border: '1px solid #f3f4f6' },
+              }))}
+            />
+            {nextCursor && (
+              <div style={{ textAlign: 'center', marginTop: 12 }}>
+                <Button onClick={() => fetchHistory(nextCursor)} loading={loading}>
+                  Cargar más
+                </Button>
+              </div>
+            )}
+          </>
         ) : (
           <Card>
             <Empty description="Aún no hay análisis guardados" />
@@ -11,7 +11,7 @@ import {
   Typography,
 } from 'antd'
 import { DashboardOutlined, FolderOpenOutlined, ReloadOutlined } from '@ant-design/icons'
-import { getInsights, runAnalysis } from '../api'
+import { getInsights, runAnalysisStream } from '../api'
 import type { Insight } from '../types'
 import { motion } from 'framer-motion'
 import { useNavigate } from 'react-router-dom'
@@ -49,7 +49,7 @@ const InsightsPage = () => {
   const fetchInsights = async () => {
     try {
       setLoading(true)
-      const data = await getInsights()
+      const data = await getInsights({ view: 'detail' })
       setInsights(data.items)
     } catch (error) {
       if (!isUnavailable(error)) {
@@ -73,17 +73,20 @@ const InsightsPage = () => {
       return
     }
     const total = selectedRowKeys.length
-    let interval: number | undefined
+    // El modelo devuelve ~5 insights, 5 oportunidades y 5 riesgos; la barra avanza con cada uno que llega
+    const expectedItems = 15
     try {
       setAnalyzing(true)
-      setProgress({ open: true, title: 'Generando análisis', current: 0, total, message: 'Enviando datos al modelo...' })
-      interval = window.setInterval(() => {
-        setProgress((prev) => {
-          const next = Math.min(prev.total - 1, prev.current + 1)
-          return { ...prev, current: next, message: `Procesando ${next} de ${prev.total}` }
-        })
-      }, 800)
-      await runAnalysis({ insight_ids: selectedRowKeys as number[], limit: total })
+      setProgress({ open: true, title: 'Generando análisis', current: 0, total: expectedItems, message: 'Enviando datos al modelo...' })
+      let received = 0
+      await runAnalysisStream({ insight_ids: selectedRowKeys as number[], limit: total }, ({ item }) => {
+        received += 1
+        setProgress((prev) => ({
+          ...prev,
+          current: Math.min(prev.total - 1, received),
+          message: item.titulo ? `Recibido: ${item.titulo}` : `Recibidos ${received} hallazgos`,
+        }))
+      })
       message.success('Análisis completado')
       setProgress((prev) => ({ ...prev, current: prev.total, message: 'Completado' }))
       navigate('/analysis')
@@ -95,7 +98,6 @@ const InsightsPage = () => {
       }
       message.error(mapApiError(error, 'Error al generar el análisis'))
     } finally {
-      if (interval) window.clearInterval(interval)
       setTimeout(() => setProgress({ open: false, title: '', current: 0, total: 0, message: '' }), 600)
       setAnalyzing(false)
     }
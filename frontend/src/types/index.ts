@@ -79,7 +79,8 @@ export interface InsightResponse {
 }
 
 export interface PaginatedInsights {
-  total: number
+  total?: number
+  next_cursor?: number | null
   items: Insight[]
 }
 
@@ -97,6 +98,11 @@ export interface AggregatedAnalysis {
   riesgos_reputacionales: SummaryItem[]
 }
 
+export interface AnalysisStreamItem {
+  section: 'insights' | 'oportunidades_negocio' | 'riesgos_reputacionales'
+  item: SummaryItem
+}
+
 export interface EnrichedAnalysis {
   // Campos nuevos del análisis periodístico enriquecido
   sintesis_general?: string | null
@@ -145,4 +151,22 @@ export interface AnalysisHistoryItem extends AggregatedAnalysis, EnrichedAnalysi
   insight_ids: number[]
 }
 
+export interface AnalysisSummary {
+  id: number
+  term?: string | null
+  count: number
+  mode?: string | null
+  llm_model?: string | null
+  insights_count: number
+  opportunities_count: number
+  risks_count: number
+  headline_titles: string[]
+  created_at: string
+}
+
+export interface AnalysisHistoryPage {
+  items: AnalysisSummary[]
+  next_cursor?: number | null
+}
+
 export type AggregatedResponse = AggregatedAnalysis & EnrichedAnalysis
@@ -1,31 +1,255 @@
 from __future__ import annotations
 
+import asyncio
+import atexit
+import functools
+import hashlib
+import importlib.util
 import json
+import logging
+import math
 import os
+import queue
+import random
+import re
 import sqlite3
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+import threading
+import time
+import unicodedata
+import uuid
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import Context, ContextVar, copy_context
+from datetime import datetime, timezone
+from decimal import Decimal
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
 
+import anyio.to_thread
+import numpy as np
 import requests
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 
+from classification import (
+    CLASSIFICATION_PROMPT_PREFIX,
+    CLASSIFICATION_SYSTEM_PROMPT,
+    normalize_classification,
+)
+from vector_index import VectorIndex, embed_text
+
 NEWS_SERVICE_URL = os.environ.get("NEWS_SERVICE_URL", "http://news_service:8080")
 OPENAI_API_URL = os.environ.get("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 LLM_MODEL = os.environ.get("LLM_MODEL", "gpt-4o-mini")
 OPENAI_TIMEOUT = int(os.environ.get("OPENAI_TIMEOUT", "120"))
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "2"))
+OPENAI_RETRY_BASE_SECONDS = float(os.environ.get("OPENAI_RETRY_BASE_SECONDS", "1.0"))
+OPENAI_RETRY_MAX_SECONDS = float(os.environ.get("OPENAI_RETRY_MAX_SECONDS", "30"))
+OPENAI_HEDGE_ENABLED = os.environ.get("OPENAI_HEDGE_ENABLED", "false").lower() in {"1", "true", "yes"}
+OPENAI_HEDGE_QUANTILE = float(os.environ.get("OPENAI_HEDGE_QUANTILE", "0.95"))
+OPENAI_HEDGE_MIN_DELAY_SECONDS = float(os.environ.get("OPENAI_HEDGE_MIN_DELAY_SECONDS", "2.0"))
+OPENAI_HEDGE_BUDGET_PER_MINUTE = int(os.environ.get("OPENAI_HEDGE_BUDGET_PER_MINUTE", "10"))
 DB_PATH = os.environ.get("INSIGHTS_DB_PATH", "/data/insights.db")
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", "65536"))
+# Postgres compartido por varias réplicas (esquema de serverless_lib/db.js); vacío = SQLite en INSIGHTS_DB_PATH
+POSTGRES_URL = os.environ.get("POSTGRES_URL") or os.environ.get("DATABASE_URL", "")
+POSTGRES_POOL_MIN = int(os.environ.get("POSTGRES_POOL_MIN", "1"))
+POSTGRES_POOL_MAX = int(os.environ.get("POSTGRES_POOL_MAX", "5"))
+POSTGRES_POOL_TIMEOUT = float(os.environ.get("POSTGRES_POOL_TIMEOUT", "30"))
 MAX_ARTICLES = int(os.environ.get("MAX_ARTICLES", "10"))
+ANALYSIS_SERVICE_URL = os.environ.get("ANALYSIS_SERVICE_URL", "http://analysis_service:8100")
+# /pipeline: "auto" importa news_service/analysis_service si están junto a este servicio, "http" nunca, "inprocess" siempre
+# En proceso sólo bajo petición explícita (auto/inprocess): el import ejecuta el arranque del otro servicio
+PIPELINE_NEWS_MODE = os.environ.get("PIPELINE_NEWS_MODE", "http").lower()
+PIPELINE_ANALYSIS_MODE = os.environ.get("PIPELINE_ANALYSIS_MODE", "http").lower()
+NEWS_SERVICE_DIR = os.environ.get(
+    "NEWS_SERVICE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "news_service")
+)
+ANALYSIS_SERVICE_DIR = os.environ.get(
+    "ANALYSIS_SERVICE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "analysis_service")
+)
+PIPELINE_MAX_WORKERS = int(os.environ.get("PIPELINE_MAX_WORKERS", "8"))
+VECTOR_INDEX_PATH = os.environ.get(
+    "VECTOR_INDEX_PATH", os.path.join(os.path.dirname(DB_PATH), "insight_vectors")
+)
+VECTOR_DIM = int(os.environ.get("VECTOR_DIM", "256"))
+VECTOR_NLIST = int(os.environ.get("VECTOR_NLIST", "256"))
+VECTOR_NPROBE = int(os.environ.get("VECTOR_NPROBE", "8"))
+VECTOR_TRAIN_THRESHOLD = int(os.environ.get("VECTOR_TRAIN_THRESHOLD", "20000"))
+PROMPT_CONTENT_TOKEN_BUDGET = int(os.environ.get("PROMPT_CONTENT_TOKEN_BUDGET", "900"))
+PROMPT_LEAD_PARAGRAPHS = int(os.environ.get("PROMPT_LEAD_PARAGRAPHS", "3"))
+CLASSIFY_MAX_RETRIES = int(os.environ.get("CLASSIFY_MAX_RETRIES", "2"))
+CLASSIFY_RETRY_BASE_SECONDS = float(os.environ.get("CLASSIFY_RETRY_BASE_SECONDS", "1.0"))
+LLM_LEDGER_BATCH_SIZE = int(os.environ.get("LLM_LEDGER_BATCH_SIZE", "50"))
+LLM_LEDGER_FLUSH_SECONDS = float(os.environ.get("LLM_LEDGER_FLUSH_SECONDS", "5"))
+# Trazas: fracción de peticiones muestreadas y destinos (JSONL y/o colector OTLP/HTTP, p. ej. :4318/v1/traces)
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.0"))
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH", "")
+TRACE_COLLECTOR_URL = os.environ.get("TRACE_COLLECTOR_URL", "")
+TRACE_FLUSH_SECONDS = float(os.environ.get("TRACE_FLUSH_SECONDS", "2"))
+TRACE_BATCH_SIZE = int(os.environ.get("TRACE_BATCH_SIZE", "1000"))
+TRACING_ENABLED = bool(TRACE_EXPORT_PATH or TRACE_COLLECTOR_URL)
+# Endpoints ligados al LLM: concurrencia máxima y cola de espera acotada; al desbordar responden 503 + Retry-After
+ADMISSION_LIMITS: Dict[str, Dict[str, int]] = json.loads(
+    os.environ.get(
+        "ADMISSION_LIMITS",
+        '{"/insights": {"concurrency": 8, "queue": 16}, "/insights/classify": {"concurrency": 8, "queue": 16},'
+        ' "/pipeline": {"concurrency": 4, "queue": 8}}',
+    )
+)
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT_SECONDS", "15"))
+# Hilos del threadpool que quedan libres para lecturas baratas aunque los endpoints del LLM estén al límite
+ADMISSION_READ_THREADS = int(os.environ.get("ADMISSION_READ_THREADS", "16"))
+ADMISSION_RETRY_AFTER_MAX_SECONDS = 120
+# USD por cada 1K tokens; los modelos sin precio (p. ej. locales) cuestan 0
+LLM_PRICES_PER_1K: Dict[str, Dict[str, float]] = json.loads(
+    os.environ.get(
+        "LLM_PRICES_PER_1K",
+        '{"gpt-4o-mini": {"input": 0.00015, "cached_input": 0.000075, "output": 0.0006},'
+        ' "gpt-4o": {"input": 0.0025, "cached_input": 0.00125, "output": 0.01}}',
+    )
+)
+TRIAGE_ENABLED = os.environ.get("TRIAGE_ENABLED", "true").lower() in {"1", "true", "yes"}
+TRIAGE_MIN_RELEVANCE = float(os.environ.get("TRIAGE_MIN_RELEVANCE", "0.2"))
+TRIAGE_MIN_CONTENT_CHARS = int(os.environ.get("TRIAGE_MIN_CONTENT_CHARS", "80"))
+TRIAGE_LANGUAGES = {
+    code.strip().lower() for code in os.environ.get("TRIAGE_LANGUAGES", "").split(",") if code.strip()
+}
+
+# Claves que produce el LLM de clasificación y que se guardan tal cual en `insights`
+LLM_FIELDS = (
+    "sentimiento",
+    "resumen",
+    "categoria",
+    "etiquetas",
+    "marca",
+    "entidad",
+    "idioma",
+    "confianza",
+    "relevancia",
+    "accion_recomendada",
+    "cita_clave",
+    "resumen_ejecutivo",
+    "tono",
+    "temas_principales",
+    "subtemas",
+    "stakeholders",
+    "impacto_social",
+    "impacto_economico",
+    "impacto_politico",
+    "palabras_clave_contextuales",
+    "trending_topics",
+    "analisis_competitivo",
+    "credibilidad_fuente",
+    "sesgo_detectado",
+    "localizacion_geografica",
+    "fuentes_citadas",
+    "datos_numericos",
+    "urgencia",
+    "audiencia_objetivo",
+)
+FACET_FIELDS = (
+    "etiquetas",
+    "temas_principales",
+    "subtemas",
+    "stakeholders",
+    "trending_topics",
+    "marca",
+    "entidad",
+)
+
+ROLLUP_DIMENSIONS = ("sentimiento", "tono", "urgencia", "categoria")
+ROLLUP_FACET_DIMENSIONS = ("marca", "entidad")
+
+INSIGHT_BASE_FIELDS = ("id", "term", "created_at")
+# Vista ligera por defecto de /insights/list y /history; "detail" omite sólo article_content
+INSIGHT_SUMMARY_FIELDS = (
+    "sentimiento",
+    "resumen",
+    "categoria",
+    "marca",
+    "entidad",
+    "tono",
+    "urgencia",
+    "relevancia",
+    "confianza",
+    "credibilidad_fuente",
+    "article_title",
+    "article_url",
+    "article_image",
+)
+
+logger = logging.getLogger("uvicorn.error")
 
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
 
-def get_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    conn.execute(
+LLM_USAGE_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS llm_usage (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at TEXT NOT NULL,
+        service TEXT NOT NULL,
+        endpoint TEXT,
+        term TEXT,
+        model TEXT NOT NULL,
+        prompt_tokens INTEGER,
+        cached_tokens INTEGER,
+        completion_tokens INTEGER,
+        latency_ms INTEGER NOT NULL,
+        retries INTEGER NOT NULL DEFAULT 0,
+        hedged INTEGER NOT NULL DEFAULT 0,
+        cache_hit INTEGER,
+        status TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_llm_usage_created_at ON llm_usage(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_llm_usage_term_created_at ON llm_usage(term, created_at)",
+)
+
+
+# Columnas añadidas a `insights` después del esquema original (SQLite y Postgres)
+INSIGHT_EXTRA_COLUMNS = {
+    "article_url": "article_url TEXT",
+    "article_image": "article_image TEXT",
+    "idioma": "idioma TEXT",
+    "confianza": "confianza REAL",
+    "relevancia": "relevancia INTEGER",
+    "accion_recomendada": "accion_recomendada TEXT",
+    "cita_clave": "cita_clave TEXT",
+    # Nuevos campos para análisis enriquecido con OpenAI
+    "resumen_ejecutivo": "resumen_ejecutivo TEXT",
+    "tono": "tono TEXT",
+    "temas_principales": "temas_principales TEXT",
+    "subtemas": "subtemas TEXT",
+    "stakeholders": "stakeholders TEXT",
+    "impacto_social": "impacto_social TEXT",
+    "impacto_economico": "impacto_economico TEXT",
+    "impacto_politico": "impacto_politico TEXT",
+    "palabras_clave_contextuales": "palabras_clave_contextuales TEXT",
+    "trending_topics": "trending_topics TEXT",
+    "analisis_competitivo": "analisis_competitivo TEXT",
+    "credibilidad_fuente": "credibilidad_fuente REAL",
+    "sesgo_detectado": "sesgo_detectado TEXT",
+    "localizacion_geografica": "localizacion_geografica TEXT",
+    "fuentes_citadas": "fuentes_citadas TEXT",
+    "datos_numericos": "datos_numericos TEXT",
+    "urgencia": "urgencia TEXT",
+    "audiencia_objetivo": "audiencia_objetivo TEXT",
+    # Resultado del triage local previo al LLM
+    "triage": "triage TEXT",
+}
+
+
+def migrate_base_schema(db: sqlite3.Connection) -> None:
+    db.execute(
         """
         CREATE TABLE IF NOT EXISTS insights (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -50,46 +274,809 @@ def get_connection() -> sqlite3.Connection:
         );
         """
     )
-    info = conn.execute("PRAGMA table_info(insights)").fetchall()
+    info = db.execute("PRAGMA table_info(insights)").fetchall()
     columns = {row[1] for row in info}
-    new_columns = {
-        "article_url": "article_url TEXT",
-        "article_image": "article_image TEXT",
-        "idioma": "idioma TEXT",
-        "confianza": "confianza REAL",
-        "relevancia": "relevancia INTEGER",
-        "accion_recomendada": "accion_recomendada TEXT",
-        "cita_clave": "cita_clave TEXT",
-        # Nuevos campos para análisis enriquecido con OpenAI
-        "resumen_ejecutivo": "resumen_ejecutivo TEXT",
-        "tono": "tono TEXT",
-        "temas_principales": "temas_principales TEXT",
-        "subtemas": "subtemas TEXT",
-        "stakeholders": "stakeholders TEXT",
-        "impacto_social": "impacto_social TEXT",
-        "impacto_economico": "impacto_economico TEXT",
-        "impacto_politico": "impacto_politico TEXT",
-        "palabras_clave_contextuales": "palabras_clave_contextuales TEXT",
-        "trending_topics": "trending_topics TEXT",
-        "analisis_competitivo": "analisis_competitivo TEXT",
-        "credibilidad_fuente": "credibilidad_fuente REAL",
-        "sesgo_detectado": "sesgo_detectado TEXT",
-        "localizacion_geografica": "localizacion_geografica TEXT",
-        "fuentes_citadas": "fuentes_citadas TEXT",
-        "datos_numericos": "datos_numericos TEXT",
-        "urgencia": "urgencia TEXT",
-        "audiencia_objetivo": "audiencia_objetivo TEXT",
-    }
     if "sentimiento" not in columns and "sentiment" in columns:
-        conn.execute("ALTER TABLE insights RENAME COLUMN sentiment TO sentimiento")
-        conn.commit()
-        info = conn.execute("PRAGMA table_info(insights)").fetchall()
-        columns = {row[1] for row in info}
-    for name, ddl in new_columns.items():
+        db.execute("ALTER TABLE insights RENAME COLUMN sentiment TO sentimiento")
+    for name, ddl in INSIGHT_EXTRA_COLUMNS.items():
         if name not in columns:
-            conn.execute(f"ALTER TABLE insights ADD COLUMN {ddl}")
-            conn.commit()
-    return conn
+            db.execute(f"ALTER TABLE insights ADD COLUMN {ddl}")
+
+
+def migrate_facets(db: sqlite3.Connection) -> None:
+    db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS insight_facets (
+            insight_id INTEGER NOT NULL REFERENCES insights(id) ON DELETE CASCADE,
+            field TEXT NOT NULL,
+            value TEXT NOT NULL,
+            value_key TEXT NOT NULL,
+            term TEXT,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (field, value_key, insight_id)
+        ) WITHOUT ROWID;
+        """
+    )
+    db.execute("CREATE INDEX IF NOT EXISTS idx_insight_facets_insight ON insight_facets(insight_id);")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_insight_facets_recent ON insight_facets(field, created_at);")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_insight_facets_term ON insight_facets(field, term, created_at);")
+    backfill_insight_facets(db)
+
+
+def migrate_rollups(db: sqlite3.Connection) -> None:
+    # Bases creadas antes de versionar el esquema pueden tener ya los agregados poblados
+    rollups_exist = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'insight_daily_metrics'"
+    ).fetchone()
+    db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS insight_daily_counts (
+            term TEXT NOT NULL,
+            day TEXT NOT NULL,
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (term, day, dimension, value)
+        ) WITHOUT ROWID;
+        """
+    )
+    db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS insight_daily_metrics (
+            term TEXT NOT NULL,
+            day TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            confianza_sum REAL NOT NULL DEFAULT 0,
+            confianza_n INTEGER NOT NULL DEFAULT 0,
+            relevancia_sum REAL NOT NULL DEFAULT 0,
+            relevancia_n INTEGER NOT NULL DEFAULT 0,
+            credibilidad_sum REAL NOT NULL DEFAULT 0,
+            credibilidad_n INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (term, day)
+        ) WITHOUT ROWID;
+        """
+    )
+    db.execute("CREATE INDEX IF NOT EXISTS idx_insight_daily_metrics_day ON insight_daily_metrics(day);")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_insight_daily_counts_day ON insight_daily_counts(dimension, day);")
+    if not rollups_exist:
+        backfill_insight_rollups(db)
+
+
+def migrate_insight_indexes(db: sqlite3.Connection) -> None:
+    db.execute("CREATE INDEX IF NOT EXISTS idx_insights_term_id ON insights(term, id);")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_insights_article_url ON insights(article_url);")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_insights_created_at ON insights(created_at);")
+
+
+def migrate_classification_runs(db: sqlite3.Connection) -> None:
+    db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS classification_runs (
+            run_id TEXT PRIMARY KEY,
+            term TEXT NOT NULL,
+            relevance_term TEXT,
+            status TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        """
+    )
+    db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS classification_run_items (
+            run_id TEXT NOT NULL REFERENCES classification_runs(run_id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            article_json TEXT NOT NULL,
+            status TEXT NOT NULL,
+            insight_id INTEGER,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (run_id, position)
+        ) WITHOUT ROWID;
+        """
+    )
+
+
+def migrate_classification_version(db: sqlite3.Connection) -> None:
+    db.execute("ALTER TABLE insights ADD COLUMN prompt_version TEXT")
+    db.execute("ALTER TABLE insights ADD COLUMN llm_model TEXT")
+    db.execute("ALTER TABLE insights ADD COLUMN classified_at TEXT")
+
+
+def migrate_llm_usage(db: sqlite3.Connection) -> None:
+    # IF NOT EXISTS: analysis_service también crea la tabla si arranca primero
+    for statement in LLM_USAGE_DDL:
+        db.execute(statement)
+
+
+# Orden fijo: la posición (1-based) es el valor de PRAGMA user_version tras aplicarla.
+# Sólo se añaden migraciones al final; nunca se reordenan ni se editan las ya publicadas.
+MIGRATIONS = (
+    migrate_base_schema,
+    migrate_facets,
+    migrate_rollups,
+    migrate_insight_indexes,
+    migrate_classification_runs,
+    migrate_classification_version,
+    migrate_llm_usage,
+)
+
+
+def run_migrations(db: sqlite3.Connection) -> None:
+    if db.execute("PRAGMA user_version").fetchone()[0] >= len(MIGRATIONS):
+        return
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        # Se relee dentro del lock de escritura por si otro proceso migró mientras tanto
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(db)
+            db.execute(f"PRAGMA user_version = {number}")
+            logger.info("Applied insights schema migration %s (%s)", number, migration.__name__)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+# Postgres: esquema de serverless_lib/db.js para `insights` más las tablas propias de los servicios Python.
+# DDL idempotente en lugar de user_version; el resto de tipos sigue al de SQLite (fechas como texto ISO).
+POSTGRES_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS insights (
+        id BIGSERIAL PRIMARY KEY,
+        term TEXT NOT NULL,
+        sentimiento TEXT,
+        resumen TEXT,
+        categoria TEXT,
+        etiquetas TEXT,
+        marca TEXT,
+        entidad TEXT,
+        article_title TEXT,
+        article_description TEXT,
+        article_content TEXT,
+        article_url TEXT,
+        article_image TEXT,
+        idioma TEXT,
+        confianza REAL,
+        relevancia INTEGER,
+        accion_recomendada TEXT,
+        cita_clave TEXT,
+        created_at TIMESTAMPTZ DEFAULT NOW()
+    )
+    """,
+    *(f"ALTER TABLE insights ADD COLUMN IF NOT EXISTS {ddl}" for ddl in INSIGHT_EXTRA_COLUMNS.values()),
+    "ALTER TABLE insights ADD COLUMN IF NOT EXISTS prompt_version TEXT",
+    "ALTER TABLE insights ADD COLUMN IF NOT EXISTS llm_model TEXT",
+    "ALTER TABLE insights ADD COLUMN IF NOT EXISTS classified_at TEXT",
+    "CREATE INDEX IF NOT EXISTS idx_insights_term_created ON insights(term, created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_insights_term_id ON insights(term, id)",
+    "CREATE INDEX IF NOT EXISTS idx_insights_article_url ON insights(article_url)",
+    "CREATE INDEX IF NOT EXISTS idx_insights_created_at ON insights(created_at)",
+    """
+    CREATE TABLE IF NOT EXISTS insight_facets (
+        insight_id BIGINT NOT NULL REFERENCES insights(id) ON DELETE CASCADE,
+        field TEXT NOT NULL,
+        value TEXT NOT NULL,
+        value_key TEXT NOT NULL,
+        term TEXT,
+        created_at TEXT NOT NULL,
+        PRIMARY KEY (field, value_key, insight_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_insight_facets_insight ON insight_facets(insight_id)",
+    "CREATE INDEX IF NOT EXISTS idx_insight_facets_recent ON insight_facets(field, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_insight_facets_term ON insight_facets(field, term, created_at)",
+    """
+    CREATE TABLE IF NOT EXISTS insight_daily_counts (
+        term TEXT NOT NULL,
+        day TEXT NOT NULL,
+        dimension TEXT NOT NULL,
+        value TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (term, day, dimension, value)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS insight_daily_metrics (
+        term TEXT NOT NULL,
+        day TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        confianza_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+        confianza_n INTEGER NOT NULL DEFAULT 0,
+        relevancia_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+        relevancia_n INTEGER NOT NULL DEFAULT 0,
+        credibilidad_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+        credibilidad_n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (term, day)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_insight_daily_metrics_day ON insight_daily_metrics(day)",
+    "CREATE INDEX IF NOT EXISTS idx_insight_daily_counts_day ON insight_daily_counts(dimension, day)",
+    """
+    CREATE TABLE IF NOT EXISTS classification_runs (
+        run_id TEXT PRIMARY KEY,
+        term TEXT NOT NULL,
+        relevance_term TEXT,
+        status TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS classification_run_items (
+        run_id TEXT NOT NULL REFERENCES classification_runs(run_id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        article_json TEXT NOT NULL,
+        status TEXT NOT NULL,
+        insight_id BIGINT,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT NOT NULL,
+        PRIMARY KEY (run_id, position)
+    )
+    """,
+    *(statement.replace("INTEGER PRIMARY KEY AUTOINCREMENT", "BIGSERIAL PRIMARY KEY") for statement in LLM_USAGE_DDL),
+)
+
+
+def ensure_postgres_schema(db: "PostgresConnection") -> None:
+    # Insights guardados antes por serverless_lib no tienen facetas ni agregados: se calculan una sola vez
+    rollups_exist = db.execute("SELECT to_regclass('insight_daily_metrics')").fetchone()[0] is not None
+    for statement in POSTGRES_SCHEMA:
+        db.execute(statement)
+    if not rollups_exist:
+        backfill_insight_facets(db)
+        backfill_insight_rollups(db)
+
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_OTLP_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+
+class Span:
+    """One timed step of a request trace (W3C trace-context ids); only sampled spans are exported."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "sampled", "attributes", "status", "start", "_clock")
+
+    def __init__(
+        self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool, kind: str, attributes: Dict[str, Any]
+    ):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.sampled = sampled
+        self.attributes = attributes
+        self.status = "ok"
+        self.start = time.time()
+        self._clock = time.perf_counter()
+
+    def fail(self, exc: BaseException) -> None:
+        self.status = "error"
+        self.attributes["error"] = f"{type(exc).__name__}: {getattr(exc, 'detail', exc)}"[:300]
+
+    def finish(self) -> None:
+        if not self.sampled:
+            return
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "service": SERVICE_NAME,
+            "name": self.name,
+            "kind": self.kind,
+            "start": round(self.start, 6),
+            "duration_ms": round((time.perf_counter() - self._clock) * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+        with _trace_lock:
+            _trace_buffer.append(record)
+            full = len(_trace_buffer) >= TRACE_BATCH_SIZE
+        if full:
+            flush_traces()
+
+
+# Span activo de la petición en curso; los hilos lanzados con copy_context lo heredan
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_trace_lock = threading.Lock()
+_trace_buffer: List[Dict[str, Any]] = []
+
+
+def start_trace(name: str, traceparent: Optional[str]) -> Span:
+    """Root span of an incoming request: continue the caller's trace or start one, sampled at TRACE_SAMPLE_RATE."""
+    match = _TRACEPARENT_RE.match((traceparent or "").strip().lower())
+    if match:
+        trace_id, parent_id, flags = match.groups()
+        return Span(name, trace_id, parent_id, bool(int(flags, 16) & 1), "server", {})
+    return Span(name, os.urandom(16).hex(), None, random.random() < TRACE_SAMPLE_RATE, "server", {})
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes: Any) -> Iterator[Optional[Span]]:
+    """Child of the current span; a no-op (yields None) outside a sampled request."""
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        yield None
+        return
+    current = Span(name, parent.trace_id, parent.span_id, True, kind, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.fail(exc)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish()
+
+
+def traced(name: Optional[str] = None, kind: str = "internal") -> Callable:
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name or func.__name__, kind):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def trace_headers() -> Dict[str, str]:
+    """``traceparent`` for outgoing calls to our other services, carrying the sampling decision."""
+    current = _current_span.get()
+    if current is None:
+        return {}
+    return {"traceparent": f"00-{current.trace_id}-{current.span_id}-{'01' if current.sampled else '00'}"}
+
+
+class TracedConnection(sqlite3.Connection):
+    """sqlite3 connection that records every statement as a span while a sampled request is running."""
+
+    def execute(self, sql: str, parameters: Any = (), /) -> sqlite3.Cursor:
+        with span(f"sqlite {sql.split(None, 1)[0].upper()}", statement=" ".join(sql.split())[:300]):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql: str, parameters: Any, /) -> sqlite3.Cursor:
+        with span(f"sqlite {sql.split(None, 1)[0].upper()}", statement=" ".join(sql.split())[:300], many=True):
+            return super().executemany(sql, parameters)
+
+
+def otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_span(record: Dict[str, Any]) -> Dict[str, Any]:
+    start = int(record["start"] * 1e9)
+    return {
+        "traceId": record["trace_id"],
+        "spanId": record["span_id"],
+        "parentSpanId": record["parent_id"] or "",
+        "name": record["name"],
+        "kind": _OTLP_KINDS.get(record["kind"], 1),
+        "startTimeUnixNano": str(start),
+        "endTimeUnixNano": str(start + int(record["duration_ms"] * 1e6)),
+        "attributes": [{"key": key, "value": otlp_value(value)} for key, value in record["attributes"].items()],
+        "status": {"code": 2 if record["status"] == "error" else 1},
+    }
+
+
+def flush_traces() -> None:
+    """Append buffered spans to TRACE_EXPORT_PATH (JSONL) and/or POST them to an OTLP/HTTP collector."""
+    with _trace_lock:
+        records = list(_trace_buffer)
+        _trace_buffer.clear()
+    if not records:
+        return
+    if TRACE_EXPORT_PATH:
+        lines = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+        try:
+            # Un único write con O_APPEND: varios workers pueden compartir el archivo sin mezclar líneas
+            fd = os.open(TRACE_EXPORT_PATH, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, lines.encode("utf-8"))
+            finally:
+                os.close(fd)
+        except OSError as exc:
+            logger.warning("Could not write %s spans to %s: %s", len(records), TRACE_EXPORT_PATH, exc)
+    if TRACE_COLLECTOR_URL:
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                    "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": [otlp_span(record) for record in records]}],
+                }
+            ]
+        }
+        try:
+            requests.post(TRACE_COLLECTOR_URL, json=payload, timeout=5).raise_for_status()
+        except requests.RequestException as exc:
+            logger.warning("Could not export %s spans to %s: %s", len(records), TRACE_COLLECTOR_URL, exc)
+
+
+def trace_flush_loop() -> None:
+    while True:
+        time.sleep(TRACE_FLUSH_SECONDS)
+        flush_traces()
+
+
+class Database:
+    """WAL-mode access to ``insights.db``: one read connection per thread and a single serialized writer.
+
+    Other processes (analysis_service, extra uvicorn workers) open their own ``Database``; WAL lets their
+    readers proceed during writes, and ``BEGIN IMMEDIATE`` plus ``busy_timeout`` queue the writers.
+    """
+
+    dialect = "sqlite"
+    Error = sqlite3.Error
+
+    def __init__(self, path: str, setup: Optional[Callable[[sqlite3.Connection], None]] = None):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._writer = self._open()
+        # journal_mode se guarda en el archivo: basta con fijarlo desde la conexión de escritura
+        self.journal_mode = self._writer.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        if setup is not None:
+            with self._write_lock:
+                setup(self._writer)
+
+    def _open(self, query_only: bool = False) -> sqlite3.Connection:
+        db = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+            isolation_level=None,
+            factory=TracedConnection if TRACING_ENABLED else sqlite3.Connection,
+        )
+        db.row_factory = sqlite3.Row
+        db.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        db.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        db.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        db.execute(f"PRAGMA cache_size = {-SQLITE_CACHE_SIZE_KB}")
+        db.execute("PRAGMA temp_store = MEMORY")
+        if query_only:
+            db.execute("PRAGMA query_only = ON")
+        return db
+
+    def reader(self) -> sqlite3.Connection:
+        """Connection for the calling thread; inside ``write()`` it is the writer, so reads see own changes."""
+        if getattr(self._local, "writing", False):
+            return self._writer
+        db = getattr(self._local, "conn", None)
+        if db is None:
+            db = self._local.conn = self._open(query_only=True)
+        return db
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        """Serialize writers of this process and run the block in one ``BEGIN IMMEDIATE`` transaction."""
+        with span("sqlite.write"), self._write_lock:
+            if self._writer.in_transaction:
+                # Bloque anidado: la transacción exterior confirma o deshace
+                yield self._writer
+                return
+            self._writer.execute("BEGIN IMMEDIATE")
+            self._local.writing = True
+            try:
+                yield self._writer
+            except BaseException:
+                self._writer.rollback()
+                raise
+            else:
+                self._writer.commit()
+            finally:
+                self._local.writing = False
+
+    def columns(self, table: str) -> List[str]:
+        return [row[1] for row in self.reader().execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+class PostgresRow(tuple):
+    """Result row readable by position, by column name and as ``dict(row)``, like ``sqlite3.Row``."""
+
+    def __new__(cls, values: Iterable[Any], index: Dict[str, int]) -> "PostgresRow":
+        row = super().__new__(cls, values)
+        row._index = index
+        return row
+
+    def __getitem__(self, key: Any) -> Any:
+        return super().__getitem__(self._index[key] if isinstance(key, str) else key)
+
+    def keys(self) -> List[str]:
+        return list(self._index)
+
+
+def postgres_value(value: Any) -> Any:
+    """Values as the SQLite code reads them: naive UTC ISO timestamps, JSON/arrays as text, plain numbers."""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def postgres_row_factory(cursor: Any) -> Callable[[Any], PostgresRow]:
+    index = {column.name: position for position, column in enumerate(cursor.description or [])}
+    return lambda values: PostgresRow((postgres_value(value) for value in values), index)
+
+
+_POSTGRES_PARAM_RE = re.compile(r"'(?:[^']|'')*'|\?|%")
+
+
+def postgres_sql(sql: str) -> str:
+    """``?`` placeholders to psycopg's ``%s``; every literal ``%`` (also inside quotes) is doubled."""
+    return _POSTGRES_PARAM_RE.sub(lambda match: "%s" if match.group() == "?" else match.group().replace("%", "%%"), sql)
+
+
+class PostgresConnection:
+    """The part of ``sqlite3.Connection`` the service uses (``execute``/``executemany``) over a psycopg connection."""
+
+    def __init__(self, conn: Any):
+        self.conn = conn
+
+    def execute(self, sql: str, parameters: Any = ()) -> Any:
+        with span(f"postgres {sql.split(None, 1)[0].upper()}", statement=" ".join(sql.split())[:300]):
+            cursor = self.conn.cursor()
+            if parameters:
+                cursor.execute(postgres_sql(sql), parameters)
+            else:
+                cursor.execute(sql)
+            return cursor
+
+    def executemany(self, sql: str, parameters: Any) -> Any:
+        with span(f"postgres {sql.split(None, 1)[0].upper()}", statement=" ".join(sql.split())[:300], many=True):
+            cursor = self.conn.cursor()
+            cursor.executemany(postgres_sql(sql), parameters)
+            return cursor
+
+
+class PostgresRows:
+    """Fully fetched result of an autocommit read; the pooled connection is already back in the pool."""
+
+    def __init__(self, rows: List[PostgresRow], rowcount: int):
+        self._rows = rows
+        self._position = 0
+        self.rowcount = rowcount
+
+    def fetchmany(self, size: int = 1) -> List[PostgresRow]:
+        batch = self._rows[self._position : self._position + size]
+        self._position += len(batch)
+        return batch
+
+    def fetchone(self) -> Optional[PostgresRow]:
+        batch = self.fetchmany(1)
+        return batch[0] if batch else None
+
+    def fetchall(self) -> List[PostgresRow]:
+        return self.fetchmany(len(self._rows))
+
+    def __iter__(self) -> Iterator[PostgresRow]:
+        return iter(self.fetchall())
+
+
+class PostgresReader:
+    """``reader()`` outside a write: each statement borrows a pooled connection only while it runs."""
+
+    def __init__(self, pool: Any):
+        self._pool = pool
+
+    def execute(self, sql: str, parameters: Any = ()) -> PostgresRows:
+        with self._pool.connection() as conn:
+            cursor = PostgresConnection(conn).execute(sql, parameters)
+            return PostgresRows(cursor.fetchall() if cursor.description else [], cursor.rowcount)
+
+
+class PostgresDatabase:
+    """Pooled access to a shared Postgres, so several replicas (and their workers) use one store.
+
+    Same interface as ``Database``: ``reader()`` runs autocommit reads on any pooled connection and
+    ``write()`` one transaction; queries are written once with ``?`` placeholders for both backends.
+    """
+
+    dialect = "postgres"
+
+    def __init__(self, url: str, setup: Optional[Callable[[PostgresConnection], None]] = None):
+        import psycopg
+        from psycopg_pool import ConnectionPool
+
+        self.Error = psycopg.Error
+        self.path = url.rsplit("@", 1)[-1]
+        self._local = threading.local()
+        self._pool = ConnectionPool(
+            url,
+            min_size=POSTGRES_POOL_MIN,
+            max_size=POSTGRES_POOL_MAX,
+            timeout=POSTGRES_POOL_TIMEOUT,
+            # Sesión en UTC: los TIMESTAMPTZ se leen como el texto ISO sin zona que escribe SQLite
+            kwargs={"autocommit": True, "row_factory": postgres_row_factory, "options": "-c TimeZone=UTC"},
+            check=ConnectionPool.check_connection,
+            name=SERVICE_NAME,
+            open=True,
+        )
+        self._reader = PostgresReader(self._pool)
+        if setup is not None:
+            with self.write() as db:
+                # Réplicas que arrancan a la vez: el DDL se aplica de una en una
+                db.execute("SELECT pg_advisory_xact_lock(?)", (POSTGRES_SCHEMA_LOCK,))
+                setup(db)
+
+    def reader(self) -> Any:
+        """Inside ``write()`` the thread's transaction, so reads see own changes; otherwise pooled autocommit reads."""
+        return getattr(self._local, "conn", None) or self._reader
+
+    @contextmanager
+    def write(self) -> Iterator[PostgresConnection]:
+        """Run the block in one transaction on a pooled connection; a nested block joins the outer one."""
+        current = getattr(self._local, "conn", None)
+        if current is not None:
+            yield current
+            return
+        with span("postgres.write"), self._pool.connection() as conn, conn.transaction():
+            self._local.conn = PostgresConnection(conn)
+            try:
+                yield self._local.conn
+            finally:
+                self._local.conn = None
+
+    def columns(self, table: str) -> List[str]:
+        rows = self.reader().execute(
+            """
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = ?
+            ORDER BY ordinal_position
+            """,
+            (table,),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+
+def split_facet_values(raw: Any) -> List[str]:
+    if raw is None:
+        return []
+    items = raw if isinstance(raw, list) else str(raw).split(",")
+    values: List[str] = []
+    seen: set[str] = set()
+    for item in items:
+        value = str(item).strip().strip('"').strip()
+        key = value.lower()
+        if not value or key in {"null", "none", "n/a"} or key in seen:
+            continue
+        seen.add(key)
+        values.append(value)
+    return values
+
+
+def insert_insight_facets(
+    db: sqlite3.Connection, insight_id: int, term: Optional[str], created_at: str, data: Dict[str, Any]
+) -> None:
+    rows = [
+        (insight_id, field, value, value.lower(), term, created_at)
+        for field in FACET_FIELDS
+        for value in split_facet_values(data.get(field))
+    ]
+    if rows:
+        db.executemany(
+            """
+            INSERT INTO insight_facets (insight_id, field, value, value_key, term, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT DO NOTHING
+            """,
+            rows,
+        )
+
+
+def as_number(raw: Any) -> Optional[float]:
+    try:
+        return float(raw) if raw is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def update_insight_rollups(
+    db: sqlite3.Connection, term: str, created_at: str, data: Dict[str, Any], delta: int = 1
+) -> None:
+    """Add (``delta=1``) or remove (``delta=-1``) one insight's contribution to the daily rollups."""
+    day = created_at[:10]
+    metrics = {
+        "confianza": as_number(data.get("confianza")),
+        "relevancia": as_number(data.get("relevancia")),
+        "credibilidad": as_number(data.get("credibilidad_fuente")),
+    }
+    db.execute(
+        """
+        INSERT INTO insight_daily_metrics (
+            term, day, total, confianza_sum, confianza_n, relevancia_sum, relevancia_n,
+            credibilidad_sum, credibilidad_n
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (term, day) DO UPDATE SET
+            total = insight_daily_metrics.total + excluded.total,
+            confianza_sum = insight_daily_metrics.confianza_sum + excluded.confianza_sum,
+            confianza_n = insight_daily_metrics.confianza_n + excluded.confianza_n,
+            relevancia_sum = insight_daily_metrics.relevancia_sum + excluded.relevancia_sum,
+            relevancia_n = insight_daily_metrics.relevancia_n + excluded.relevancia_n,
+            credibilidad_sum = insight_daily_metrics.credibilidad_sum + excluded.credibilidad_sum,
+            credibilidad_n = insight_daily_metrics.credibilidad_n + excluded.credibilidad_n
+        """,
+        (
+            term,
+            day,
+            delta,
+            delta * (metrics["confianza"] or 0.0),
+            delta * int(metrics["confianza"] is not None),
+            delta * (metrics["relevancia"] or 0.0),
+            delta * int(metrics["relevancia"] is not None),
+            delta * (metrics["credibilidad"] or 0.0),
+            delta * int(metrics["credibilidad"] is not None),
+        ),
+    )
+    counts: List[tuple] = []
+    for dimension in ROLLUP_DIMENSIONS:
+        value = data.get(dimension)
+        if value is not None and str(value).strip():
+            counts.append((term, day, dimension, str(value).strip().lower(), delta))
+    for dimension in ROLLUP_FACET_DIMENSIONS:
+        counts.extend((term, day, dimension, value, delta) for value in split_facet_values(data.get(dimension)))
+    if counts:
+        db.executemany(
+            """
+            INSERT INTO insight_daily_counts (term, day, dimension, value, count)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (term, day, dimension, value) DO UPDATE SET count = insight_daily_counts.count + excluded.count
+            """,
+            counts,
+        )
+    if delta < 0:
+        db.execute("DELETE FROM insight_daily_counts WHERE term = ? AND day = ? AND count <= 0", (term, day))
+
+
+def backfill_insight_rollups(db: sqlite3.Connection) -> None:
+    dimensions = ", ".join(ROLLUP_DIMENSIONS + ROLLUP_FACET_DIMENSIONS)
+    cursor = db.execute(
+        f"SELECT term, created_at, confianza, relevancia, credibilidad_fuente, {dimensions} FROM insights ORDER BY id"
+    )
+    while True:
+        batch = cursor.fetchmany(500)
+        if not batch:
+            break
+        for row in batch:
+            update_insight_rollups(db, row["term"], row["created_at"], dict(row))
+
+
+def replace_insight_facets(
+    db: sqlite3.Connection, insight_id: int, term: Optional[str], created_at: str, data: Dict[str, Any]
+) -> None:
+    db.execute("DELETE FROM insight_facets WHERE insight_id = ?", (insight_id,))
+    insert_insight_facets(db, insight_id, term, created_at, data)
+
+
+def backfill_insight_facets(db: sqlite3.Connection) -> None:
+    columns = ", ".join(FACET_FIELDS)
+    cursor = db.execute(f"SELECT id, term, created_at, {columns} FROM insights ORDER BY id")
+    count = 0
+    while True:
+        batch = cursor.fetchmany(500)
+        if not batch:
+            break
+        for row in batch:
+            insert_insight_facets(db, row["id"], row["term"], row["created_at"], dict(row))
+        count += len(batch)
+    if count:
+        logger.info("Backfilled facets for %s existing insights", count)
 
 
 def parse_llm_json(raw_text: str) -> Dict[str, Any]:
@@ -102,7 +1089,178 @@ def parse_llm_json(raw_text: str) -> Dict[str, Any]:
     return json.loads(cleaned)
 
 
-def post_openai_json(system_prompt: str, user_prompt: str) -> Dict[str, Any]:
+SERVICE_NAME = "insights_service"
+# Clave de pg_advisory_xact_lock con la que todos los servicios serializan su DDL al arrancar
+POSTGRES_SCHEMA_LOCK = 720451
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+HEDGE_MIN_SAMPLES = 20
+
+_llm_stats_lock = threading.Lock()
+_llm_latencies: Deque[float] = deque(maxlen=500)
+_hedges_fired_at: Deque[float] = deque()
+llm_call_stats = {"calls": 0, "retries": 0, "hedges_fired": 0, "hedges_won": 0, "hedges_over_budget": 0}
+_hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+
+
+class LLMUnavailableError(HTTPException):
+    """Transient LLM failure (429/5xx/timeout) that already used up its transport retries."""
+
+
+def count_llm_event(name: str) -> None:
+    with _llm_stats_lock:
+        llm_call_stats[name] += 1
+
+
+def latency_quantile(ordered: List[float], quantile: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+def hedge_delay() -> Optional[float]:
+    with _llm_stats_lock:
+        if len(_llm_latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(_llm_latencies)
+    return max(latency_quantile(ordered, OPENAI_HEDGE_QUANTILE), OPENAI_HEDGE_MIN_DELAY_SECONDS)
+
+
+def acquire_hedge_slot() -> bool:
+    now = time.monotonic()
+    with _llm_stats_lock:
+        while _hedges_fired_at and now - _hedges_fired_at[0] > 60:
+            _hedges_fired_at.popleft()
+        if len(_hedges_fired_at) >= OPENAI_HEDGE_BUDGET_PER_MINUTE:
+            llm_call_stats["hedges_over_budget"] += 1
+            return False
+        _hedges_fired_at.append(now)
+        llm_call_stats["hedges_fired"] += 1
+    return True
+
+
+def retry_after_seconds(response: Optional[requests.Response]) -> Optional[float]:
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def send_openai_request(payload: Dict[str, Any], headers: Dict[str, str]) -> requests.Response:
+    started = time.monotonic()
+    response = requests.post(OPENAI_API_URL, json=payload, headers=headers, timeout=OPENAI_TIMEOUT)
+    response.raise_for_status()
+    with _llm_stats_lock:
+        _llm_latencies.append(time.monotonic() - started)
+    return response
+
+
+def send_with_hedge(payload: Dict[str, Any], headers: Dict[str, str]) -> Tuple[requests.Response, bool]:
+    """Send once; if no answer after the recent p95 latency, race a duplicate and keep the first success."""
+    delay = hedge_delay() if OPENAI_HEDGE_ENABLED else None
+    if delay is None:
+        return send_openai_request(payload, headers), False
+    primary = _hedge_executor.submit(send_openai_request, payload, headers)
+    done, _ = wait([primary], timeout=delay)
+    if done or not acquire_hedge_slot():
+        return primary.result(), False
+    hedge = _hedge_executor.submit(send_openai_request, payload, headers)
+    pending = {primary, hedge}
+    error: Optional[requests.RequestException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                response = future.result()
+            except requests.RequestException as exc:
+                error = exc
+                continue
+            if future is hedge:
+                count_llm_event("hedges_won")
+            return response, True
+    raise error
+
+
+def llm_stats_snapshot() -> Dict[str, Any]:
+    with _llm_stats_lock:
+        stats: Dict[str, Any] = dict(llm_call_stats)
+        ordered = sorted(_llm_latencies)
+    for label, quantile in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        value = latency_quantile(ordered, quantile)
+        stats[f"latency_{label}_seconds"] = round(value, 3) if value is not None else None
+    stats["hedge_win_rate"] = round(stats["hedges_won"] / stats["hedges_fired"], 3) if stats["hedges_fired"] else None
+    return stats
+
+
+# Endpoint y término de la petición en curso; lo fijan los endpoints para etiquetar el ledger
+llm_call_context: ContextVar[Dict[str, Optional[str]]] = ContextVar("llm_call_context", default={})
+_ledger_lock = threading.Lock()
+_ledger_buffer: List[tuple] = []
+
+
+def record_llm_usage(
+    usage: Optional[Dict[str, Any]], latency: float, retries: int, hedged: bool, status: str
+) -> None:
+    context = llm_call_context.get()
+    usage = usage or {}
+    cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    row = (
+        datetime.utcnow().isoformat(),
+        SERVICE_NAME,
+        context.get("endpoint"),
+        context.get("term"),
+        LLM_MODEL,
+        usage.get("prompt_tokens"),
+        cached_tokens,
+        usage.get("completion_tokens"),
+        int(latency * 1000),
+        retries,
+        int(hedged),
+        None if cached_tokens is None else int(cached_tokens > 0),
+        status,
+    )
+    with _ledger_lock:
+        _ledger_buffer.append(row)
+        full = len(_ledger_buffer) >= LLM_LEDGER_BATCH_SIZE
+    if full:
+        flush_llm_ledger()
+
+
+def flush_llm_ledger() -> None:
+    with _ledger_lock:
+        rows = list(_ledger_buffer)
+        _ledger_buffer.clear()
+    if not rows:
+        return
+    try:
+        with database.write() as db:
+            db.executemany(
+                """
+                INSERT INTO llm_usage (
+                    created_at, service, endpoint, term, model, prompt_tokens, cached_tokens,
+                    completion_tokens, latency_ms, retries, hedged, cache_hit, status
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+    except database.Error as exc:
+        logger.warning("Could not write %s LLM ledger rows: %s", len(rows), exc)
+
+
+def llm_ledger_flush_loop() -> None:
+    while True:
+        time.sleep(LLM_LEDGER_FLUSH_SECONDS)
+        flush_llm_ledger()
+        flush_colocated_services()
+
+
+def post_openai_completion(system_prompt: str, user_prompt: str) -> str:
     if not OPENAI_API_KEY:
         raise HTTPException(status_code=500, detail="OPENAI_API_KEY is not configured")
 
@@ -119,80 +1277,241 @@ def post_openai_json(system_prompt: str, user_prompt: str) -> Dict[str, Any]:
         "Authorization": f"Bearer {OPENAI_API_KEY}",
         "Content-Type": "application/json",
     }
+    count_llm_event("calls")
+    started = time.monotonic()
+    retries = 0
+    hedged = False
     try:
-        response = requests.post(OPENAI_API_URL, json=payload, headers=headers, timeout=OPENAI_TIMEOUT)
-        response.raise_for_status()
-    except requests.RequestException as exc:
-        raise HTTPException(status_code=502, detail=f"Failed to reach OpenAI API: {exc}") from exc
+        for attempt in range(OPENAI_MAX_RETRIES + 1):
+            try:
+                with span("llm.request", "client", model=LLM_MODEL, attempt=attempt + 1):
+                    response, hedged = send_with_hedge(payload, headers)
+                break
+            except requests.RequestException as exc:
+                failed = exc.response
+                if failed is not None and failed.status_code not in RETRYABLE_STATUS:
+                    raise HTTPException(status_code=502, detail=f"Failed to reach OpenAI API: {exc}") from exc
+                if attempt == OPENAI_MAX_RETRIES:
+                    raise LLMUnavailableError(status_code=502, detail=f"Failed to reach OpenAI API: {exc}") from exc
+                delay = retry_after_seconds(failed)
+                if delay is None:
+                    delay = random.uniform(0, OPENAI_RETRY_BASE_SECONDS * 2**attempt)
+                delay = min(delay, OPENAI_RETRY_MAX_SECONDS)
+                retries += 1
+                count_llm_event("retries")
+                logger.warning("OpenAI request failed (%s); retry %s in %.2fs", exc, attempt + 1, delay)
+                time.sleep(delay)
 
-    try:
-        body = response.json()
-        content = body["choices"][0]["message"]["content"]
-    except (ValueError, KeyError, IndexError, TypeError) as exc:
-        raise HTTPException(status_code=502, detail="OpenAI response missing expected content") from exc
+        try:
+            body = response.json()
+            content = body["choices"][0]["message"]["content"]
+        except (ValueError, KeyError, IndexError, TypeError) as exc:
+            raise HTTPException(status_code=502, detail="OpenAI response missing expected content") from exc
+    except HTTPException:
+        record_llm_usage(None, time.monotonic() - started, retries, hedged, "error")
+        raise
 
+    usage = body.get("usage") or {}
+    record_llm_usage(usage, time.monotonic() - started, retries, hedged, "ok")
+    logger.info(
+        "LLM usage: prompt_tokens=%s cached_tokens=%s completion_tokens=%s",
+        usage.get("prompt_tokens"),
+        (usage.get("prompt_tokens_details") or {}).get("cached_tokens"),
+        usage.get("completion_tokens"),
+    )
+
+    return content
+
+
+def post_openai_json(system_prompt: str, user_prompt: str) -> Dict[str, Any]:
+    content = post_openai_completion(system_prompt, user_prompt)
     try:
         return parse_llm_json(content)
     except (ValueError, json.JSONDecodeError) as exc:
         raise HTTPException(status_code=502, detail=f"Invalid JSON from OpenAI: {exc}") from exc
 
 
-def call_llm(article: Dict[str, Any]) -> Dict[str, Any]:
-    system_prompt = (
-        "Eres un analista experto en inteligencia de negocios que recibe noticias y genera análisis profundos y accionables. "
-        "Siempre respondes únicamente JSON válido siguiendo el esquema proporcionado."
+# Cambia cuando cambian las instrucciones; se guarda en cada insight para detectar filas desactualizadas
+PROMPT_VERSION = hashlib.sha256(
+    (CLASSIFICATION_SYSTEM_PROMPT + CLASSIFICATION_PROMPT_PREFIX).encode("utf-8")
+).hexdigest()[:12]
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?;])\s+|\n+")
+_TRUNCATION_MARKER_RE = re.compile(r"\s*\[\+\d+ chars\]\s*$")
+
+
+def estimate_tokens(text: str) -> int:
+    """Offline BPE approximation: one token per punctuation mark, ~5 characters per word piece."""
+    return sum(1 if not piece[0].isalnum() else 1 + (len(piece) - 1) // 5 for piece in _TOKEN_RE.findall(text))
+
+
+def compress_article_body(content: str, budget: int, known_texts: Iterable[str] = ()) -> str:
+    """Fit an article body into ``budget`` tokens.
+
+    Keeps the lead paragraphs first, drops sentences repeated in the body or already present in
+    the title/description, then spends any remaining budget on later sentences that carry figures.
+    """
+    content = _TRUNCATION_MARKER_RE.sub("", content or "").strip()
+    if not content or estimate_tokens(content) <= budget:
+        return content
+    seen = {" ".join(tokenize(text)) for text in known_texts if text}
+    paragraphs = [part.strip() for part in re.split(r"\n\s*\n", content) if part.strip()]
+    lead_count = max(1, PROMPT_LEAD_PARAGRAPHS)
+    ordered: List[tuple] = []  # (en párrafo de entrada, contiene cifras, frase)
+    for position, paragraph in enumerate(paragraphs):
+        for sentence in _SENTENCE_SPLIT_RE.split(paragraph):
+            sentence = sentence.strip()
+            key = " ".join(tokenize(sentence))
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            ordered.append((position < lead_count, bool(re.search(r"\d", sentence)), sentence))
+
+    lead = [index for index, (is_lead, _, _) in enumerate(ordered) if is_lead]
+    figures = [index for index, (is_lead, has_number, _) in enumerate(ordered) if not is_lead and has_number]
+    selected: List[int] = []
+    used = 0
+    for index in lead + figures:
+        cost = estimate_tokens(ordered[index][2])
+        if used + cost <= budget:
+            selected.append(index)
+            used += cost
+    if not selected and ordered:
+        words = ordered[0][2].split()
+        return " ".join(words[: max(1, budget * 3 // 4)])
+    return " ".join(ordered[index][2] for index in sorted(selected))
+
+
+def build_classification_prompt(article: Dict[str, Any]) -> str:
+    title = article.get("title") or ""
+    description = article.get("description") or ""
+    content = compress_article_body(article.get("content") or "", PROMPT_CONTENT_TOKEN_BUDGET, (title, description))
+    user_prompt = f"{CLASSIFICATION_PROMPT_PREFIX}Titulo: {title}\nDescripcion: {description}\nContenido: {content}\n"
+    logger.info(
+        "Classification prompt ~%s input tokens (content %s -> %s tokens)",
+        estimate_tokens(CLASSIFICATION_SYSTEM_PROMPT) + estimate_tokens(user_prompt),
+        estimate_tokens(article.get("content") or ""),
+        estimate_tokens(content),
     )
-    user_prompt = f"""
-Analiza esta noticia en profundidad y responde con JSON usando exactamente estas claves:
-
-{{
-  "sentimiento": "positivo|negativo|neutro|indeterminado",
-  "resumen": "resumen breve de 10 palabras para referencia rápida",
-  "resumen_ejecutivo": "resumen ejecutivo detallado de 50-100 palabras que capture la esencia, implicaciones y contexto del artículo",
-  "categoria": "politica|tecnologia|finanzas|deportes|entretenimiento|salud|ciencia|otros",
-  "etiquetas": "palabra1,palabra2,palabra3",
-  "marca": "marca principal mencionada o null",
-  "entidad": "nombre propio principal (persona u organización) distinto de la marca o null",
-  "idioma": "codigo ISO 639-1",
-  "confianza": 0.0-1.0,
-  "relevancia": 1-5,
-  "accion_recomendada": "recomendación estratégica específica basada en el contenido",
-  "cita_clave": "frase textual más relevante o impactante del artículo",
-  "tono": "formal|casual|urgente|alarmista|tecnico|optimista|pesimista|neutral",
-  "temas_principales": "tema1,tema2,tema3 - máximo 5 temas clave",
-  "subtemas": "subtema1,subtema2,subtema3 - temas secundarios relevantes",
-  "stakeholders": "stakeholder1,stakeholder2 - personas u organizaciones clave afectadas o mencionadas",
-  "impacto_social": "descripción del impacto o relevancia social, o null si no aplica",
-  "impacto_economico": "descripción del impacto económico o financiero, o null si no aplica",
-  "impacto_politico": "descripción del impacto político o regulatorio, o null si no aplica",
-  "palabras_clave_contextuales": "keyword1,keyword2,keyword3 - términos clave con contexto",
-  "trending_topics": "#hashtag1,#hashtag2 - hashtags o trending topics relacionados",
-  "analisis_competitivo": "análisis de competidores o comparativas mencionadas, o null",
-  "credibilidad_fuente": 0.0-1.0,
-  "sesgo_detectado": "politico_izquierda|politico_derecha|comercial|neutral|pro_marca|anti_marca",
-  "localizacion_geografica": "pais1,ciudad1,region1 - ubicaciones geográficas relevantes mencionadas",
-  "fuentes_citadas": "fuente1,fuente2 - estudios, expertos o fuentes citadas en el artículo",
-  "datos_numericos": "dato1: valor1, dato2: valor2 - estadísticas o números clave del artículo",
-  "urgencia": "baja|media|alta|critica",
-  "audiencia_objetivo": "B2B|B2C|gobierno|academico|general|profesional"
-}}
-
-Si un dato no existe o no es aplicable, usa null. No agregues texto adicional fuera del JSON.
-
-Titulo: {article.get('title') or ''}
-Descripcion: {article.get('description') or ''}
-Contenido: {article.get('content') or ''}
-"""
-    return post_openai_json(system_prompt, user_prompt)
+    return user_prompt
+
+
+def call_llm(article: Dict[str, Any]) -> Dict[str, Any]:
+    data = post_openai_json(CLASSIFICATION_SYSTEM_PROMPT, build_classification_prompt(article))
+    try:
+        return normalize_classification(data)
+    except ValueError as exc:
+        raise HTTPException(status_code=502, detail=f"Invalid JSON from OpenAI: {exc}") from exc
+
 
+LANGUAGE_STOPWORDS: Dict[str, set[str]] = {
+    "es": {"el", "la", "los", "las", "de", "del", "que", "y", "en", "un", "una", "por", "con", "para", "es", "se", "su", "al", "como", "mas"},
+    "en": {"the", "of", "and", "to", "in", "is", "that", "for", "on", "with", "as", "was", "by", "at", "from", "it", "an", "are", "be", "this"},
+    "pt": {"o", "os", "as", "do", "da", "dos", "das", "que", "e", "em", "um", "uma", "para", "com", "nao", "por", "mais", "no", "na", "foi"},
+    "fr": {"le", "la", "les", "des", "du", "et", "en", "un", "une", "est", "que", "pour", "dans", "sur", "pas", "au", "avec", "ce", "qui", "par"},
+    "de": {"der", "die", "das", "und", "ist", "nicht", "ein", "eine", "zu", "den", "mit", "von", "auf", "fur", "im", "dem", "sich", "des", "auch", "wird"},
+    "it": {"il", "lo", "gli", "della", "di", "che", "e", "un", "una", "per", "con", "non", "sono", "del", "alla", "nel", "anche", "come", "piu", "da"},
+}
+POSITIVE_LEXICON = {
+    "crece", "crecimiento", "exito", "gana", "ganancia", "ganancias", "mejora", "record", "logro", "innovacion",
+    "alianza", "premio", "beneficio", "beneficios", "positivo", "aumento", "recuperacion", "lidera", "celebra",
+    "growth", "success", "wins", "win", "gain", "gains", "improves", "improvement", "record", "award", "innovation",
+    "partnership", "profit", "profits", "positive", "surge", "recovery", "leads", "boost", "strong",
+}
+NEGATIVE_LEXICON = {
+    "crisis", "caida", "cae", "perdida", "perdidas", "fraude", "escandalo", "demanda", "multa", "despidos",
+    "quiebra", "denuncia", "riesgo", "falla", "fallo", "negativo", "protesta", "investigacion", "polemica", "ataque",
+    "loss", "losses", "fraud", "scandal", "lawsuit", "fine", "layoffs", "bankruptcy", "risk", "failure", "negative",
+    "protest", "investigation", "controversy", "attack", "decline", "drop", "falls", "crash", "breach", "recall",
+}
+_WORD_RE = re.compile(r"[a-z0-9#]+")
 
+
+def normalize_text(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD_RE.findall(normalize_text(text))
+
+
+def detect_language(tokens: List[str]) -> Optional[str]:
+    scores = {code: sum(1 for token in tokens if token in words) for code, words in LANGUAGE_STOPWORDS.items()}
+    best = max(scores, key=scores.get)
+    if scores[best] < 2:
+        return None
+    return best
+
+
+def score_term_relevance(term: str, title: str, body: str) -> float:
+    term_tokens = [token for token in tokenize(term) if len(token) > 1]
+    if not term_tokens:
+        return 1.0
+    phrase = " ".join(term_tokens)
+    title_text = " ".join(tokenize(title))
+    body_text = " ".join(tokenize(body))
+    if phrase in title_text:
+        return 1.0
+    if phrase in body_text:
+        return 0.8
+    title_words = set(title_text.split())
+    body_words = set(body_text.split())
+    in_title = sum(1 for token in term_tokens if token in title_words)
+    in_body = sum(1 for token in term_tokens if token in body_words)
+    return round(min(0.7, 0.5 * in_title / len(term_tokens) + 0.3 * in_body / len(term_tokens)), 3)
+
+
+def estimate_sentiment(tokens: List[str]) -> str:
+    positive = sum(1 for token in tokens if token in POSITIVE_LEXICON)
+    negative = sum(1 for token in tokens if token in NEGATIVE_LEXICON)
+    if positive == negative:
+        return "neutro" if tokens else "indeterminado"
+    return "positivo" if positive > negative else "negativo"
+
+
+def article_dedup_key(article: Dict[str, Any]) -> str:
+    return normalize_text(article.get("url") or article.get("title") or "").split("?")[0].strip()
+
+
+def triage_article(
+    term: Optional[str], article: Dict[str, Any], seen_keys: set[str]
+) -> Dict[str, Any]:
+    """Cheap deterministic checks that decide whether an article deserves an LLM call."""
+    title = article.get("title") or ""
+    body = " ".join(filter(None, [article.get("description"), article.get("content")]))
+    tokens = tokenize(f"{title} {body}")
+    score = score_term_relevance(term, title, body) if term else 1.0
+    result: Dict[str, Any] = {
+        "idioma": detect_language(tokens),
+        "sentimiento": estimate_sentiment(tokens),
+        "relevancia": 1 + round(score * 4),
+        "score": score,
+        "reason": "llm",
+    }
+    dedup_key = article_dedup_key(article)
+    if dedup_key and dedup_key in seen_keys:
+        result["reason"] = "duplicado"
+    elif len(title) + len(body) < TRIAGE_MIN_CONTENT_CHARS:
+        result["reason"] = "contenido_insuficiente"
+    elif TRIAGE_LANGUAGES and result["idioma"] and result["idioma"] not in TRIAGE_LANGUAGES:
+        result["reason"] = "idioma_no_monitoreado"
+    elif score < TRIAGE_MIN_RELEVANCE:
+        result["reason"] = "baja_relevancia"
+    if dedup_key:
+        seen_keys.add(dedup_key)
+    return result
+
+
+@traced("fetch_news", "client")
 def fetch_news(term: str, language: Optional[str] = None) -> List[Dict[str, Any]]:
     params = {"term": term}
     if language:
         params["language"] = language
 
     try:
-        response = requests.get(f"{NEWS_SERVICE_URL}/news", params=params, timeout=60)
+        response = requests.get(f"{NEWS_SERVICE_URL}/news", params=params, headers=trace_headers(), timeout=60)
         response.raise_for_status()
     except requests.RequestException as exc:
         raise HTTPException(status_code=502, detail=f"Failed to reach news service: {exc}") from exc
@@ -201,107 +1520,971 @@ def fetch_news(term: str, language: Optional[str] = None) -> List[Dict[str, Any]
     return payload.get("articles", [])[:MAX_ARTICLES]
 
 
-def store_insight_record(term: str, article: Dict[str, Any], llm_data: Dict[str, Any]) -> int:
+@traced()
+def store_insight_record(
+    term: str, article: Dict[str, Any], llm_data: Dict[str, Any], triage: Optional[str] = None
+) -> int:
     now = datetime.utcnow().isoformat()
-    cursor = conn.execute(
+    classified = triage in (None, "llm")
+    with database.write() as db:
+        cursor = db.execute(
+            """
+            INSERT INTO insights (
+                term, sentimiento, resumen, categoria, etiquetas, marca, entidad,
+                article_title, article_description, article_content, article_url,
+                article_image, idioma, confianza, relevancia, accion_recomendada, cita_clave,
+                resumen_ejecutivo, tono, temas_principales, subtemas, stakeholders,
+                impacto_social, impacto_economico, impacto_politico, palabras_clave_contextuales,
+                trending_topics, analisis_competitivo, credibilidad_fuente, sesgo_detectado,
+                localizacion_geografica, fuentes_citadas, datos_numericos, urgencia, audiencia_objetivo,
+                triage, prompt_version, llm_model, classified_at, created_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            RETURNING id
+            """,
+            (
+                term,
+                llm_data.get("sentimiento"),
+                llm_data.get("resumen"),
+                llm_data.get("categoria"),
+                llm_data.get("etiquetas"),
+                llm_data.get("marca"),
+                llm_data.get("entidad"),
+                article.get("title"),
+                article.get("description"),
+                article.get("content"),
+                article.get("url"),
+                article.get("urlToImage") or article.get("url_to_image"),
+                llm_data.get("idioma"),
+                llm_data.get("confianza"),
+                llm_data.get("relevancia"),
+                llm_data.get("accion_recomendada"),
+                llm_data.get("cita_clave"),
+                llm_data.get("resumen_ejecutivo"),
+                llm_data.get("tono"),
+                llm_data.get("temas_principales"),
+                llm_data.get("subtemas"),
+                llm_data.get("stakeholders"),
+                llm_data.get("impacto_social"),
+                llm_data.get("impacto_economico"),
+                llm_data.get("impacto_politico"),
+                llm_data.get("palabras_clave_contextuales"),
+                llm_data.get("trending_topics"),
+                llm_data.get("analisis_competitivo"),
+                llm_data.get("credibilidad_fuente"),
+                llm_data.get("sesgo_detectado"),
+                llm_data.get("localizacion_geografica"),
+                llm_data.get("fuentes_citadas"),
+                llm_data.get("datos_numericos"),
+                llm_data.get("urgencia"),
+                llm_data.get("audiencia_objetivo"),
+                triage,
+                PROMPT_VERSION if classified else None,
+                LLM_MODEL if classified else None,
+                now if classified else None,
+                now,
+            ),
+        )
+        insight_id = cursor.fetchone()[0]
+        insert_insight_facets(db, insight_id, term, now, llm_data)
+        update_insight_rollups(db, term, now, llm_data)
+    index_insight_vector(insight_id, article_embedding_text(article, llm_data))
+    return insight_id
+
+
+def article_embedding_text(article: Dict[str, Any], llm_data: Dict[str, Any]) -> str:
+    parts = [
+        article.get("title"),
+        article.get("description"),
+        llm_data.get("resumen"),
+        llm_data.get("resumen_ejecutivo"),
+        llm_data.get("temas_principales"),
+        llm_data.get("etiquetas"),
+        llm_data.get("marca"),
+        llm_data.get("entidad"),
+    ]
+    return " ".join(str(part) for part in parts if part)
+
+
+@traced()
+def index_insight_vector(insight_id: int, text: str) -> None:
+    try:
+        vector_index.add(insight_id, embed_text(text, VECTOR_DIM))
+    except (OSError, ValueError) as exc:
+        logger.warning("Could not index vector for insight %s: %s", insight_id, exc)
+
+
+def backfill_vector_index() -> None:
+    cursor = database.reader().execute(
         """
-        INSERT INTO insights (
-            term, sentimiento, resumen, categoria, etiquetas, marca, entidad,
-            article_title, article_description, article_content, article_url,
-            article_image, idioma, confianza, relevancia, accion_recomendada, cita_clave,
-            resumen_ejecutivo, tono, temas_principales, subtemas, stakeholders,
-            impacto_social, impacto_economico, impacto_politico, palabras_clave_contextuales,
-            trending_topics, analisis_competitivo, credibilidad_fuente, sesgo_detectado,
-            localizacion_geografica, fuentes_citadas, datos_numericos, urgencia, audiencia_objetivo,
-            created_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        SELECT id, article_title, article_description, resumen, resumen_ejecutivo,
+               temas_principales, etiquetas, marca, entidad
+        FROM insights WHERE id > ? ORDER BY id
         """,
-        (
-            term,
-            llm_data.get("sentimiento"),
-            llm_data.get("resumen"),
-            llm_data.get("categoria"),
-            llm_data.get("etiquetas"),
-            llm_data.get("marca"),
-            llm_data.get("entidad"),
-            article.get("title"),
-            article.get("description"),
-            article.get("content"),
-            article.get("url"),
-            article.get("urlToImage") or article.get("url_to_image"),
-            llm_data.get("idioma"),
-            llm_data.get("confianza"),
-            llm_data.get("relevancia"),
-            llm_data.get("accion_recomendada"),
-            llm_data.get("cita_clave"),
-            llm_data.get("resumen_ejecutivo"),
-            llm_data.get("tono"),
-            llm_data.get("temas_principales"),
-            llm_data.get("subtemas"),
-            llm_data.get("stakeholders"),
-            llm_data.get("impacto_social"),
-            llm_data.get("impacto_economico"),
-            llm_data.get("impacto_politico"),
-            llm_data.get("palabras_clave_contextuales"),
-            llm_data.get("trending_topics"),
-            llm_data.get("analisis_competitivo"),
-            llm_data.get("credibilidad_fuente"),
-            llm_data.get("sesgo_detectado"),
-            llm_data.get("localizacion_geografica"),
-            llm_data.get("fuentes_citadas"),
-            llm_data.get("datos_numericos"),
-            llm_data.get("urgencia"),
-            llm_data.get("audiencia_objetivo"),
-            now,
-        ),
+        (vector_index.watermark,),
+    )
+    indexed = 0
+    while True:
+        batch = cursor.fetchmany(500)
+        if not batch:
+            break
+        for row in batch:
+            record = dict(row)
+            article = {"title": record["article_title"], "description": record["article_description"]}
+            index_insight_vector(record["id"], article_embedding_text(article, record))
+        indexed += len(batch)
+    if indexed:
+        vector_index.flush()
+        logger.info("Indexed vectors for %s existing insights", indexed)
+
+
+def search_similar(vector: Any, k: int, term: Optional[str], exclude: Optional[int] = None) -> "InsightSearchResponse":
+    allowed = None
+    if term:
+        term_ids = database.reader().execute("SELECT id FROM insights WHERE term = ?", (term,)).fetchall()
+        allowed = np.fromiter((row[0] for row in term_ids), dtype=np.int64, count=len(term_ids))
+    matches = vector_index.search(vector, k, exclude=exclude, allowed=allowed)
+    scores = {insight_id: score for insight_id, score in matches}
+    rows = load_insights_by_ids(list(scores))
+    ranked = sorted(rows, key=lambda row: scores[row.id], reverse=True)[:k]
+    return InsightSearchResponse(
+        items=[InsightMatch(score=round(scores[row.id], 4), insight=row) for row in ranked]
     )
-    conn.commit()
-    return cursor.lastrowid
 
 
 def load_insights_by_ids(ids: List[int]) -> List["Insight"]:
     if not ids:
         return []
     placeholders = ",".join("?" for _ in ids)
-    rows = conn.execute(
+    rows = database.reader().execute(
         f"SELECT * FROM insights WHERE id IN ({placeholders}) ORDER BY id",
         ids,
     ).fetchall()
     return [Insight(**dict(row)) for row in rows]
 
 
-def classify_articles(term: str, articles: List[Dict[str, Any]]) -> "InsightResponse":
-    if not articles:
-        raise HTTPException(status_code=404, detail="No articles provided for classification")
-    saved_ids: List[int] = []
-    for article in articles[:MAX_ARTICLES]:
-        llm_data = call_llm(article)
-        saved_ids.append(store_insight_record(term, article, llm_data))
-    insights = load_insights_by_ids(saved_ids)
-    return InsightResponse(term=term, count=len(insights), insights=insights)
+def create_classification_run(
+    run_id: str, term: str, relevance_term: Optional[str], articles: List[Dict[str, Any]]
+) -> None:
+    now = datetime.utcnow().isoformat()
+    with database.write() as db:
+        db.execute(
+            """
+            INSERT INTO classification_runs (run_id, term, relevance_term, status, created_at, updated_at)
+            VALUES (?, ?, ?, 'running', ?, ?)
+            """,
+            (run_id, term, relevance_term, now, now),
+        )
+        db.executemany(
+            """
+            INSERT INTO classification_run_items (run_id, position, article_json, status, updated_at)
+            VALUES (?, ?, ?, 'pending', ?)
+            """,
+            [
+                (run_id, position, json.dumps(article, ensure_ascii=False), now)
+                for position, article in enumerate(articles)
+            ],
+        )
+
+
+def load_classification_run(run_id: str) -> Optional[sqlite3.Row]:
+    return database.reader().execute("SELECT * FROM classification_runs WHERE run_id = ?", (run_id,)).fetchone()
+
+
+def mark_run_item(
+    run_id: str, position: int, status: str, insight_id: Optional[int] = None, error: Optional[str] = None
+) -> None:
+    with database.write() as db:
+        db.execute(
+            """
+            UPDATE classification_run_items
+            SET status = ?, insight_id = ?, error = ?, attempts = attempts + 1, updated_at = ?
+            WHERE run_id = ? AND position = ?
+            """,
+            (status, insight_id, error, datetime.utcnow().isoformat(), run_id, position),
+        )
+
+
+@traced("call_llm")
+def call_llm_with_retry(article: Dict[str, Any], call: Callable[[Dict[str, Any]], Any] = call_llm) -> Any:
+    """Retry malformed LLM answers (5xx) with full-jitter backoff; transport errors are retried upstream."""
+    for attempt in range(CLASSIFY_MAX_RETRIES + 1):
+        try:
+            return call(article)
+        except HTTPException as exc:
+            if isinstance(exc, LLMUnavailableError) or exc.status_code < 502 or attempt == CLASSIFY_MAX_RETRIES:
+                raise
+            delay = random.uniform(0, CLASSIFY_RETRY_BASE_SECONDS * 2**attempt)
+            logger.warning("LLM call failed (%s); retrying in %.2fs", exc.detail, delay)
+            time.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+@traced()
+def classify_articles(
+    term: str,
+    articles: List[Dict[str, Any]],
+    relevance_term: Optional[str] = None,
+    run_id: Optional[str] = None,
+) -> "InsightResponse":
+    """Classify ``articles`` under a checkpointed run.
+
+    Every article is an item of ``run_id`` whose status (pending/done/skipped/failed) is committed
+    as soon as it changes, so calling again with the same ``run_id`` only processes what is left.
+    """
+    run_id = run_id or uuid.uuid4().hex
+    run = load_classification_run(run_id)
+    if run is None:
+        if not articles:
+            raise HTTPException(status_code=404, detail="No articles provided for classification")
+        create_classification_run(run_id, term, relevance_term, articles[:MAX_ARTICLES])
+    else:
+        term, relevance_term = run["term"], run["relevance_term"]
+    pending = database.reader().execute(
+        """
+        SELECT position, article_json FROM classification_run_items
+        WHERE run_id = ? AND status IN ('pending', 'failed')
+        ORDER BY position
+        """,
+        (run_id,),
+    ).fetchall()
+
+    # Un run reanudado también descarta duplicados de los artículos que ya guardó
+    done = database.reader().execute(
+        "SELECT article_json FROM classification_run_items WHERE run_id = ? AND status = 'done'",
+        (run_id,),
+    ).fetchall()
+    seen_keys = {key for key in (article_dedup_key(json.loads(row["article_json"])) for row in done) if key}
+    skipped = 0
+    for item in pending:
+        position = item["position"]
+        article = json.loads(item["article_json"])
+        triage_reason = None
+        if TRIAGE_ENABLED:
+            triage = triage_article(relevance_term, article, seen_keys)
+            triage_reason = triage["reason"]
+            if triage_reason == "duplicado":
+                mark_run_item(run_id, position, "skipped")
+                skipped += 1
+                continue
+            if triage_reason != "llm":
+                cheap_fields = {key: triage[key] for key in ("idioma", "sentimiento", "relevancia")}
+                with database.write():
+                    insight_id = store_insight_record(term, article, cheap_fields, triage=triage_reason)
+                    mark_run_item(run_id, position, "done", insight_id)
+                skipped += 1
+                continue
+        try:
+            llm_data = call_llm_with_retry(article)
+        except HTTPException as exc:
+            if exc.status_code < 502:
+                raise
+            mark_run_item(run_id, position, "failed", error=str(exc.detail))
+            continue
+        # El insight y su checkpoint se confirman juntos: un reintento nunca lo duplica
+        with database.write():
+            insight_id = store_insight_record(term, article, llm_data, triage=triage_reason)
+            mark_run_item(run_id, position, "done", insight_id)
+    if skipped:
+        logger.info("Triage skipped the LLM for %s of %s articles (term=%s)", skipped, len(pending), term)
+    return classification_run_response(run_id, finalize=True)
+
+
+def classification_run_response(run_id: str, finalize: bool = False) -> "InsightResponse":
+    run = load_classification_run(run_id)
+    items = database.reader().execute(
+        "SELECT * FROM classification_run_items WHERE run_id = ? ORDER BY position",
+        (run_id,),
+    ).fetchall()
+    failed: List[FailedArticle] = []
+    for item in items:
+        if item["status"] not in ("failed", "pending"):
+            continue
+        article = json.loads(item["article_json"])
+        failed.append(
+            FailedArticle(
+                position=item["position"],
+                title=article.get("title"),
+                url=article.get("url"),
+                error=item["error"],
+                attempts=item["attempts"],
+            )
+        )
+    status = run["status"]
+    if finalize:
+        status = "completed" if not failed else "partial"
+        with database.write() as db:
+            db.execute(
+                "UPDATE classification_runs SET status = ?, updated_at = ? WHERE run_id = ?",
+                (status, datetime.utcnow().isoformat(), run_id),
+            )
+    insights = load_insights_by_ids([item["insight_id"] for item in items if item["insight_id"]])
+    return InsightResponse(
+        term=run["term"],
+        count=len(insights),
+        insights=insights,
+        run_id=run_id,
+        status=status,
+        failed=failed,
+    )
+
+
+class StageGraph:
+    """Minimal DAG executor: a node starts as soon as every dependency has finished (ok or failed).
+
+    Nodes may be added while the graph runs (one classification per fetched article) and may report
+    intermediate results through their ``emit`` argument; ``run`` yields started/progress/done events
+    in the order they happen, so the caller can stream them.
+    """
+
+    def __init__(self, max_workers: int, context: Context):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline")
+        self._context = context
+        self._events: "queue.Queue[Tuple[str, str, Any, Optional[BaseException]]]" = queue.Queue()
+        self._pending: Dict[str, Tuple[Callable[[Callable[[Any], None]], Any], Tuple[str, ...]]] = {}
+        self._running: set[str] = set()
+        self.deps: Dict[str, Tuple[str, ...]] = {}
+        self.timings: Dict[str, Tuple[float, float]] = {}
+        self._origin = time.monotonic()
+
+    def add(self, name: str, func: Callable[[Callable[[Any], None]], Any], deps: Iterable[str] = ()) -> None:
+        self._pending[name] = (func, tuple(deps))
+        self.deps[name] = tuple(deps)
+
+    def _execute(self, name: str, func: Callable[[Callable[[Any], None]], Any]) -> None:
+        started = time.monotonic() - self._origin
+        emit = lambda payload: self._events.put(("progress", name, payload, None))  # noqa: E731
+        try:
+            with span(f"pipeline.{name.split(':')[0]}", node=name):
+                result, error = func(emit), None
+        except Exception as exc:
+            result, error = None, exc
+        self._events.put(("done", name, (started, result), error))
+
+    def run(self) -> Iterator[Tuple[str, str, Any, Optional[BaseException]]]:
+        try:
+            while True:
+                for name, (func, deps) in list(self._pending.items()):
+                    if all(dep in self.timings for dep in deps):
+                        del self._pending[name]
+                        self._running.add(name)
+                        # Cada nodo corre en una copia del contexto de la petición (ledger y trazas)
+                        self._pool.submit(self._context.copy().run, self._execute, name, func)
+                        yield "started", name, None, None
+                if not self._running:
+                    if self._pending:
+                        raise RuntimeError(f"Pipeline nodes with unknown dependencies: {sorted(self._pending)}")
+                    return
+                kind, name, payload, error = self._events.get()
+                if kind == "done":
+                    started, payload = payload
+                    self._running.discard(name)
+                    self.timings[name] = (started, time.monotonic() - self._origin)
+                yield kind, name, payload, error
+        finally:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def critical_path(self) -> List[str]:
+        """Chain of nodes, each the last-finishing dependency of the next, that ends the run."""
+        if not self.timings:
+            return []
+        path = [max(self.timings, key=lambda name: self.timings[name][1])]
+        while True:
+            deps = [dep for dep in self.deps.get(path[-1], ()) if dep in self.timings]
+            if not deps:
+                return path[::-1]
+            path.append(max(deps, key=lambda dep: self.timings[dep][1]))
+
+
+_colocated_services: Dict[str, Any] = {}
+_colocated_lock = threading.Lock()
+_EMBEDDED_SERVICE_ENV = {"SERVICE_BACKGROUND_WORKERS": "false", "ANALYSIS_SCHEDULER_ENABLED": "false"}
+
+
+@contextmanager
+def embedded_service_environment() -> Iterator[None]:
+    previous = {key: os.environ.get(key) for key in _EMBEDDED_SERVICE_ENV}
+    os.environ.update(_EMBEDDED_SERVICE_ENV)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def colocated_service(name: str) -> Optional[Any]:
+    """news_service/analysis_service ``app`` module to run a pipeline stage in-process, else None (HTTP).
+
+    Only used when ``PIPELINE_*_MODE`` asks for it. The module is imported with its background workers (hot-term scheduler, ledger and trace flushers)
+    off; ``flush_colocated_services`` drains its buffers from this process, and the analysis module
+    writes through this process's ``database`` so one lock serializes every write.
+    """
+    mode, directory = {
+        "news": (PIPELINE_NEWS_MODE, NEWS_SERVICE_DIR),
+        "analysis": (PIPELINE_ANALYSIS_MODE, ANALYSIS_SERVICE_DIR),
+    }[name]
+    if mode == "http":
+        return None
+    with _colocated_lock:
+        if name not in _colocated_services:
+            path = os.path.join(directory, "app.py")
+            module = None
+            try:
+                if not os.path.exists(path):
+                    raise FileNotFoundError(path)
+                spec = importlib.util.spec_from_file_location(f"{name}_service_app", path)
+                module = importlib.util.module_from_spec(spec)
+                with embedded_service_environment():
+                    spec.loader.exec_module(module)
+                if name == "analysis":
+                    module.database = database
+                logger.info("Pipeline runs %s stage in-process from %s", name, path)
+            except Exception as exc:
+                if mode == "inprocess":
+                    raise
+                logger.info("Pipeline %s stage goes over HTTP (%s)", name, exc)
+                module = None
+            _colocated_services[name] = module
+        return _colocated_services[name]
+
+
+def flush_colocated_services() -> None:
+    """Write the LLM ledger rows, term request counts and spans buffered by in-process service modules."""
+    for module in list(_colocated_services.values()):
+        if module is None:
+            continue
+        for flush in ("flush_llm_ledger", "flush_term_requests", "flush_traces"):
+            if hasattr(module, flush):
+                getattr(module, flush)()
+
+
+@contextmanager
+def shared_trace(module: Any) -> Iterator[None]:
+    """Make spans of a co-located service module children of this request's current span."""
+    token = module._current_span.set(_current_span.get()) if hasattr(module, "_current_span") else None
+    try:
+        yield
+    finally:
+        if token is not None:
+            module._current_span.reset(token)
+
+
+def fetch_colocated_news(
+    news: Any, fetch: Callable[[str, Optional[str]], List[Dict[str, Any]]], term: str, language: Optional[str]
+) -> List[Dict[str, Any]]:
+    with shared_trace(news):
+        articles = news.deduplicate_articles(fetch(term, language))
+        news.store_articles(term, language, articles)
+    return articles
+
+
+def stream_news_batches(term: str, language: Optional[str], emit: Callable[[Any], None]) -> None:
+    params = {"term": term}
+    if language:
+        params["language"] = language
+    with requests.get(
+        f"{NEWS_SERVICE_URL}/news/stream", params=params, headers=trace_headers(), stream=True, timeout=60
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                emit(json.loads(line))
+
+
+def classify_pipeline_article(
+    term: str, position: int, article: Dict[str, Any], triage: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    reason = triage["reason"] if triage else None
+    if reason not in (None, "llm"):
+        fields = {key: triage[key] for key in ("idioma", "sentimiento", "relevancia")}
+    else:
+        fields = call_llm_with_retry(article)
+    insight_id = store_insight_record(term, article, fields, triage=reason)
+    return {
+        "position": position,
+        "insight_id": insight_id,
+        "title": article.get("title"),
+        "url": article.get("url"),
+        "triage": reason,
+        "sentimiento": fields.get("sentimiento"),
+        "categoria": fields.get("categoria"),
+        "relevancia": fields.get("relevancia"),
+    }
+
+
+def run_pipeline_analysis(term: str, insight_ids: List[int]) -> Optional[Dict[str, Any]]:
+    if not insight_ids:
+        return None
+    analysis = colocated_service("analysis")
+    if analysis is not None:
+        with shared_trace(analysis):
+            request = analysis.AnalysisRequest(term=term, insight_ids=insight_ids, limit=len(insight_ids))
+            return analysis.run_persistent_analysis(request).model_dump()
+    response = requests.post(
+        f"{ANALYSIS_SERVICE_URL}/analysis/run",
+        json={"term": term, "insight_ids": insight_ids, "limit": len(insight_ids)},
+        headers=trace_headers(),
+        timeout=OPENAI_TIMEOUT * 2,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def error_detail(exc: BaseException) -> str:
+    return str(getattr(exc, "detail", None) or exc)
+
+
+def pipeline_events(term: str, language: Optional[str], limit: int, analyze: bool, context: Context) -> Iterator[str]:
+    """term → news → classification → analysis as one DAG, streamed as SSE.
+
+    Each news batch (one per provider) turns into classification nodes right away, so the LLM works
+    while slower providers are still answering; analysis waits for every classification.
+    """
+    graph = StageGraph(PIPELINE_MAX_WORKERS, context)
+    news = colocated_service("news")
+    analysis_mode = "inprocess" if analyze and colocated_service("analysis") is not None else "http"
+    news_nodes: List[str] = []
+    if news is not None:
+        for provider, fetch in news.NEWS_PROVIDERS.items():
+            news_nodes.append(f"news:{provider}")
+            graph.add(news_nodes[-1], lambda emit, fetch=fetch: fetch_colocated_news(news, fetch, term, language))
+    else:
+        news_nodes.append("news")
+        graph.add("news", lambda emit: stream_news_batches(term, language, emit))
+
+    seen_keys: set[str] = set()
+    classify_nodes: List[str] = []
+    insight_ids: List[int] = []
+    failed = 0
+
+    def schedule(provider: str, articles: List[Dict[str, Any]]) -> Iterator[str]:
+        accepted = 0
+        for article in articles:
+            if len(classify_nodes) >= limit:
+                break
+            triage = triage_article(term, article, seen_keys) if TRIAGE_ENABLED else None
+            if triage and triage["reason"] == "duplicado":
+                continue
+            position = len(classify_nodes)
+            classify_nodes.append(f"classify:{position}")
+            graph.add(
+                classify_nodes[-1],
+                lambda emit, position=position, article=article, triage=triage: classify_pipeline_article(
+                    term, position, article, triage
+                ),
+            )
+            accepted += 1
+        yield sse_event("news", {"provider": provider, "articles": len(articles), "accepted": accepted})
+
+    yield sse_event("meta", {"term": term, "limit": limit, "news_mode": "inprocess" if news else "http", "analysis_mode": analysis_mode if analyze else None})
+    try:
+        for kind, name, payload, error in graph.run():
+            stage = name.split(":")[0]
+            if kind == "started":
+                if stage != "classify":
+                    yield sse_event("stage", {"stage": name, "status": "started"})
+                continue
+            if kind == "progress":
+                if payload.get("error"):
+                    yield sse_event("stage", {"stage": f"news:{payload['provider']}", "status": "failed", "error": payload["error"]})
+                yield from schedule(payload["provider"], payload["articles"])
+                continue
+            started, finished = graph.timings[name]
+            timing = {"started_ms": round(started * 1000, 1), "elapsed_ms": round((finished - started) * 1000, 1)}
+            if error is not None:
+                if stage == "classify":
+                    failed += 1
+                yield sse_event("stage", {"stage": name, "status": "failed", "error": error_detail(error), **timing})
+            elif stage == "news":
+                if payload is not None:
+                    yield from schedule(name.split(":", 1)[1], payload)
+                yield sse_event("stage", {"stage": name, "status": "done", **timing})
+            elif stage == "classify":
+                insight_ids.append(payload["insight_id"])
+                yield sse_event("insight", {**payload, **timing})
+            elif stage == "analysis":
+                yield sse_event("analysis", {"result": payload, **timing})
+            # Con el cupo de artículos cubierto el análisis no espera a los proveedores que quedan
+            news_finished = all(node in graph.timings for node in news_nodes)
+            if analyze and "analysis" not in graph.deps and (news_finished or len(classify_nodes) >= limit):
+                graph.add(
+                    "analysis",
+                    lambda emit: run_pipeline_analysis(term, sorted(insight_ids)),
+                    deps=classify_nodes if len(classify_nodes) >= limit else news_nodes + classify_nodes,
+                )
+    except Exception as exc:
+        logger.exception("Pipeline for %s failed", term)
+        yield sse_event("error", {"detail": error_detail(exc)})
+        return
+    sum_ms = sum(finished - started for started, finished in graph.timings.values()) * 1000
+    elapsed_ms = max((finished for _, finished in graph.timings.values()), default=0.0) * 1000
+    yield sse_event(
+        "done",
+        {
+            "term": term,
+            "insight_ids": sorted(insight_ids),
+            "failed": failed,
+            "elapsed_ms": round(elapsed_ms, 1),
+            "sum_of_stages_ms": round(sum_ms, 1),
+            "critical_path": graph.critical_path(),
+        },
+    )
+
+
+def resolve_insight_columns(view: str, fields: Optional[str]) -> List[str]:
+    if fields:
+        requested = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in requested if field not in INSIGHT_COLUMNS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown insight fields: {', '.join(unknown)}")
+    elif view == "full":
+        return ["*"]
+    elif view == "detail":
+        requested = [column for column in INSIGHT_COLUMNS if column != "article_content"]
+    else:
+        requested = list(INSIGHT_SUMMARY_FIELDS)
+    columns = list(INSIGHT_BASE_FIELDS)
+    columns.extend(field for field in requested if field not in columns)
+    return columns
+
+
+def list_insights(
+    term: Optional[str],
+    limit: int,
+    offset: int,
+    facets: Optional[Dict[str, str]] = None,
+    columns: Optional[List[str]] = None,
+    cursor: Optional[int] = None,
+    include_total: bool = True,
+) -> "PaginatedInsights":
+    params: List[Any] = []
+    where_clauses: List[str] = []
+    if term:
+        where_clauses.append("term = ?")
+        params.append(term)
+    for field, value in (facets or {}).items():
+        where_clauses.append(
+            "id IN (SELECT insight_id FROM insight_facets WHERE field = ? AND value_key = ?)"
+        )
+        params.extend([field, value.strip().lower()])
+    where_clause = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+    total = None
+    if include_total:
+        total = database.reader().execute(
+            f"SELECT COUNT(1) FROM insights {where_clause}",
+            params,
+        ).fetchone()[0]
+    page_params = list(params)
+    if cursor is not None:
+        page_clause = f"{where_clause} AND id < ?" if where_clause else "WHERE id < ?"
+        page_params.extend([cursor, limit])
+        paging_sql = "LIMIT ?"
+    else:
+        page_clause = where_clause
+        page_params.extend([limit, offset])
+        paging_sql = "LIMIT ? OFFSET ?"
+    select_sql = ", ".join(columns or ["*"])
+    rows = database.reader().execute(
+        f"SELECT {select_sql} FROM insights {page_clause} ORDER BY id DESC {paging_sql}",
+        page_params,
+    ).fetchall()
+    items = [Insight(**dict(row)) for row in rows]
+    next_cursor = items[-1].id if len(items) == limit else None
+    if include_total:
+        return PaginatedInsights(total=total, next_cursor=next_cursor, items=items)
+    return PaginatedInsights(next_cursor=next_cursor, items=items)
+
+
+def top_facet_values(
+    field: str, term: Optional[str], since: Optional[str], limit: int
+) -> List["InsightFacet"]:
+    params: List[Any] = [field]
+    where_sql = "WHERE field = ?"
+    if term:
+        where_sql += " AND term = ?"
+        params.append(term)
+    if since:
+        where_sql += " AND created_at >= ?"
+        params.append(since)
+    params.append(limit)
+    rows = database.reader().execute(
+        f"""
+        SELECT MIN(value) AS value, COUNT(1) AS cnt
+        FROM insight_facets
+        {where_sql}
+        GROUP BY value_key
+        ORDER BY cnt DESC, value_key
+        LIMIT ?
+        """,
+        params,
+    ).fetchall()
+    return [InsightFacet(value=row["value"], count=row["cnt"]) for row in rows]
+
 
+def average(total: Optional[float], count: Optional[int]) -> Optional[float]:
+    if not count:
+        return None
+    return round((total or 0.0) / count, 4)
 
-def list_insights(term: Optional[str], limit: int, offset: int) -> "PaginatedInsights":
+
+def insight_stats(term: Optional[str], start: Optional[str], end: Optional[str]) -> "InsightStats":
     params: List[Any] = []
-    where_clause = ""
+    where_clauses: List[str] = []
     if term:
-        where_clause = "WHERE term = ?"
+        where_clauses.append("term = ?")
         params.append(term)
-    total = conn.execute(
-        f"SELECT COUNT(1) FROM insights {where_clause}",
+    if start:
+        where_clauses.append("day >= ?")
+        params.append(start[:10])
+    if end:
+        where_clauses.append("day <= ?")
+        params.append(end[:10])
+    where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+
+    metric_rows = database.reader().execute(
+        f"""
+        SELECT day, SUM(total) AS total,
+               SUM(confianza_sum) AS confianza_sum, SUM(confianza_n) AS confianza_n,
+               SUM(relevancia_sum) AS relevancia_sum, SUM(relevancia_n) AS relevancia_n,
+               SUM(credibilidad_sum) AS credibilidad_sum, SUM(credibilidad_n) AS credibilidad_n
+        FROM insight_daily_metrics
+        {where_sql}
+        GROUP BY day
+        ORDER BY day
+        """,
         params,
-    ).fetchone()[0]
-    params_with_paging = list(params)
-    params_with_paging.extend([limit, offset])
-    rows = conn.execute(
-        f"SELECT * FROM insights {where_clause} ORDER BY id DESC LIMIT ? OFFSET ?",
-        params_with_paging,
     ).fetchall()
-    return PaginatedInsights(total=total, items=[Insight(**dict(row)) for row in rows])
+    count_rows = database.reader().execute(
+        f"""
+        SELECT day, dimension, value, SUM(count) AS cnt
+        FROM insight_daily_counts
+        {where_sql}
+        GROUP BY day, dimension, value
+        """,
+        params,
+    ).fetchall()
+
+    sentiment_by_day: Dict[str, Dict[str, int]] = {}
+    breakdown: Dict[str, Dict[str, int]] = {
+        dimension: {} for dimension in ROLLUP_DIMENSIONS + ROLLUP_FACET_DIMENSIONS
+    }
+    for row in count_rows:
+        bucket = breakdown.setdefault(row["dimension"], {})
+        bucket[row["value"]] = bucket.get(row["value"], 0) + row["cnt"]
+        if row["dimension"] == "sentimiento":
+            sentiment_by_day.setdefault(row["day"], {})[row["value"]] = row["cnt"]
+    for dimension in ROLLUP_FACET_DIMENSIONS:
+        ranked = sorted(breakdown[dimension].items(), key=lambda item: (-item[1], item[0]))
+        breakdown[dimension] = dict(ranked[:20])
+
+    totals = {key: 0.0 for key in ("confianza_sum", "confianza_n", "relevancia_sum", "relevancia_n", "credibilidad_sum", "credibilidad_n")}
+    series: List[DailyInsightStats] = []
+    total = 0
+    for row in metric_rows:
+        total += row["total"]
+        for key in totals:
+            totals[key] += row[key] or 0
+        series.append(
+            DailyInsightStats(
+                day=row["day"],
+                total=row["total"],
+                sentimiento=sentiment_by_day.get(row["day"], {}),
+                confianza_media=average(row["confianza_sum"], row["confianza_n"]),
+                relevancia_media=average(row["relevancia_sum"], row["relevancia_n"]),
+            )
+        )
+    return InsightStats(
+        term=term,
+        start=start,
+        end=end,
+        total=total,
+        confianza_media=average(totals["confianza_sum"], int(totals["confianza_n"])),
+        relevancia_media=average(totals["relevancia_sum"], int(totals["relevancia_n"])),
+        credibilidad_fuente_media=average(totals["credibilidad_sum"], int(totals["credibilidad_n"])),
+        breakdown=breakdown,
+        series=series,
+    )
 
 
-conn = get_connection()
-app = FastAPI(title="News Insights Service", version="0.2.0")
+def llm_call_cost(model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> float:
+    prices = LLM_PRICES_PER_1K.get(model) or {}
+    input_price = prices.get("input", 0.0)
+    return (
+        (prompt_tokens - cached_tokens) * input_price
+        + cached_tokens * prices.get("cached_input", input_price)
+        + completion_tokens * prices.get("output", 0.0)
+    ) / 1000
+
+
+def llm_usage_summary(
+    term: Optional[str], start: Optional[str], end: Optional[str], model: Optional[str]
+) -> "LLMUsageResponse":
+    flush_llm_ledger()
+    params: List[Any] = []
+    where_clauses: List[str] = []
+    if term:
+        where_clauses.append("term = ?")
+        params.append(term)
+    if start:
+        where_clauses.append("created_at >= ?")
+        params.append(start[:10])
+    if end:
+        where_clauses.append("created_at <= ?")
+        params.append(f"{end[:10]}T23:59:59.999999")
+    if model:
+        where_clauses.append("model = ?")
+        params.append(model)
+    where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+    rows = database.reader().execute(
+        f"""
+        SELECT term, substr(created_at, 1, 10) AS day, model, COUNT(*) AS calls,
+               SUM(CASE WHEN status = 'error' THEN 1 ELSE 0 END) AS errors,
+               COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+               COALESCE(SUM(cached_tokens), 0) AS cached_tokens,
+               COALESCE(SUM(completion_tokens), 0) AS completion_tokens,
+               AVG(latency_ms) AS avg_latency_ms, MAX(latency_ms) AS max_latency_ms,
+               SUM(retries) AS retries, SUM(hedged) AS hedged,
+               SUM(cache_hit) AS cache_hits, COUNT(cache_hit) AS cache_reported
+        FROM llm_usage
+        {where_sql}
+        GROUP BY term, day, model
+        ORDER BY day, term, model
+        """,
+        params,
+    ).fetchall()
+    items = [
+        LLMUsageBucket(
+            term=row["term"],
+            day=row["day"],
+            model=row["model"],
+            calls=row["calls"],
+            errors=row["errors"],
+            prompt_tokens=row["prompt_tokens"],
+            cached_tokens=row["cached_tokens"],
+            completion_tokens=row["completion_tokens"],
+            cost_usd=round(
+                llm_call_cost(row["model"], row["prompt_tokens"], row["cached_tokens"], row["completion_tokens"]), 6
+            ),
+            avg_latency_ms=round(row["avg_latency_ms"], 1),
+            max_latency_ms=row["max_latency_ms"],
+            retries=row["retries"],
+            hedged=row["hedged"],
+            cache_hit_rate=round(row["cache_hits"] / row["cache_reported"], 3) if row["cache_reported"] else None,
+        )
+        for row in rows
+    ]
+    return LLMUsageResponse(
+        term=term,
+        start=start,
+        end=end,
+        calls=sum(item.calls for item in items),
+        cost_usd=round(sum(item.cost_usd for item in items), 6),
+        items=items,
+    )
+
+
+class AdmissionGate:
+    """Concurrency limit with a bounded FIFO queue for one LLM-bound endpoint.
+
+    Waiting happens on the event loop, so queued requests do not hold threadpool slots.
+    """
+
+    def __init__(self, route: str, concurrency: int, queue_size: int) -> None:
+        self.route = route
+        self.concurrency = max(concurrency, 1)
+        self.queue_size = max(queue_size, 0)
+        self.in_flight = 0
+        self.waiting = 0
+        self.avg_seconds: Optional[float] = None
+        self.stats = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0, "max_waiting": 0}
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def acquire(self) -> bool:
+        if self._semaphore.locked():
+            if self.waiting >= self.queue_size:
+                self.stats["rejected_queue_full"] += 1
+                return False
+            self.waiting += 1
+            self.stats["queued"] += 1
+            self.stats["max_waiting"] = max(self.stats["max_waiting"], self.waiting)
+            try:
+                with span("admission.wait", route=self.route, waiting=self.waiting):
+                    await asyncio.wait_for(self._semaphore.acquire(), ADMISSION_QUEUE_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                self.stats["rejected_timeout"] += 1
+                return False
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        self.stats["admitted"] += 1
+        return True
+
+    def release(self, seconds: float) -> None:
+        self.in_flight -= 1
+        self.avg_seconds = seconds if self.avg_seconds is None else 0.8 * self.avg_seconds + 0.2 * seconds
+        self._semaphore.release()
+
+    def retry_after(self) -> int:
+        """Seconds until the queue ahead should have drained, from the recent average service time."""
+        per_request = self.avg_seconds if self.avg_seconds is not None else ADMISSION_QUEUE_TIMEOUT_SECONDS
+        estimate = per_request * (self.waiting + 1) / self.concurrency
+        return max(1, min(math.ceil(estimate), ADMISSION_RETRY_AFTER_MAX_SECONDS))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "avg_seconds": round(self.avg_seconds, 3) if self.avg_seconds is not None else None,
+            **self.stats,
+        }
+
+
+if POSTGRES_URL:
+    database = PostgresDatabase(POSTGRES_URL, setup=ensure_postgres_schema)
+else:
+    database = Database(DB_PATH, setup=run_migrations)
+INSIGHT_COLUMNS = database.columns("insights")
+vector_index = VectorIndex(
+    VECTOR_INDEX_PATH,
+    VECTOR_DIM,
+    nlist=VECTOR_NLIST,
+    nprobe=VECTOR_NPROBE,
+    train_threshold=VECTOR_TRAIN_THRESHOLD,
+)
+threading.Thread(target=backfill_vector_index, name="vector-backfill", daemon=True).start()
+threading.Thread(target=llm_ledger_flush_loop, name="llm-ledger", daemon=True).start()
+atexit.register(flush_llm_ledger)
+atexit.register(flush_colocated_services)
+atexit.register(vector_index.flush)
+if TRACING_ENABLED:
+    threading.Thread(target=trace_flush_loop, name="trace-flush", daemon=True).start()
+    atexit.register(flush_traces)
+admission_gates = {
+    route: AdmissionGate(route, int(limits.get("concurrency", 1)), int(limits.get("queue", 0)))
+    for route, limits in ADMISSION_LIMITS.items()
+}
+
+
+@asynccontextmanager
+async def reserve_read_threads(_: FastAPI) -> AsyncIterator[None]:
+    # Los endpoints del LLM nunca ocupan más de la suma de sus límites; el resto del threadpool queda para lecturas
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    reserved = sum(gate.concurrency for gate in admission_gates.values()) + ADMISSION_READ_THREADS
+    limiter.total_tokens = max(limiter.total_tokens, reserved)
+    yield
+
+
+app = FastAPI(title="News Insights Service", version="0.2.0", lifespan=reserve_read_threads)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -311,15 +2494,95 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def admission_control(request: Request, call_next: Callable) -> Response:
+    gate = admission_gates.get(request.url.path)
+    if gate is None or request.method == "OPTIONS":
+        return await call_next(request)
+    if not await gate.acquire():
+        return JSONResponse(
+            status_code=503,
+            content={"detail": f"{request.url.path} is overloaded, retry later"},
+            headers={"Retry-After": str(gate.retry_after())},
+        )
+    started = time.monotonic()
+    released = False
+
+    def release() -> None:
+        nonlocal released
+        if not released:
+            released = True
+            gate.release(time.monotonic() - started)
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        release()
+        raise
+    if not response.headers.get("content-type", "").startswith("text/event-stream"):
+        release()
+        return response
+    # SSE: la llamada al LLM sigue mientras se emite el cuerpo, así que el cupo se libera al terminar
+    body = response.body_iterator
+
+    async def release_after_body() -> AsyncIterator[bytes]:
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            release()
+
+    response.body_iterator = release_after_body()
+    return response
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next: Callable) -> Response:
+    if not TRACING_ENABLED:
+        return await call_next(request)
+    root = start_trace(f"{request.method} {request.url.path}", request.headers.get("traceparent"))
+    root.attributes.update({"http.method": request.method, "http.target": str(request.url.path)})
+    if request.url.query:
+        root.attributes["http.query"] = request.url.query[:300]
+    token = _current_span.set(root)
+    try:
+        response = await call_next(request)
+    except Exception as exc:
+        root.fail(exc)
+        root.finish()
+        raise
+    finally:
+        _current_span.reset(token)
+    root.attributes["http.status_code"] = response.status_code
+    if response.status_code >= 500:
+        root.status = "error"
+    body = getattr(response, "body_iterator", None)
+    if body is None:
+        root.finish()
+    else:
+        # Respuestas en streaming (SSE/NDJSON): el span raíz cubre hasta el último byte enviado
+        async def finish_after_body() -> AsyncIterator[bytes]:
+            try:
+                async for chunk in body:
+                    yield chunk
+            finally:
+                root.finish()
+
+        response.body_iterator = finish_after_body()
+    # El cliente puede buscar la traza de una petición lenta por este id
+    response.headers["traceparent"] = f"00-{root.trace_id}-{root.span_id}-{'01' if root.sampled else '00'}"
+    return response
+
+
 class Insight(BaseModel):
     id: int
     term: str
-    sentimiento: Optional[str]
-    resumen: Optional[str]
-    categoria: Optional[str]
-    etiquetas: Optional[str]
-    marca: Optional[str]
-    entidad: Optional[str]
+    sentimiento: Optional[str] = None
+    resumen: Optional[str] = None
+    categoria: Optional[str] = None
+    etiquetas: Optional[str] = None
+    marca: Optional[str] = None
+    entidad: Optional[str] = None
     idioma: Optional[str] = None
     confianza: Optional[float] = None
     relevancia: Optional[int] = None
@@ -344,12 +2607,13 @@ class Insight(BaseModel):
     datos_numericos: Optional[str] = None
     urgencia: Optional[str] = None
     audiencia_objetivo: Optional[str] = None
+    triage: Optional[str] = None
     # Campos del artículo
-    article_title: Optional[str]
-    article_description: Optional[str]
-    article_content: Optional[str]
-    article_url: Optional[str]
-    article_image: Optional[str]
+    article_title: Optional[str] = None
+    article_description: Optional[str] = None
+    article_content: Optional[str] = None
+    article_url: Optional[str] = None
+    article_image: Optional[str] = None
     created_at: str
 
 
@@ -365,61 +2629,252 @@ class ClassificationRequest(BaseModel):
     term: Optional[str] = None
     language: Optional[str] = None
     articles: Optional[List[ArticleInput]] = None
+    run_id: Optional[str] = Field(None, min_length=1, max_length=64)
+
+
+class FailedArticle(BaseModel):
+    position: int
+    title: Optional[str] = None
+    url: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int
 
 
 class InsightResponse(BaseModel):
     term: str
     count: int
     insights: List[Insight]
+    run_id: Optional[str] = None
+    status: Optional[str] = None
+    failed: List[FailedArticle] = []
 
 
 class PaginatedInsights(BaseModel):
-    total: int
+    total: Optional[int] = None
+    next_cursor: Optional[int] = None
     items: List[Insight]
 
 
+class InsightFacet(BaseModel):
+    value: str
+    count: int
+
+
+class InsightFacetsResponse(BaseModel):
+    field: str
+    items: List[InsightFacet]
+
+
+class DailyInsightStats(BaseModel):
+    day: str
+    total: int
+    sentimiento: Dict[str, int]
+    confianza_media: Optional[float] = None
+    relevancia_media: Optional[float] = None
+
+
+class InsightStats(BaseModel):
+    term: Optional[str]
+    start: Optional[str]
+    end: Optional[str]
+    total: int
+    confianza_media: Optional[float] = None
+    relevancia_media: Optional[float] = None
+    credibilidad_fuente_media: Optional[float] = None
+    breakdown: Dict[str, Dict[str, int]]
+    series: List[DailyInsightStats]
+
+
+class InsightMatch(BaseModel):
+    score: float
+    insight: Insight
+
+
+class InsightSearchResponse(BaseModel):
+    items: List[InsightMatch]
+
+
+class LLMUsageBucket(BaseModel):
+    term: Optional[str]
+    day: str
+    model: str
+    calls: int
+    errors: int
+    prompt_tokens: int
+    cached_tokens: int
+    completion_tokens: int
+    cost_usd: float
+    avg_latency_ms: float
+    max_latency_ms: int
+    retries: int
+    hedged: int
+    cache_hit_rate: Optional[float] = None
+
+
+class LLMUsageResponse(BaseModel):
+    term: Optional[str]
+    start: Optional[str]
+    end: Optional[str]
+    calls: int
+    cost_usd: float
+    items: List[LLMUsageBucket]
+
+
 @app.get("/health")
 def health() -> Dict[str, Any]:
-    return {"status": "ok", "db_path": DB_PATH}
+    return {
+        "status": "ok",
+        "db_backend": database.dialect,
+        "db_path": database.path,
+        "llm": llm_stats_snapshot(),
+        "admission": {route: gate.snapshot() for route, gate in admission_gates.items()},
+    }
 
 
 @app.get("/insights", response_model=InsightResponse)
 def generate_insights(
     term: str = Query(..., min_length=1, max_length=200),
     language: Optional[str] = Query(None, min_length=2, max_length=2),
+    run_id: Optional[str] = Query(None, min_length=1, max_length=64),
 ) -> InsightResponse:
+    llm_call_context.set({"endpoint": "/insights", "term": term})
+    if run_id and load_classification_run(run_id):
+        return classify_articles(term, [], run_id=run_id)
     articles = fetch_news(term, language)
     if not articles:
         raise HTTPException(status_code=404, detail="No articles returned for term")
-    return classify_articles(term, articles)
+    return classify_articles(term, articles, relevance_term=term, run_id=run_id)
 
 
 @app.post("/insights/classify", response_model=InsightResponse)
 def classify_from_payload(request: ClassificationRequest) -> InsightResponse:
+    llm_call_context.set({"endpoint": "/insights/classify", "term": request.term or "custom"})
+    if request.run_id and load_classification_run(request.run_id):
+        return classify_articles(request.term or "custom", [], run_id=request.run_id)
     if request.articles:
         articles = [article.dict(by_alias=True, exclude_none=True) for article in request.articles]
         term = request.term or "custom"
-        return classify_articles(term, articles)
+        return classify_articles(term, articles, relevance_term=request.term, run_id=request.run_id)
     if request.term:
         articles = fetch_news(request.term, request.language)
         if not articles:
             raise HTTPException(status_code=404, detail="No articles returned for term")
-        return classify_articles(request.term, articles)
+        return classify_articles(request.term, articles, relevance_term=request.term, run_id=request.run_id)
     raise HTTPException(status_code=400, detail="Provide either a term or a list of articles")
 
 
-@app.get("/insights/list", response_model=PaginatedInsights)
+@app.get("/insights/runs/{run_id}", response_model=InsightResponse)
+def classification_run_endpoint(run_id: str) -> InsightResponse:
+    if not load_classification_run(run_id):
+        raise HTTPException(status_code=404, detail="Classification run not found")
+    return classification_run_response(run_id)
+
+
+@app.get("/pipeline")
+def pipeline(
+    term: str = Query(..., min_length=1, max_length=200),
+    language: Optional[str] = Query(None, min_length=2, max_length=2),
+    limit: int = Query(MAX_ARTICLES, ge=1, le=100, description="Articles to classify"),
+    analyze: bool = Query(True, description="Run the analysis stage once classification ends"),
+) -> StreamingResponse:
+    llm_call_context.set({"endpoint": "/pipeline", "term": term})
+    return StreamingResponse(
+        pipeline_events(term, language, limit, analyze, copy_context()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/insights/list", response_model=PaginatedInsights, response_model_exclude_unset=True)
 def list_insights_endpoint(
     term: Optional[str] = Query(None, min_length=1, max_length=200),
     limit: int = Query(50, ge=1, le=200),
     offset: int = Query(0, ge=0),
+    cursor: Optional[int] = Query(None, ge=1, description="Return insights with id below this value"),
+    view: str = Query("summary", pattern="^(summary|detail|full)$"),
+    fields: Optional[str] = Query(None, max_length=1000, description="Comma-separated columns; overrides view"),
+    include_total: bool = Query(False),
+    etiqueta: Optional[str] = Query(None, min_length=1, max_length=200),
+    tema: Optional[str] = Query(None, min_length=1, max_length=200),
+    subtema: Optional[str] = Query(None, min_length=1, max_length=200),
+    stakeholder: Optional[str] = Query(None, min_length=1, max_length=200),
+    trending_topic: Optional[str] = Query(None, min_length=1, max_length=200),
+    marca: Optional[str] = Query(None, min_length=1, max_length=200),
+    entidad: Optional[str] = Query(None, min_length=1, max_length=200),
 ) -> PaginatedInsights:
-    return list_insights(term, limit, offset)
+    requested = {
+        "etiquetas": etiqueta,
+        "temas_principales": tema,
+        "subtemas": subtema,
+        "stakeholders": stakeholder,
+        "trending_topics": trending_topic,
+        "marca": marca,
+        "entidad": entidad,
+    }
+    facets = {field: value for field, value in requested.items() if value}
+    columns = resolve_insight_columns(view, fields)
+    return list_insights(term, limit, offset, facets, columns, cursor, include_total)
+
+
+@app.get("/insights/facets", response_model=InsightFacetsResponse)
+def insight_facets_endpoint(
+    field: str = Query(..., pattern=f"^({'|'.join(FACET_FIELDS)})$"),
+    term: Optional[str] = Query(None, min_length=1, max_length=200),
+    since: Optional[str] = Query(None, min_length=10, max_length=32, description="ISO date/datetime lower bound"),
+    limit: int = Query(20, ge=1, le=200),
+) -> InsightFacetsResponse:
+    return InsightFacetsResponse(field=field, items=top_facet_values(field, term, since, limit))
 
 
-@app.get("/history", response_model=List[Insight])
-def get_history(limit: int = Query(50, ge=1, le=500)) -> List[Insight]:
-    data = list_insights(None, limit, 0)
+@app.get("/insights/stats", response_model=InsightStats)
+def insight_stats_endpoint(
+    term: Optional[str] = Query(None, min_length=1, max_length=200),
+    start: Optional[str] = Query(None, min_length=10, max_length=32, description="ISO date lower bound (inclusive)"),
+    end: Optional[str] = Query(None, min_length=10, max_length=32, description="ISO date upper bound (inclusive)"),
+) -> InsightStats:
+    return insight_stats(term, start, end)
+
+
+@app.get("/insights/search", response_model=InsightSearchResponse)
+def search_insights_endpoint(
+    q: str = Query(..., min_length=1, max_length=500),
+    k: int = Query(10, ge=1, le=100),
+    term: Optional[str] = Query(None, min_length=1, max_length=200),
+) -> InsightSearchResponse:
+    return search_similar(embed_text(q, VECTOR_DIM), k, term)
+
+
+@app.get("/insights/{insight_id}/similar", response_model=InsightSearchResponse)
+def similar_insights_endpoint(
+    insight_id: int,
+    k: int = Query(10, ge=1, le=100),
+    term: Optional[str] = Query(None, min_length=1, max_length=200),
+) -> InsightSearchResponse:
+    vector = vector_index.get(insight_id)
+    if vector is None:
+        raise HTTPException(status_code=404, detail="Insight not found in vector index")
+    return search_similar(vector, k, term, exclude=insight_id)
+
+
+@app.get("/llm/usage", response_model=LLMUsageResponse)
+def llm_usage_endpoint(
+    term: Optional[str] = Query(None, min_length=1, max_length=200),
+    start: Optional[str] = Query(None, min_length=10, max_length=32, description="ISO date lower bound (inclusive)"),
+    end: Optional[str] = Query(None, min_length=10, max_length=32, description="ISO date upper bound (inclusive)"),
+    model: Optional[str] = Query(None, min_length=1, max_length=100),
+) -> LLMUsageResponse:
+    return llm_usage_summary(term, start, end, model)
+
+
+@app.get("/history", response_model=List[Insight], response_model_exclude_unset=True)
+def get_history(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[int] = Query(None, ge=1),
+    view: str = Query("summary", pattern="^(summary|detail|full)$"),
+    fields: Optional[str] = Query(None, max_length=1000),
+) -> List[Insight]:
+    columns = resolve_insight_columns(view, fields)
+    data = list_insights(None, limit, 0, columns=columns, cursor=cursor, include_total=False)
     return data.items
 
 
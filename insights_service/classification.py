@@ -0,0 +1,99 @@
+import json
+import re
+from typing import Any, Dict, Tuple
+
+CLASSIFICATION_SYSTEM_PROMPT = (
+    "Eres un analista experto en inteligencia de negocios que recibe noticias y genera análisis profundos y accionables. "
+    "Siempre respondes únicamente JSON válido siguiendo el esquema proporcionado."
+)
+
+# Prefijo estático: debe ser idéntico byte a byte entre llamadas para aprovechar el prompt caching
+CLASSIFICATION_PROMPT_PREFIX = """
+Analiza esta noticia en profundidad y responde con JSON usando exactamente estas claves:
+
+{
+  "sentimiento": "positivo|negativo|neutro|indeterminado",
+  "resumen": "resumen breve de 10 palabras para referencia rápida",
+  "resumen_ejecutivo": "resumen ejecutivo detallado de 50-100 palabras que capture la esencia, implicaciones y contexto del artículo",
+  "categoria": "politica|tecnologia|finanzas|deportes|entretenimiento|salud|ciencia|otros",
+  "etiquetas": "palabra1,palabra2,palabra3",
+  "marca": "marca principal mencionada o null",
+  "entidad": "nombre propio principal (persona u organización) distinto de la marca o null",
+  "idioma": "codigo ISO 639-1",
+  "confianza": 0.0-1.0,
+  "relevancia": 1-5,
+  "accion_recomendada": "recomendación estratégica específica basada en el contenido",
+  "cita_clave": "frase textual más relevante o impactante del artículo",
+  "tono": "formal|casual|urgente|alarmista|tecnico|optimista|pesimista|neutral",
+  "temas_principales": "tema1,tema2,tema3 - máximo 5 temas clave",
+  "subtemas": "subtema1,subtema2,subtema3 - temas secundarios relevantes",
+  "stakeholders": "stakeholder1,stakeholder2 - personas u organizaciones clave afectadas o mencionadas",
+  "impacto_social": "descripción del impacto o relevancia social, o null si no aplica",
+  "impacto_economico": "descripción del impacto económico o financiero, o null si no aplica",
+  "impacto_politico": "descripción del impacto político o regulatorio, o null si no aplica",
+  "palabras_clave_contextuales": "keyword1,keyword2,keyword3 - términos clave con contexto",
+  "trending_topics": "#hashtag1,#hashtag2 - hashtags o trending topics relacionados",
+  "analisis_competitivo": "análisis de competidores o comparativas mencionadas, o null",
+  "credibilidad_fuente": 0.0-1.0,
+  "sesgo_detectado": "politico_izquierda|politico_derecha|comercial|neutral|pro_marca|anti_marca",
+  "localizacion_geografica": "pais1,ciudad1,region1 - ubicaciones geográficas relevantes mencionadas",
+  "fuentes_citadas": "fuente1,fuente2 - estudios, expertos o fuentes citadas en el artículo",
+  "datos_numericos": "dato1: valor1, dato2: valor2 - estadísticas o números clave del artículo",
+  "urgencia": "baja|media|alta|critica",
+  "audiencia_objetivo": "B2B|B2C|gobierno|academico|general|profesional"
+}
+
+Si un dato no existe o no es aplicable, usa null. No agregues texto adicional fuera del JSON.
+
+"""
+
+# Valores permitidos derivados del propio esquema del prompt, para que no se desincronicen
+CLASSIFICATION_ENUMS: Dict[str, Tuple[str, ...]] = {
+    key: tuple(options.split("|"))
+    for key, options in re.findall(r'^\s*"(\w+)": "(\w+(?:\|\w+)+)"', CLASSIFICATION_PROMPT_PREFIX, re.MULTILINE)
+}
+# Rangos numéricos "min-max"; con límites enteros (relevancia) el valor se redondea
+CLASSIFICATION_RANGES: Dict[str, Tuple[float, float, bool]] = {
+    key: (float(low), float(high), "." not in low + high)
+    for key, low, high in re.findall(r'^\s*"(\w+)": ([\d.]+)-([\d.]+)', CLASSIFICATION_PROMPT_PREFIX, re.MULTILINE)
+}
+NULL_STRINGS = {"null", "none", "n/a"}
+
+
+def normalize_classification(data: Any) -> Dict[str, Any]:
+    """Coerce one parsed classification answer to the column values stored in ``insights``.
+
+    Shared by the live classification path and ``reclassify.py``. Lists become comma-separated text,
+    objects JSON, null-like strings None; enum values outside the schema and non-numeric scores are
+    dropped, and scores are clamped to their range.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("LLM response is not a JSON object")
+    cleaned: Dict[str, Any] = {}
+    for key, value in data.items():
+        if isinstance(value, list):
+            value = ",".join(str(item).strip() for item in value if item is not None and str(item).strip())
+        elif isinstance(value, dict):
+            value = json.dumps(value, ensure_ascii=False)
+        if isinstance(value, str):
+            value = value.strip()
+            if not value or value.lower() in NULL_STRINGS:
+                value = None
+        cleaned[key] = value
+
+    for key, allowed in CLASSIFICATION_ENUMS.items():
+        value = cleaned.get(key)
+        if value is not None:
+            cleaned[key] = {option.lower(): option for option in allowed}.get(str(value).lower())
+
+    for key, (low, high, integer) in CLASSIFICATION_RANGES.items():
+        value = cleaned.get(key)
+        if value is None:
+            continue
+        try:
+            number = min(max(float(value), low), high)
+        except (TypeError, ValueError):
+            cleaned[key] = None
+            continue
+        cleaned[key] = int(round(number)) if integer else number
+    return cleaned
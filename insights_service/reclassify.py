@@ -0,0 +1,160 @@
+"""Reclasifica en bloque los insights guardados con el prompt y modelo vigentes.
+
+Recorre `insights` por id en bloques, lanza las llamadas al LLM con concurrencia acotada, valida el
+JSON en un pool de procesos y escribe cada bloque en una única transacción. Las filas quedan
+etiquetadas con `prompt_version`/`llm_model`, así que volver a ejecutar el comando sólo procesa las
+que siguen desactualizadas.
+
+    python reclassify.py --chunk-size 200 --concurrency 8 --parse-workers 4
+"""
+
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from classification import normalize_classification
+
+
+def validate_classification(raw_text: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Parse and normalise one LLM answer with the live path's rules. Runs in worker processes."""
+    start = raw_text.find("{")
+    end = raw_text.rfind("}")
+    if start == -1 or end == -1:
+        return None, "LLM response did not contain JSON object"
+    try:
+        return normalize_classification(json.loads(raw_text[start : end + 1])), None
+    except json.JSONDecodeError as exc:
+        return None, f"Invalid JSON from LLM: {exc}"
+    except ValueError as exc:
+        return None, str(exc)
+
+
+def stale_rows_query(term: Optional[str], include_triaged: bool) -> str:
+    """SELECT for the next chunk; params are (last_id, prompt_version, llm_model[, term], limit)."""
+    filters = ["id > ?", "(prompt_version IS DISTINCT FROM ? OR llm_model IS DISTINCT FROM ?)"]
+    if term:
+        filters.append("term = ?")
+    if not include_triaged:
+        filters.append("(triage IS NULL OR triage = 'llm')")
+    return f"SELECT * FROM insights WHERE {' AND '.join(filters)} ORDER BY id LIMIT ?"
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Reclasifica insights con el prompt/modelo actuales.")
+    parser.add_argument("--chunk-size", type=int, default=200, help="filas leídas y escritas por transacción")
+    parser.add_argument("--concurrency", type=int, default=8, help="llamadas simultáneas al LLM")
+    parser.add_argument("--parse-workers", type=int, default=2, help="procesos para validar el JSON")
+    parser.add_argument("--limit", type=int, default=None, help="máximo de filas a procesar")
+    parser.add_argument("--term", default=None, help="sólo filas de este término")
+    parser.add_argument("--start-id", type=int, default=0, help="empezar después de este id")
+    parser.add_argument(
+        "--include-triaged",
+        action="store_true",
+        help="incluir filas que el triaje resolvió sin LLM",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    # Import diferido: los procesos del pool sólo necesitan validate_classification
+    import app
+
+    select_sql = stale_rows_query(args.term, args.include_triaged)
+    params: List[Any] = [app.PROMPT_VERSION, app.LLM_MODEL] + ([args.term] if args.term else [])
+    assignments = ", ".join(f"{field} = ?" for field in app.LLM_FIELDS)
+    update_sql = (
+        f"UPDATE insights SET {assignments}, triage = ?, prompt_version = ?, llm_model = ?, classified_at = ? "
+        "WHERE id = ?"
+    )
+
+    def complete(row: Dict[str, Any]) -> str:
+        article = {
+            "title": row["article_title"],
+            "description": row["article_description"],
+            "content": row["article_content"],
+        }
+        return app.post_openai_completion(app.CLASSIFICATION_SYSTEM_PROMPT, app.build_classification_prompt(article))
+
+    def fetch(row: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+        app.llm_call_context.set({"endpoint": "reclassify", "term": row["term"]})
+        try:
+            return app.call_llm_with_retry(row, call=complete), None
+        except app.HTTPException as exc:
+            return None, str(exc.detail)
+
+    print(
+        f"Reclasificando con prompt_version={app.PROMPT_VERSION} model={app.LLM_MODEL}",
+        file=sys.stderr,
+        flush=True,
+    )
+    last_id = args.start_id
+    processed = updated = failed = 0
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as llm_pool, ProcessPoolExecutor(
+        max_workers=args.parse_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as parse_pool:
+        while args.limit is None or processed < args.limit:
+            size = args.chunk_size if args.limit is None else min(args.chunk_size, args.limit - processed)
+            cursor = app.database.reader().execute(select_sql, (last_id, *params, size))
+            rows = [dict(row) for row in cursor.fetchall()]
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+
+            answers = list(llm_pool.map(fetch, rows))
+            raw_texts = [raw or "" for raw, _ in answers]
+            parsed = list(parse_pool.map(validate_classification, raw_texts, chunksize=16))
+
+            results = []
+            for row, (raw, call_error), (data, parse_error) in zip(rows, answers, parsed):
+                error = call_error or (parse_error if raw is not None else None)
+                if data is None:
+                    failed += 1
+                    print(f"  id={row['id']} sin reclasificar: {error}", file=sys.stderr, flush=True)
+                    continue
+                results.append((row, data))
+
+            now = datetime.utcnow().isoformat()
+            with app.database.write() as db:
+                for row, data in results:
+                    app.update_insight_rollups(db, row["term"], row["created_at"], row, delta=-1)
+                    db.execute(
+                        update_sql,
+                        (
+                            *(data.get(field) for field in app.LLM_FIELDS),
+                            None if row["triage"] is None else "llm",
+                            app.PROMPT_VERSION,
+                            app.LLM_MODEL,
+                            now,
+                            row["id"],
+                        ),
+                    )
+                    app.replace_insight_facets(db, row["id"], row["term"], row["created_at"], data)
+                    app.update_insight_rollups(db, row["term"], row["created_at"], data)
+            for row, data in results:
+                article = {"title": row["article_title"], "description": row["article_description"]}
+                app.index_insight_vector(row["id"], app.article_embedding_text(article, data))
+
+            processed += len(rows)
+            updated += len(results)
+            elapsed = max(time.monotonic() - started, 1e-6)
+            print(
+                f"{processed} procesadas ({updated} actualizadas, {failed} fallidas) hasta id={last_id} "
+                f"- {processed / elapsed * 60:.1f} artículos/min",
+                file=sys.stderr,
+                flush=True,
+            )
+
+    app.vector_index.flush()
+    print(f"Listo: {updated} actualizadas, {failed} fallidas en {time.monotonic() - started:.1f}s", flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+import fcntl
+import json
+import logging
+import math
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("uvicorn.error")
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_GROW_ROWS = 65536
+_STOPWORDS = {
+    "el", "la", "los", "las", "de", "del", "que", "y", "en", "un", "una", "por", "con", "para", "es", "se",
+    "su", "al", "como", "mas", "the", "of", "and", "to", "in", "is", "that", "for", "on", "with", "as",
+    "was", "by", "at", "from", "it", "an", "are", "be", "this", "null",
+}
+
+
+def _normalize(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def embed_text(text: str, dim: int) -> np.ndarray:
+    """Hashed word + char-trigram vector with sublinear TF, L2-normalised. Fully offline."""
+    counts: Dict[int, float] = {}
+    for word in _WORD_RE.findall(_normalize(text)):
+        if word in _STOPWORDS or len(word) < 2:
+            continue
+        features = [f"w:{word}"]
+        padded = f" {word} "
+        features.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        for feature in features:
+            bucket = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if bucket & 0x80000000 else -1.0
+            slot = bucket % dim
+            counts[slot] = counts.get(slot, 0.0) + sign * (2.0 if feature[0] == "w" else 1.0)
+    vector = np.zeros(dim, dtype=np.float32)
+    for slot, value in counts.items():
+        vector[slot] = math.copysign(1.0 + math.log(abs(value)), value) if value else 0.0
+    norm = float(np.linalg.norm(vector))
+    if norm:
+        vector /= norm
+    return vector
+
+
+class VectorIndex:
+    """Memory-mapped float32 matrix addressed by insight id, with an optional IVF partition.
+
+    Row ``i`` holds the vector of insight ``i``; rows never written stay zero and never match.
+    Once ``train_threshold`` rows exist, a spherical k-means codebook of ``nlist`` centroids is
+    trained in a background thread and searches only scan the ``nprobe`` closest partitions.
+
+    The files may be shared by several processes (uvicorn workers, ``reclassify.py``): the
+    watermark only moves forward under a file lock, and readers pick up rows, meta and
+    centroids written elsewhere before every lookup. The watermark is persisted at most every
+    ``meta_interval`` seconds and on ``flush()``, not on every insert.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dim: int,
+        nlist: int = 256,
+        nprobe: int = 8,
+        train_threshold: int = 20000,
+        meta_interval: float = 1.0,
+    ):
+        self.path = path
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.meta_interval = meta_interval
+        self._lock = threading.RLock()
+        self._vectors_path = f"{path}.f32"
+        self._assign_path = f"{path}.ivf.i32"
+        self._centroids_path = f"{path}.centroids.npy"
+        self._meta_path = f"{path}.json"
+        self._lock_path = f"{path}.lock"
+        self._train_lock_path = f"{path}.train.lock"
+        self.watermark = 0
+        self._meta_mtime = 0
+        self._centroids_mtime = 0
+        self._training: Optional[threading.Thread] = None
+        self._meta_timer: Optional[threading.Timer] = None
+        self._vectors: Optional[np.memmap] = None
+        self._assign: Optional[np.memmap] = None
+        self._centroids: Optional[np.ndarray] = None
+        self._open()
+
+    def _open(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._file_lock():
+            meta = self._read_meta()
+            if meta and meta.get("dim") != self.dim:
+                logger.warning("Vector index dim changed (%s -> %s); rebuilding", meta.get("dim"), self.dim)
+                for stale in (self._vectors_path, self._assign_path, self._centroids_path, self._meta_path):
+                    if os.path.exists(stale):
+                        os.remove(stale)
+            self._map(max(_GROW_ROWS, self.capacity))
+        self._refresh()
+
+    @contextmanager
+    def _file_lock(self, path: Optional[str] = None) -> Iterator[None]:
+        """Exclusive lock shared by every process that opens the same index."""
+        with open(path or self._lock_path, "a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _read_meta(self) -> Dict[str, int]:
+        try:
+            with open(self._meta_path, "r", encoding="utf-8") as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return {}
+
+    def _refresh(self) -> None:
+        """Adopt the watermark, file growth and codebook that other processes wrote since the last call."""
+        with self._lock:
+            meta_mtime = _mtime(self._meta_path)
+            if meta_mtime != self._meta_mtime:
+                self._meta_mtime = meta_mtime
+                meta = self._read_meta()
+                if meta.get("dim") == self.dim:
+                    self.watermark = max(self.watermark, int(meta.get("watermark", 0)))
+            if self.capacity > len(self._vectors):
+                self._vectors.flush()
+                self._map(self.capacity)
+            centroids_mtime = _mtime(self._centroids_path)
+            if centroids_mtime != self._centroids_mtime and self.watermark:
+                self._centroids_mtime = centroids_mtime
+                self._centroids = np.load(self._centroids_path)
+
+    @property
+    def capacity(self) -> int:
+        if not os.path.exists(self._vectors_path):
+            return 0
+        return os.path.getsize(self._vectors_path) // (self.dim * 4)
+
+    def _map(self, rows: int) -> None:
+        for file_path, width in ((self._vectors_path, self.dim * 4), (self._assign_path, 4)):
+            with open(file_path, "ab"):
+                pass
+            current = os.path.getsize(file_path) // width
+            if current < rows:
+                os.truncate(file_path, rows * width)
+                if file_path == self._assign_path:
+                    np.memmap(file_path, dtype=np.int32, mode="r+", shape=(rows,))[current:] = -1
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(rows, self.dim))
+        self._assign = np.memmap(self._assign_path, dtype=np.int32, mode="r+", shape=(rows,))
+
+    def _save_meta(self) -> None:
+        # Max-merge bajo lock: un proceso con una marca más baja nunca retrocede la de otro
+        with self._file_lock():
+            self.watermark = max(self.watermark, int(self._read_meta().get("watermark", 0)))
+            tmp_path = f"{self._meta_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as handle:
+                json.dump({"dim": self.dim, "watermark": self.watermark}, handle)
+            os.replace(tmp_path, self._meta_path)
+            self._meta_mtime = _mtime(self._meta_path)
+
+    def add(self, row_id: int, vector: np.ndarray) -> None:
+        with self._lock:
+            if row_id >= len(self._vectors):
+                self._vectors.flush()
+                with self._file_lock():
+                    self._map(max((row_id // _GROW_ROWS + 1) * _GROW_ROWS, self.capacity))
+            self._vectors[row_id] = vector
+            if self._centroids is not None and vector.any():
+                self._assign[row_id] = int(np.argmax(self._centroids @ vector))
+            if row_id > self.watermark:
+                self.watermark = row_id
+                self._schedule_meta()
+            if self._centroids is None and self.watermark >= self.train_threshold and self._training is None:
+                self._training = threading.Thread(target=self._train_in_background, name="vector-train", daemon=True)
+                self._training.start()
+
+    def _train_in_background(self) -> None:
+        try:
+            self.train()
+        except Exception:
+            logger.exception("Vector index training failed")
+        finally:
+            self._training = None
+
+    def _schedule_meta(self) -> None:
+        if self._meta_timer is None:
+            self._meta_timer = threading.Timer(self.meta_interval, self._save_pending_meta)
+            self._meta_timer.daemon = True
+            self._meta_timer.start()
+
+    def _save_pending_meta(self) -> None:
+        with self._lock:
+            self._meta_timer = None
+            self._save_meta()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._vectors.flush()
+            self._assign.flush()
+            if self._meta_timer is not None:
+                self._meta_timer.cancel()
+                self._meta_timer = None
+                self._save_meta()
+
+    def get(self, row_id: int) -> Optional[np.ndarray]:
+        self._refresh()
+        with self._lock:
+            if row_id <= 0 or row_id > self.watermark:
+                return None
+            vector = np.array(self._vectors[row_id])
+        return vector if vector.any() else None
+
+    def train(self, iterations: int = 10, seed: int = 7) -> None:
+        """Fit the IVF codebook; k-means runs outside the index lock so adds and searches keep going."""
+        # Lock propio del entrenamiento: el de la meta lo toman los add() con self._lock ya adquirido
+        with self._file_lock(self._train_lock_path):
+            self._refresh()
+            if self._centroids is not None:
+                return  # otro proceso ya lo entrenó
+            with self._lock:
+                rows = self.watermark + 1
+                vectors = self._vectors
+            filled = np.flatnonzero(np.asarray(vectors[:rows].any(axis=1)))
+            if len(filled) < self.nlist:
+                return
+            rng = np.random.default_rng(seed)
+            sample_ids = rng.choice(filled, size=min(len(filled), self.nlist * 30), replace=False)
+            sample = np.asarray(vectors[np.sort(sample_ids)])
+            centroids = sample[rng.choice(len(sample), size=self.nlist, replace=False)].copy()
+            for _ in range(iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                for cluster in range(self.nlist):
+                    members = sample[labels == cluster]
+                    if len(members):
+                        centroid = members.sum(axis=0)
+                        norm = np.linalg.norm(centroid)
+                        centroids[cluster] = centroid / norm if norm else centroid
+            centroids = centroids.astype(np.float32)
+            for start in range(0, rows, _GROW_ROWS):
+                block = np.asarray(vectors[start : start + _GROW_ROWS])
+                labels = np.argmax(block @ centroids.T, axis=1).astype(np.int32)
+                labels[~block.any(axis=1)] = -1
+                self._assign[start : start + len(block)] = labels
+            with self._lock:
+                # Filas añadidas durante el entrenamiento: se asignan ya con el codebook nuevo
+                for row_id in range(rows, self.watermark + 1):
+                    vector = np.asarray(self._vectors[row_id])
+                    if vector.any():
+                        self._assign[row_id] = int(np.argmax(centroids @ vector))
+                self._assign.flush()
+                self._centroids = centroids
+                tmp_path = f"{self._centroids_path}.{os.getpid()}.tmp.npy"
+                np.save(tmp_path, centroids)
+                os.replace(tmp_path, self._centroids_path)
+                self._centroids_mtime = _mtime(self._centroids_path)
+        logger.info("Trained IVF vector index with %s lists over %s vectors", self.nlist, len(filled))
+
+    def search(
+        self, query: np.ndarray, k: int, exclude: Optional[int] = None, allowed: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """Top ``k`` rows by cosine similarity; with ``allowed`` only those ids are scanned, exhaustively."""
+        self._refresh()
+        with self._lock:
+            vectors = self._vectors
+            rows = min(self.watermark + 1, len(vectors))
+            if allowed is not None:
+                # Subconjunto (p. ej. un término): sin IVF, para no perder filas fuera de las listas sondeadas
+                candidates = np.unique(allowed[(allowed > 0) & (allowed < rows)])
+                scores = np.asarray(vectors[candidates]) @ query
+            elif self._centroids is not None:
+                probe = np.argsort(self._centroids @ query)[-self.nprobe :]
+                # -1: filas que otro proceso escribió antes de cargar el codebook; se comparan siempre
+                assign = np.asarray(self._assign[:rows])
+                candidates = np.flatnonzero(np.isin(assign, probe) | (assign < 0))
+                scores = np.asarray(vectors[candidates]) @ query
+            else:
+                candidates = np.arange(rows)
+                scores = np.asarray(vectors[:rows]) @ query
+        if exclude is not None:
+            scores[candidates == exclude] = 0.0
+        wanted = min(k, len(scores))
+        if not wanted:
+            return []
+        top = np.argpartition(-scores, wanted - 1)[:wanted]
+        ranked = top[np.argsort(-scores[top])]
+        return [(int(candidates[i]), float(scores[i])) for i in ranked if scores[i] > 0]
+
+
+def _mtime(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
@@ -1,13 +1,25 @@
+import atexit
+import functools
+import hashlib
+import json
 import logging
 import os
+import random
+import re
 import sqlite3
-from datetime import datetime
-from typing import Any, Dict, Iterable, List, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from urllib.parse import urlparse, urlunparse
 
 import requests
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 
 NEWS_API_URL = os.environ.get("NEWS_API_URL", "https://newsapi.org/v2/everything")
@@ -22,10 +34,207 @@ WORLDNEWS_MAX_RESULTS = int(os.environ.get("WORLDNEWS_MAX_RESULTS", str(DEFAULT_
 GUARDIAN_API_URL = os.environ.get("GUARDIAN_API_URL", "https://content.guardianapis.com/search")
 GUARDIAN_MAX_RESULTS = int(os.environ.get("GUARDIAN_MAX_RESULTS", str(DEFAULT_PAGE_SIZE)))
 NEWS_DB_PATH = os.environ.get("NEWS_DB_PATH", "/data/news.db")
+# Postgres compartido por varias réplicas (esquema de serverless_lib/db.js); vacío = SQLite en NEWS_DB_PATH
+POSTGRES_URL = os.environ.get("POSTGRES_URL") or os.environ.get("DATABASE_URL", "")
+POSTGRES_POOL_MIN = int(os.environ.get("POSTGRES_POOL_MIN", "1"))
+POSTGRES_POOL_MAX = int(os.environ.get("POSTGRES_POOL_MAX", "5"))
+POSTGRES_POOL_TIMEOUT = float(os.environ.get("POSTGRES_POOL_TIMEOUT", "30"))
 NYT_API_URL = os.environ.get("NYT_API_URL", "https://api.nytimes.com/svc/search/v2/articlesearch.json")
 NYT_API_KEY = os.environ.get("NYT_API_KEY")
+# Trazas: fracción de peticiones muestreadas y destinos (JSONL y/o colector OTLP/HTTP, p. ej. :4318/v1/traces)
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.0"))
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH", "")
+TRACE_COLLECTOR_URL = os.environ.get("TRACE_COLLECTOR_URL", "")
+TRACE_FLUSH_SECONDS = float(os.environ.get("TRACE_FLUSH_SECONDS", "2"))
+TRACE_BATCH_SIZE = int(os.environ.get("TRACE_BATCH_SIZE", "1000"))
+TRACING_ENABLED = bool(TRACE_EXPORT_PATH or TRACE_COLLECTOR_URL)
+# false cuando insights_service importa el módulo para su /pipeline: el proceso anfitrión vacía sus buffers
+BACKGROUND_WORKERS_ENABLED = os.environ.get("SERVICE_BACKGROUND_WORKERS", "true").lower() in {"1", "true", "yes"}
 
 logger = logging.getLogger("uvicorn.error")
+SERVICE_NAME = "news_service"
+# Clave de pg_advisory_xact_lock con la que todos los servicios serializan su DDL al arrancar
+POSTGRES_SCHEMA_LOCK = 720451
+
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_OTLP_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+
+class Span:
+    """One timed step of a request trace (W3C trace-context ids); only sampled spans are exported."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "sampled", "attributes", "status", "start", "_clock")
+
+    def __init__(
+        self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool, kind: str, attributes: Dict[str, Any]
+    ):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.sampled = sampled
+        self.attributes = attributes
+        self.status = "ok"
+        self.start = time.time()
+        self._clock = time.perf_counter()
+
+    def fail(self, exc: BaseException) -> None:
+        self.status = "error"
+        self.attributes["error"] = f"{type(exc).__name__}: {getattr(exc, 'detail', exc)}"[:300]
+
+    def finish(self) -> None:
+        if not self.sampled:
+            return
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "service": SERVICE_NAME,
+            "name": self.name,
+            "kind": self.kind,
+            "start": round(self.start, 6),
+            "duration_ms": round((time.perf_counter() - self._clock) * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+        with _trace_lock:
+            _trace_buffer.append(record)
+            full = len(_trace_buffer) >= TRACE_BATCH_SIZE
+        if full:
+            flush_traces()
+
+
+# Span activo de la petición en curso; los hilos lanzados con copy_context lo heredan
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_trace_lock = threading.Lock()
+_trace_buffer: List[Dict[str, Any]] = []
+
+
+def start_trace(name: str, traceparent: Optional[str]) -> Span:
+    """Root span of an incoming request: continue the caller's trace or start one, sampled at TRACE_SAMPLE_RATE."""
+    match = _TRACEPARENT_RE.match((traceparent or "").strip().lower())
+    if match:
+        trace_id, parent_id, flags = match.groups()
+        return Span(name, trace_id, parent_id, bool(int(flags, 16) & 1), "server", {})
+    return Span(name, os.urandom(16).hex(), None, random.random() < TRACE_SAMPLE_RATE, "server", {})
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes: Any) -> Iterator[Optional[Span]]:
+    """Child of the current span; a no-op (yields None) outside a sampled request."""
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        yield None
+        return
+    current = Span(name, parent.trace_id, parent.span_id, True, kind, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.fail(exc)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish()
+
+
+def traced(name: Optional[str] = None, kind: str = "internal") -> Callable:
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name or func.__name__, kind):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def trace_headers() -> Dict[str, str]:
+    """``traceparent`` for outgoing calls to our other services, carrying the sampling decision."""
+    current = _current_span.get()
+    if current is None:
+        return {}
+    return {"traceparent": f"00-{current.trace_id}-{current.span_id}-{'01' if current.sampled else '00'}"}
+
+
+class TracedConnection(sqlite3.Connection):
+    """sqlite3 connection that records every statement as a span while a sampled request is running."""
+
+    def execute(self, sql: str, parameters: Any = (), /) -> sqlite3.Cursor:
+        with span(f"sqlite {sql.split(None, 1)[0].upper()}", statement=" ".join(sql.split())[:300]):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql: str, parameters: Any, /) -> sqlite3.Cursor:
+        with span(f"sqlite {sql.split(None, 1)[0].upper()}", statement=" ".join(sql.split())[:300], many=True):
+            return super().executemany(sql, parameters)
+
+
+def otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_span(record: Dict[str, Any]) -> Dict[str, Any]:
+    start = int(record["start"] * 1e9)
+    return {
+        "traceId": record["trace_id"],
+        "spanId": record["span_id"],
+        "parentSpanId": record["parent_id"] or "",
+        "name": record["name"],
+        "kind": _OTLP_KINDS.get(record["kind"], 1),
+        "startTimeUnixNano": str(start),
+        "endTimeUnixNano": str(start + int(record["duration_ms"] * 1e6)),
+        "attributes": [{"key": key, "value": otlp_value(value)} for key, value in record["attributes"].items()],
+        "status": {"code": 2 if record["status"] == "error" else 1},
+    }
+
+
+def flush_traces() -> None:
+    """Append buffered spans to TRACE_EXPORT_PATH (JSONL) and/or POST them to an OTLP/HTTP collector."""
+    with _trace_lock:
+        records = list(_trace_buffer)
+        _trace_buffer.clear()
+    if not records:
+        return
+    if TRACE_EXPORT_PATH:
+        lines = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+        try:
+            # Un único write con O_APPEND: varios workers pueden compartir el archivo sin mezclar líneas
+            fd = os.open(TRACE_EXPORT_PATH, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, lines.encode("utf-8"))
+            finally:
+                os.close(fd)
+        except OSError as exc:
+            logger.warning("Could not write %s spans to %s: %s", len(records), TRACE_EXPORT_PATH, exc)
+    if TRACE_COLLECTOR_URL:
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                    "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": [otlp_span(record) for record in records]}],
+                }
+            ]
+        }
+        try:
+            requests.post(TRACE_COLLECTOR_URL, json=payload, timeout=5).raise_for_status()
+        except requests.RequestException as exc:
+            logger.warning("Could not export %s spans to %s: %s", len(records), TRACE_COLLECTOR_URL, exc)
+
+
+def trace_flush_loop() -> None:
+    while True:
+        time.sleep(TRACE_FLUSH_SECONDS)
+        flush_traces()
+
 
 app = FastAPI(title="News Proxy API", version="0.1.0")
 app.add_middleware(
@@ -37,6 +246,44 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next: Callable) -> Response:
+    if not TRACING_ENABLED:
+        return await call_next(request)
+    root = start_trace(f"{request.method} {request.url.path}", request.headers.get("traceparent"))
+    root.attributes.update({"http.method": request.method, "http.target": str(request.url.path)})
+    if request.url.query:
+        root.attributes["http.query"] = request.url.query[:300]
+    token = _current_span.set(root)
+    try:
+        response = await call_next(request)
+    except Exception as exc:
+        root.fail(exc)
+        root.finish()
+        raise
+    finally:
+        _current_span.reset(token)
+    root.attributes["http.status_code"] = response.status_code
+    if response.status_code >= 500:
+        root.status = "error"
+    body = getattr(response, "body_iterator", None)
+    if body is None:
+        root.finish()
+    else:
+        # Respuestas en streaming (SSE/NDJSON): el span raíz cubre hasta el último byte enviado
+        async def finish_after_body() -> AsyncIterator[bytes]:
+            try:
+                async for chunk in body:
+                    yield chunk
+            finally:
+                root.finish()
+
+        response.body_iterator = finish_after_body()
+    # El cliente puede buscar la traza de una petición lenta por este id
+    response.headers["traceparent"] = f"00-{root.trace_id}-{root.span_id}-{'01' if root.sampled else '00'}"
+    return response
+
+
 class Source(BaseModel):
     id: Optional[str]
     name: Optional[str]
@@ -133,40 +380,282 @@ def parse_datetime_to_timestamp(raw: Optional[str]) -> float:
     return 0.0
 
 
-def get_db_connection() -> sqlite3.Connection:
-    dirpath = os.path.dirname(NEWS_DB_PATH) or "."
-    os.makedirs(dirpath, exist_ok=True)
-    conn = sqlite3.connect(NEWS_DB_PATH, check_same_thread=False)
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS news_archive (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            normalized_url TEXT NOT NULL UNIQUE,
-            url TEXT,
-            source_name TEXT,
-            source_id TEXT,
-            author TEXT,
-            title TEXT,
-            description TEXT,
-            url_to_image TEXT,
-            published_at TEXT,
-            content TEXT,
-            category TEXT,
-            term TEXT,
-            language TEXT,
-            saved_at TEXT NOT NULL
-        );
-        """
+class SqliteArchive:
+    """Archive in a local SQLite file (``NEWS_DB_PATH``) behind one shared connection; a single replica."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(
+            path, check_same_thread=False, factory=TracedConnection if TRACING_ENABLED else sqlite3.Connection
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS news_archive (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                normalized_url TEXT NOT NULL UNIQUE,
+                url TEXT,
+                source_name TEXT,
+                source_id TEXT,
+                author TEXT,
+                title TEXT,
+                description TEXT,
+                url_to_image TEXT,
+                published_at TEXT,
+                content TEXT,
+                category TEXT,
+                term TEXT,
+                language TEXT,
+                saved_at TEXT NOT NULL
+            );
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_news_archive_pub ON news_archive(published_at DESC, saved_at DESC);")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_news_archive_source ON news_archive(source_name);")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_news_archive_category ON news_archive(category);")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_news_archive_text ON news_archive(title, description, content);")
+        self.conn.commit()
+
+    def insert(self, rows: List[Dict[str, Any]]) -> None:
+        self.conn.executemany(
+            """
+            INSERT OR IGNORE INTO news_archive (
+                normalized_url, url, source_name, source_id, author, title, description,
+                url_to_image, published_at, content, category, term, language, saved_at
+            ) VALUES (
+                :normalized_url, :url, :source_name, :source_id, :author, :title, :description,
+                :url_to_image, :published_at, :content, :category, :term, :language, :saved_at
+            )
+            """,
+            rows,
+        )
+        self.conn.commit()
+
+    def page(
+        self,
+        term: Optional[str],
+        source: Optional[str],
+        category: Optional[str],
+        order: str,
+        limit: int,
+        offset: int,
+    ) -> Tuple[int, List[Tuple[Any, ...]]]:
+        params: List[Any] = []
+        where_clauses: List[str] = []
+        if term:
+            where_clauses.append(
+                "(LOWER(COALESCE(title, '')) LIKE ? OR LOWER(COALESCE(description, '')) LIKE ? OR LOWER(COALESCE(content, '')) LIKE ?)"
+            )
+            like_term = f"%{term.lower()}%"
+            params.extend([like_term, like_term, like_term])
+        if source:
+            where_clauses.append("source_name = ?")
+            params.append(source)
+        if category:
+            where_clauses.append("category = ?")
+            params.append(category)
+
+        where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+
+        total_row = self.conn.execute(f"SELECT COUNT(1) FROM news_archive {where_sql}", params).fetchone()
+        total = total_row[0] if total_row else 0
+
+        params_with_paging = list(params)
+        params_with_paging.extend([limit, offset])
+        order_dir = "ASC" if order and order.lower() == "asc" else "DESC"
+        rows = self.conn.execute(
+            f"""
+            SELECT url, source_name, source_id, author, title, description, url_to_image,
+                   published_at, content, category, term, saved_at
+            FROM news_archive
+            {where_sql}
+            ORDER BY COALESCE(published_at, saved_at) {order_dir}, id {order_dir}
+            LIMIT ? OFFSET ?
+            """,
+            params_with_paging,
+        ).fetchall()
+        return total, rows
+
+    def facets(self, limit: int) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
+        sources_rows = self.conn.execute(
+            """
+            SELECT source_name, COUNT(1) as cnt
+            FROM news_archive
+            WHERE source_name IS NOT NULL
+            GROUP BY source_name
+            ORDER BY cnt DESC
+            LIMIT ?
+            """,
+            (limit,),
+        ).fetchall()
+        categories_rows = self.conn.execute(
+            """
+            SELECT category, COUNT(1) as cnt
+            FROM news_archive
+            WHERE category IS NOT NULL
+            GROUP BY category
+            ORDER BY cnt DESC
+            LIMIT ?
+            """,
+            (limit,),
+        ).fetchall()
+        return sources_rows, categories_rows
+
+
+# Esquema de serverless_lib/db.js (más `language`): las réplicas de este servicio y las funciones serverless
+# comparten la misma tabla
+POSTGRES_NEWS_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS news_articles (
+        id BIGSERIAL PRIMARY KEY,
+        term TEXT,
+        provider TEXT,
+        source JSONB,
+        author TEXT,
+        title TEXT,
+        description TEXT,
+        content TEXT,
+        url TEXT,
+        url_hash TEXT UNIQUE,
+        url_to_image TEXT,
+        category TEXT,
+        published_at TIMESTAMPTZ,
+        created_at TIMESTAMPTZ DEFAULT NOW()
     )
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_news_archive_pub ON news_archive(published_at DESC, saved_at DESC);")
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_news_archive_source ON news_archive(source_name);")
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_news_archive_category ON news_archive(category);")
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_news_archive_text ON news_archive(title, description, content);")
-    conn.commit()
-    return conn
+    """,
+    "ALTER TABLE news_articles ADD COLUMN IF NOT EXISTS category TEXT",
+    "ALTER TABLE news_articles ADD COLUMN IF NOT EXISTS language TEXT",
+    "CREATE INDEX IF NOT EXISTS idx_news_term_created ON news_articles(term, created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_news_articles_recent ON news_articles((COALESCE(published_at, created_at)) DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_news_articles_source ON news_articles((source->>'name'))",
+    "CREATE INDEX IF NOT EXISTS idx_news_articles_category ON news_articles(category)",
+)
 
 
-db_conn = get_db_connection()
+def iso_or_none(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+class PostgresArchive:
+    """Archive in the ``news_articles`` table of a shared Postgres, through a connection pool; any number of replicas."""
+
+    def __init__(self, url: str):
+        from psycopg_pool import ConnectionPool
+
+        self.pool = ConnectionPool(
+            url,
+            min_size=POSTGRES_POOL_MIN,
+            max_size=POSTGRES_POOL_MAX,
+            timeout=POSTGRES_POOL_TIMEOUT,
+            kwargs={"autocommit": True, "options": "-c TimeZone=UTC"},
+            check=ConnectionPool.check_connection,
+            name=SERVICE_NAME,
+            open=True,
+        )
+        with self.pool.connection() as conn, conn.transaction():
+            # Réplicas que arrancan a la vez: el DDL se aplica de una en una
+            conn.execute("SELECT pg_advisory_xact_lock(%s)", (POSTGRES_SCHEMA_LOCK,))
+            for statement in POSTGRES_NEWS_DDL:
+                conn.execute(statement)
+
+    def insert(self, rows: List[Dict[str, Any]]) -> None:
+        records = []
+        for row in rows:
+            published = parse_datetime_to_timestamp(row["published_at"])
+            records.append(
+                {
+                    **row,
+                    # Mismo hash que saveArticles() en serverless_lib/news.js
+                    "url_hash": hashlib.sha256(row["normalized_url"].encode("utf-8")).hexdigest(),
+                    "source": json.dumps({"id": row["source_id"], "name": row["source_name"]}, ensure_ascii=False),
+                    "published_at": datetime.fromtimestamp(published, timezone.utc) if published else None,
+                }
+            )
+        with self.pool.connection() as conn:
+            conn.cursor().executemany(
+                """
+                INSERT INTO news_articles (
+                    term, source, author, title, description, content, url, url_hash,
+                    url_to_image, category, published_at, language
+                ) VALUES (
+                    %(term)s, %(source)s, %(author)s, %(title)s, %(description)s, %(content)s, %(url)s, %(url_hash)s,
+                    %(url_to_image)s, %(category)s, %(published_at)s, %(language)s
+                )
+                ON CONFLICT (url_hash) DO NOTHING
+                """,
+                records,
+            )
+
+    def page(
+        self,
+        term: Optional[str],
+        source: Optional[str],
+        category: Optional[str],
+        order: str,
+        limit: int,
+        offset: int,
+    ) -> Tuple[int, List[Tuple[Any, ...]]]:
+        params: List[Any] = []
+        where_clauses: List[str] = []
+        if term:
+            where_clauses.append("(title ILIKE %s OR description ILIKE %s OR content ILIKE %s)")
+            like_term = f"%{term}%"
+            params.extend([like_term, like_term, like_term])
+        if source:
+            where_clauses.append("source->>'name' = %s")
+            params.append(source)
+        if category:
+            where_clauses.append("category = %s")
+            params.append(category)
+        where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+        order_dir = "ASC" if order and order.lower() == "asc" else "DESC"
+        with self.pool.connection() as conn:
+            total = conn.execute(f"SELECT COUNT(1) FROM news_articles {where_sql}", params).fetchone()[0]
+            rows = conn.execute(
+                f"""
+                SELECT url, source->>'name', source->>'id', author, title, description, url_to_image,
+                       published_at, content, category, term, created_at
+                FROM news_articles
+                {where_sql}
+                ORDER BY COALESCE(published_at, created_at) {order_dir}, id {order_dir}
+                LIMIT %s OFFSET %s
+                """,
+                [*params, limit, offset],
+            ).fetchall()
+        # Mismo orden de columnas que en SQLite, con las fechas como texto ISO
+        return total, [(*row[:7], iso_or_none(row[7]), *row[8:11], iso_or_none(row[11])) for row in rows]
+
+    def facets(self, limit: int) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
+        with self.pool.connection() as conn:
+            sources_rows = conn.execute(
+                """
+                SELECT source->>'name' AS source_name, COUNT(1) AS cnt
+                FROM news_articles
+                WHERE source->>'name' IS NOT NULL
+                GROUP BY source->>'name'
+                ORDER BY cnt DESC
+                LIMIT %s
+                """,
+                (limit,),
+            ).fetchall()
+            categories_rows = conn.execute(
+                """
+                SELECT category, COUNT(1) AS cnt
+                FROM news_articles
+                WHERE category IS NOT NULL
+                GROUP BY category
+                ORDER BY cnt DESC
+                LIMIT %s
+                """,
+                (limit,),
+            ).fetchall()
+        return sources_rows, categories_rows
+
+
+archive = PostgresArchive(POSTGRES_URL) if POSTGRES_URL else SqliteArchive(NEWS_DB_PATH)
+if TRACING_ENABLED:
+    if BACKGROUND_WORKERS_ENABLED:
+        threading.Thread(target=trace_flush_loop, name="trace-flush", daemon=True).start()
+    atexit.register(flush_traces)
 
 
 def normalize_article(article: Dict[str, Any]) -> Dict[str, Any]:
@@ -202,6 +691,7 @@ def deduplicate_articles(articles: Iterable[Dict[str, Any]]) -> List[Dict[str, A
     return deduped
 
 
+@traced("provider.newsapi", "client")
 def fetch_newsapi_articles(term: str, language: Optional[str]) -> List[Dict[str, Any]]:
     api_key = os.environ.get("NEWS_API_KEY")
     if not api_key:
@@ -255,6 +745,7 @@ def _gnews_limit_reached(response: requests.Response) -> bool:
     return any("limit" in str(text).lower() for text in texts)
 
 
+@traced("provider.gnews", "client")
 def fetch_gnews_articles(term: str, language: Optional[str]) -> List[Dict[str, Any]]:
     api_key = os.environ.get("GNEWS_API_KEY")
     if not api_key:
@@ -310,6 +801,7 @@ def _newsdata_limit_reached(response: requests.Response, payload: Dict[str, Any]
     return "limit" in message or "rate" in message or status == "rate limit exceeded" or code in {"429", "rate limit exceeded"}
 
 
+@traced("provider.newsdata", "client")
 def fetch_newsdata_articles(term: str, language: Optional[str]) -> List[Dict[str, Any]]:
     api_key = os.environ.get("NEWSDATA_API_KEY")
     if not api_key:
@@ -371,6 +863,7 @@ def fetch_newsdata_articles(term: str, language: Optional[str]) -> List[Dict[str
     return normalized
 
 
+@traced("provider.worldnews", "client")
 def fetch_worldnews_articles(term: str, language: Optional[str]) -> List[Dict[str, Any]]:
     api_key = os.environ.get("WORLDNEWS_API_KEY")
     if not api_key:
@@ -434,6 +927,7 @@ def fetch_worldnews_articles(term: str, language: Optional[str]) -> List[Dict[st
     return normalized
 
 
+@traced("provider.guardian", "client")
 def fetch_guardian_articles(term: str, language: Optional[str]) -> List[Dict[str, Any]]:
     api_key = os.environ.get("GUARDIAN_API_KEY")
     if not api_key:
@@ -496,6 +990,7 @@ def fetch_guardian_articles(term: str, language: Optional[str]) -> List[Dict[str
     return normalized
 
 
+@traced("provider.nyt", "client")
 def fetch_nyt_articles(term: str, language: Optional[str]) -> List[Dict[str, Any]]:
     if not NYT_API_KEY:
         logger.info("NYT API key not configured; skipping NYT fetch.")
@@ -569,6 +1064,32 @@ def fetch_nyt_articles(term: str, language: Optional[str]) -> List[Dict[str, Any
     return normalized
 
 
+NEWS_PROVIDERS: Dict[str, Callable[[str, Optional[str]], List[Dict[str, Any]]]] = {
+    "newsapi": fetch_newsapi_articles,
+    "gnews": fetch_gnews_articles,
+    "newsdata": fetch_newsdata_articles,
+    "worldnews": fetch_worldnews_articles,
+    "guardian": fetch_guardian_articles,
+    "nyt": fetch_nyt_articles,
+}
+
+
+def fetch_provider_batches(
+    query: str, language: Optional[str]
+) -> Iterator[Tuple[str, List[Dict[str, Any]], Optional[str]]]:
+    """Query every provider concurrently and yield ``(provider, articles, error)`` as each one answers."""
+    with ThreadPoolExecutor(max_workers=len(NEWS_PROVIDERS), thread_name_prefix="news-provider") as pool:
+        futures = {
+            pool.submit(copy_context().run, fetch, query, language): name for name, fetch in NEWS_PROVIDERS.items()
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except HTTPException as exc:
+                yield futures[future], [], str(exc.detail)
+
+
+@traced()
 def store_articles(term: str, language: Optional[str], articles: List[Dict[str, Any]]) -> None:
     if not articles:
         return
@@ -579,37 +1100,29 @@ def store_articles(term: str, language: Optional[str], articles: List[Dict[str,
         if not normalized_url:
             continue
         rows.append(
-            (
-                normalized_url,
-                article.get("url"),
-                article.get("source", {}).get("name"),
-                article.get("source", {}).get("id"),
-                article.get("author"),
-                article.get("title"),
-                article.get("description"),
-                article.get("urlToImage") or article.get("image"),
-                article.get("publishedAt"),
-                article.get("content"),
-                article.get("category"),
-                term,
-                language,
-                now,
-            )
+            {
+                "normalized_url": normalized_url,
+                "url": article.get("url"),
+                "source_name": article.get("source", {}).get("name"),
+                "source_id": article.get("source", {}).get("id"),
+                "author": article.get("author"),
+                "title": article.get("title"),
+                "description": article.get("description"),
+                "url_to_image": article.get("urlToImage") or article.get("image"),
+                "published_at": article.get("publishedAt"),
+                "content": article.get("content"),
+                "category": article.get("category"),
+                "term": term,
+                "language": language,
+                "saved_at": now,
+            }
         )
     if not rows:
         return
-    db_conn.executemany(
-        """
-        INSERT OR IGNORE INTO news_archive (
-            normalized_url, url, source_name, source_id, author, title, description,
-            url_to_image, published_at, content, category, term, language, saved_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        rows,
-    )
-    db_conn.commit()
+    archive.insert(rows)
 
 
+@traced()
 def fetch_archive(
     term: Optional[str],
     source: Optional[str],
@@ -618,41 +1131,7 @@ def fetch_archive(
     limit: int,
     offset: int,
 ) -> ArchiveResponse:
-    params: List[Any] = []
-    where_clauses: List[str] = []
-    if term:
-        where_clauses.append(
-            "(LOWER(COALESCE(title, '')) LIKE ? OR LOWER(COALESCE(description, '')) LIKE ? OR LOWER(COALESCE(content, '')) LIKE ?)"
-        )
-        like_term = f"%{term.lower()}%"
-        params.extend([like_term, like_term, like_term])
-    if source:
-        where_clauses.append("source_name = ?")
-        params.append(source)
-    if category:
-        where_clauses.append("category = ?")
-        params.append(category)
-
-    where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
-
-    total_row = db_conn.execute(f"SELECT COUNT(1) FROM news_archive {where_sql}", params).fetchone()
-    total = total_row[0] if total_row else 0
-
-    params_with_paging = list(params)
-    params_with_paging.extend([limit, offset])
-    order_dir = "ASC" if order and order.lower() == "asc" else "DESC"
-    rows = db_conn.execute(
-        f"""
-        SELECT url, source_name, source_id, author, title, description, url_to_image,
-               published_at, content, category, term, saved_at
-        FROM news_archive
-        {where_sql}
-        ORDER BY COALESCE(published_at, saved_at) {order_dir}, id {order_dir}
-        LIMIT ? OFFSET ?
-        """,
-        params_with_paging,
-    ).fetchall()
-
+    total, rows = archive.page(term, source, category, order, limit, offset)
     articles: List[StoredArticle] = []
     for (
         url,
@@ -729,6 +1208,27 @@ def get_news(
     return NewsResponse(term=query, total_results=len(articles), articles=articles)
 
 
+@app.get("/news/stream")
+def stream_news(
+    term: str = Query(..., min_length=1, max_length=200, description="Keyword to search for"),
+    advanced: Optional[str] = Query(None, min_length=1, max_length=500, description="Advanced query string"),
+    language: Optional[str] = Query(None, min_length=2, max_length=2, description="ISO-639-1 language code"),
+) -> StreamingResponse:
+    """NDJSON, one line per provider as soon as it answers, so callers can start working on early batches."""
+    query = advanced or term
+
+    def lines() -> Iterator[str]:
+        seen_urls: set[str] = set()
+        for provider, articles, error in fetch_provider_batches(query, language):
+            fresh = [article for article in deduplicate_articles(articles) if normalize_url(article.get("url")) not in seen_urls]
+            seen_urls.update(filter(None, (normalize_url(article.get("url")) for article in fresh)))
+            store_articles(query, language, fresh)
+            batch = {"provider": provider, "articles": [Article(**article).model_dump() for article in fresh], "error": error}
+            yield json.dumps(batch, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @app.get("/news/archive", response_model=ArchiveResponse)
 def get_archive(
     term: Optional[str] = Query(None, min_length=1, max_length=200, description="Term used in searches"),
@@ -742,28 +1242,7 @@ def get_archive(
 
 
 def fetch_archive_meta(limit: int = 50) -> ArchiveMeta:
-    sources_rows = db_conn.execute(
-        """
-        SELECT source_name, COUNT(1) as cnt
-        FROM news_archive
-        WHERE source_name IS NOT NULL
-        GROUP BY source_name
-        ORDER BY cnt DESC
-        LIMIT ?
-        """,
-        (limit,),
-    ).fetchall()
-    categories_rows = db_conn.execute(
-        """
-        SELECT category, COUNT(1) as cnt
-        FROM news_archive
-        WHERE category IS NOT NULL
-        GROUP BY category
-        ORDER BY cnt DESC
-        LIMIT ?
-        """,
-        (limit,),
-    ).fetchall()
+    sources_rows, categories_rows = archive.facets(limit)
     sources = [ArchiveFacet(value=row[0], count=row[1]) for row in sources_rows if row[0]]
     categories = [ArchiveFacet(value=row[0], count=row[1]) for row in categories_rows if row[0]]
     return ArchiveMeta(sources=sources, categories=categories)
@@ -0,0 +1,464 @@
+"""End-to-end benchmark of the news → insights → analysis chain against local stand-ins.
+
+Starts news_service, insights_service and analysis_service (uvicorn, throwaway databases) pointing at
+a local stub that imitates the six news providers and the OpenAI API with configurable latency and
+failure profiles, drives a weighted mix of endpoints with concurrent clients and reports, per
+endpoint, throughput and latency percentiles, plus SQLite write-lock waits and the peak RSS of each
+service. `--save-baseline` stores the report and `--baseline` compares a new run against it,
+exiting non-zero on regressions beyond `--tolerance`.
+
+    python scripts/bench_pipeline.py --profile nominal --seconds 60 --save-baseline bench_baseline.json
+    python scripts/bench_pipeline.py --profile nominal --seconds 60 --baseline bench_baseline.json
+    python scripts/bench_pipeline.py --profile flaky --provider nyt=4000:0.3 --mix insights=3,list=1
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from stress_sqlite import STUB_ANSWER, free_port, start_service, wait_healthy
+
+PROVIDERS = ("newsapi", "gnews", "newsdata", "worldnews", "guardian", "nyt")
+# (latencia media ms, jitter ms, tasa de fallo) de proveedores y LLM para cada perfil
+PROFILES: Dict[str, Dict[str, Tuple[float, float, float]]] = {
+    "nominal": {"provider": (150, 80, 0.0), "llm": (600, 300, 0.0)},
+    "slow-providers": {"provider": (1500, 900, 0.02), "llm": (600, 300, 0.0)},
+    "slow-llm": {"provider": (150, 80, 0.0), "llm": (4000, 2000, 0.0)},
+    "flaky": {"provider": (250, 150, 0.15), "llm": (800, 400, 0.1)},
+}
+DEFAULT_MIX = "news=1,insights=2,classify=2,analysis=1,archive=2,list=3,history=1"
+PARAGRAPH = (
+    "{term} concentró la atención del mercado tras conocerse nuevos resultados trimestrales, cambios "
+    "regulatorios y reacciones de clientes en redes sociales. Analistas consultados señalaron que la "
+    "evolución de {term} durante las próximas semanas marcará la agenda del sector. "
+)
+
+
+class Stub:
+    """Latency/failure settings and call counters shared by the stub handler threads."""
+
+    def __init__(self, profile: Dict[str, Tuple[float, float, float]], overrides: Dict[str, Tuple[float, float, float]], per_provider: int, fresh_ratio: float, seed: int):
+        self.settings = {name: overrides.get(name, profile["provider"]) for name in PROVIDERS}
+        self.settings["openai"] = overrides.get("openai", profile["llm"])
+        self.per_provider = per_provider
+        self.fresh_ratio = fresh_ratio
+        self.rng = random.Random(seed)
+        self.sequence = itertools.count()
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.failures: Dict[str, int] = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def delay_and_fail(self, name: str) -> bool:
+        mean, jitter, failure_rate = self.settings[name]
+        with self.lock:
+            self.calls[name] += 1
+            pause = max(0.0, self.rng.gauss(mean, jitter / 2)) / 1000
+            failed = self.rng.random() < failure_rate
+            if failed:
+                self.failures[name] += 1
+        time.sleep(pause)
+        return failed
+
+    def articles(self, provider: str, term: str) -> List[Dict[str, Any]]:
+        """Half-stable article set per term so dedup, archive upserts and cache hits all get exercised."""
+        slug = term.lower().replace(" ", "-")
+        now = datetime.now(timezone.utc)
+        items = []
+        for index in range(self.per_provider):
+            with self.lock:
+                fresh = self.rng.random() < self.fresh_ratio
+            key = f"f{next(self.sequence)}" if fresh else f"s{index}"
+            items.append(
+                {
+                    "title": f"{term.title()}: novedades {key} según {provider}",
+                    "description": PARAGRAPH.format(term=term)[:220],
+                    "content": PARAGRAPH.format(term=term) * 6,
+                    "url": f"https://{provider}.bench.local/{slug}/{key}",
+                    "image": f"https://{provider}.bench.local/{slug}/{key}.jpg",
+                    "published": (now - timedelta(minutes=index * 7)).isoformat().replace("+00:00", "Z"),
+                    "author": f"Redacción {provider}",
+                }
+            )
+        return items
+
+    def provider_payload(self, provider: str, term: str) -> Dict[str, Any]:
+        items = self.articles(provider, term)
+        if provider == "newsapi":
+            return {
+                "status": "ok",
+                "articles": [
+                    {"source": {"id": "bench", "name": "NewsAPI Bench"}, "author": a["author"], "title": a["title"], "description": a["description"], "url": a["url"], "urlToImage": a["image"], "publishedAt": a["published"], "content": a["content"]}
+                    for a in items
+                ],
+            }
+        if provider == "gnews":
+            return {"articles": [{"title": a["title"], "description": a["description"], "content": a["content"], "url": a["url"], "image": a["image"], "publishedAt": a["published"], "source": {"name": "GNews Bench"}} for a in items]}
+        if provider == "newsdata":
+            return {
+                "status": "success",
+                "results": [
+                    {"title": a["title"], "link": a["url"], "description": a["description"], "content": a["content"], "pubDate": a["published"], "image_url": a["image"], "source_id": "bench", "source_name": "NewsData Bench", "creator": [a["author"]], "category": ["business"]}
+                    for a in items
+                ],
+            }
+        if provider == "worldnews":
+            return {"news": [{"title": a["title"], "summary": a["description"], "text": a["content"], "url": a["url"], "image": a["image"], "publish_date": a["published"], "authors": [a["author"]], "category": "business"} for a in items]}
+        if provider == "guardian":
+            return {
+                "response": {
+                    "status": "ok",
+                    "results": [
+                        {"webTitle": a["title"], "webUrl": a["url"], "webPublicationDate": a["published"], "sectionId": "business", "sectionName": "Business", "fields": {"trailText": a["description"], "thumbnail": a["image"], "byline": a["author"]}}
+                        for a in items
+                    ],
+                }
+            }
+        return {
+            "response": {
+                "docs": [
+                    {"headline": {"main": a["title"]}, "snippet": a["description"], "web_url": a["url"], "pub_date": a["published"], "lead_paragraph": a["content"], "section_name": "Business", "byline": {"original": a["author"]}}
+                    for a in items
+                ]
+            }
+        }
+
+
+def make_handler(stub: Stub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def reply(self, status: int, payload: Dict[str, Any]) -> None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            parsed = urlparse(self.path)
+            provider = parsed.path.strip("/").split("/")[0]
+            if provider not in PROVIDERS:
+                self.reply(404, {"message": "unknown provider"})
+                return
+            if stub.delay_and_fail(provider):
+                self.reply(503, {"status": "error", "message": "injected failure"})
+                return
+            query = parse_qs(parsed.query)
+            term = (query.get("q") or query.get("text") or ["bench"])[0]
+            self.reply(200, stub.provider_payload(provider, term))
+
+        def do_POST(self) -> None:
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if stub.delay_and_fail("openai"):
+                self.reply(429, {"error": {"message": "injected rate limit"}})
+                return
+            self.reply(
+                200,
+                {
+                    "choices": [{"message": {"content": STUB_ANSWER}}],
+                    "usage": {"prompt_tokens": 900, "completion_tokens": len(STUB_ANSWER) // 4},
+                },
+            )
+
+        def log_message(self, *args) -> None:
+            pass
+
+    return Handler
+
+
+def process_tree_rss_kb(pid: int) -> int:
+    """Resident set of a process and its descendants (uvicorn workers) from /proc; 0 elsewhere."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status", "r", encoding="utf-8") as handle:
+                for line in handle:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+            with open(f"/proc/{current}/task/{current}/children", "r", encoding="utf-8") as handle:
+                pending.extend(int(child) for child in handle.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+def percentiles(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)  # noqa: E731
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": round(ordered[-1] * 1000, 1)}
+
+
+def lock_wait_probe(path: str, interval: float, samples: List[float], stop: threading.Event) -> None:
+    """Time how long a writer waits for SQLite's write lock on ``path`` while the load runs."""
+    db = sqlite3.connect(path, timeout=60, isolation_level=None)
+    while not stop.wait(interval):
+        started = time.monotonic()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            samples.append(time.monotonic() - started)
+            db.execute("ROLLBACK")
+        except sqlite3.OperationalError:
+            samples.append(time.monotonic() - started)
+    db.close()
+
+
+def parse_weights(raw: str) -> Dict[str, float]:
+    weights = {}
+    for item in raw.split(","):
+        name, _, weight = item.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def parse_override(raw: str) -> Tuple[str, Tuple[float, float, float]]:
+    """``name=latency_ms[:failure_rate]`` for a provider or ``openai``."""
+    name, _, spec = raw.partition("=")
+    latency, _, failure = spec.partition(":")
+    if name not in (*PROVIDERS, "openai") or not latency:
+        raise argparse.ArgumentTypeError(f"Invalid override {raw!r}; expected name=latency_ms[:failure_rate]")
+    return name, (float(latency), float(latency) / 2, float(failure or 0))
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    for name, current in report["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous or not previous.get("latency_ms") or not current.get("latency_ms"):
+            continue
+        before, after = previous["latency_ms"]["p95"], current["latency_ms"]["p95"]
+        if after > before * (1 + tolerance) and after - before > 5:
+            regressions.append(f"{name}: p95 {before}ms -> {after}ms")
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} req/s")
+        if current["error_rate"] > previous["error_rate"] + 0.01:
+            regressions.append(f"{name}: error rate {previous['error_rate']} -> {current['error_rate']}")
+    for db_name, current in report["lock_wait_ms"].items():
+        previous = baseline.get("lock_wait_ms", {}).get(db_name)
+        if previous and current and current["p95"] > previous["p95"] * (1 + tolerance) and current["p95"] - previous["p95"] > 5:
+            regressions.append(f"lock wait {db_name}: p95 {previous['p95']}ms -> {current['p95']}ms")
+    for service, current in report["peak_rss_mb"].items():
+        previous = baseline.get("peak_rss_mb", {}).get(service)
+        if previous and current and current > previous * (1 + tolerance):
+            regressions.append(f"peak RSS {service}: {previous}MB -> {current}MB")
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end news → insights → analysis con stubs locales.")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="nominal", help="perfil de latencia/fallos")
+    parser.add_argument("--provider", action="append", type=parse_override, default=[], help="name=latency_ms[:failure_rate]; repetible")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="pesos por endpoint")
+    parser.add_argument("--terms", default="banco andino,telenova,reforma electrica,mercadosur,seguros", help="términos consultados")
+    parser.add_argument("--articles-per-provider", type=int, default=10)
+    parser.add_argument("--fresh-ratio", type=float, default=0.3, help="fracción de artículos nuevos en cada consulta")
+    parser.add_argument("--workers", type=int, default=2, help="workers de uvicorn de insights/analysis")
+    parser.add_argument("--news-workers", type=int, default=1, help="workers de uvicorn de news_service")
+    parser.add_argument("--clients", type=int, default=16, help="clientes HTTP simultáneos")
+    parser.add_argument("--seconds", type=float, default=60, help="duración de la carga")
+    parser.add_argument("--probe-interval", type=float, default=0.1, help="segundos entre sondas de bloqueo")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default="bench_pipeline_report.json", help="ruta del informe JSON")
+    parser.add_argument("--save-baseline", default=None, help="guarda el informe como baseline")
+    parser.add_argument("--baseline", default=None, help="baseline con el que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="empeoramiento relativo tolerado")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    terms = [term.strip() for term in args.terms.split(",") if term.strip()]
+    weights = parse_weights(args.mix)
+    workdir = tempfile.mkdtemp(prefix="bench-pipeline-")
+    stub = Stub(PROFILES[args.profile], dict(args.provider), args.articles_per_provider, args.fresh_ratio, args.seed)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(stub))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stub_url = f"http://127.0.0.1:{server.server_port}"
+
+    news_url, insights_url, analysis_url = (f"http://127.0.0.1:{free_port()}" for _ in range(3))
+    insights_db = os.path.join(workdir, "insights.db")
+    news_db = os.path.join(workdir, "news.db")
+    env = {
+        **os.environ,
+        "NEWS_DB_PATH": news_db,
+        "INSIGHTS_DB_PATH": insights_db,
+        "VECTOR_INDEX_PATH": os.path.join(workdir, "insight_vectors"),
+        "NEWS_SERVICE_URL": news_url,
+        "OPENAI_API_URL": f"{stub_url}/v1/chat/completions",
+        "OPENAI_API_KEY": "bench",
+        "ANALYSIS_SCHEDULER_ENABLED": "false",
+        "LLM_LEDGER_FLUSH_SECONDS": "1",
+    }
+    env.update({f"{name}_API_KEY": "bench" for name in ("NEWS", "GNEWS", "NEWSDATA", "WORLDNEWS", "GUARDIAN", "NYT")})
+    env.update(
+        {
+            "NEWS_API_URL": f"{stub_url}/newsapi",
+            "GNEWS_API_URL": f"{stub_url}/gnews",
+            "NEWSDATA_API_URL": f"{stub_url}/newsdata",
+            "WORLDNEWS_API_URL": f"{stub_url}/worldnews",
+            "GUARDIAN_API_URL": f"{stub_url}/guardian",
+            "NYT_API_URL": f"{stub_url}/nyt",
+        }
+    )
+    port = lambda url: int(url.rsplit(":", 1)[1])  # noqa: E731
+    services: Dict[str, Any] = {}
+    stop = threading.Event()
+    try:
+        services["news_service"] = start_service("news_service", port(news_url), args.news_workers, env)
+        wait_healthy(news_url)
+        # insights_service antes que analysis_service: migra el esquema de insights.db
+        services["insights_service"] = start_service("insights_service", port(insights_url), args.workers, env)
+        wait_healthy(insights_url)
+        services["analysis_service"] = start_service("analysis_service", port(analysis_url), args.workers, env)
+        wait_healthy(analysis_url)
+
+        def classify_payload(rng: random.Random, term: str) -> Dict[str, Any]:
+            return {
+                "term": term,
+                "articles": [
+                    {"title": f"{term.title()} en el foco {rng.random():.8f}", "description": PARAGRAPH.format(term=term)[:220], "content": PARAGRAPH.format(term=term) * 4, "url": f"https://direct.bench.local/{rng.random()}"}
+                    for _ in range(3)
+                ],
+            }
+
+        calls: Dict[str, Tuple[str, Callable[[random.Random, str], requests.Response]]] = {
+            "news": ("GET /news", lambda rng, term: requests.get(f"{news_url}/news", params={"term": term}, timeout=120)),
+            "insights": ("GET /insights", lambda rng, term: requests.get(f"{insights_url}/insights", params={"term": term}, timeout=300)),
+            "classify": ("POST /insights/classify", lambda rng, term: requests.post(f"{insights_url}/insights/classify", json=classify_payload(rng, term), timeout=300)),
+            "analysis": ("POST /analysis/run", lambda rng, term: requests.post(f"{analysis_url}/analysis/run", json={"term": term, "limit": 10}, timeout=300)),
+            "archive": ("GET /news/archive", lambda rng, term: requests.get(f"{news_url}/news/archive", params={"term": term, "limit": 50}, timeout=60)),
+            "list": ("GET /insights/list", lambda rng, term: requests.get(f"{insights_url}/insights/list", params={"term": term, "limit": 50}, timeout=60)),
+            "history": ("GET /analysis/history", lambda rng, term: requests.get(f"{analysis_url}/analysis/history", params={"term": term}, timeout=60)),
+        }
+        unknown = set(weights) - set(calls)
+        if unknown:
+            print(f"Endpoints desconocidos en --mix: {sorted(unknown)}; disponibles: {sorted(calls)}", file=sys.stderr)
+            return 2
+        names = list(weights)
+
+        # Calentamiento fuera de la medición: cada término pasa una vez por la cadena completa
+        for term in terms:
+            requests.get(f"{insights_url}/insights", params={"term": term}, timeout=300)
+
+        latencies: Dict[str, List[float]] = defaultdict(list)
+        errors: Dict[str, int] = defaultdict(int)
+        locked = 0
+        lock = threading.Lock()
+        lock_waits: Dict[str, List[float]] = {"insights.db": [], "news.db": []}
+        peak_rss: Dict[str, int] = defaultdict(int)
+        probes = [
+            threading.Thread(target=lock_wait_probe, args=(insights_db, args.probe_interval, lock_waits["insights.db"], stop), daemon=True),
+            threading.Thread(target=lock_wait_probe, args=(news_db, args.probe_interval, lock_waits["news.db"], stop), daemon=True),
+        ]
+
+        def sample_rss() -> None:
+            while not stop.wait(0.5):
+                for name, process in services.items():
+                    peak_rss[name] = max(peak_rss[name], process_tree_rss_kb(process.pid))
+
+        deadline = time.monotonic() + args.seconds
+
+        def client(seed: int) -> None:
+            nonlocal locked
+            rng = random.Random(args.seed * 1000 + seed)
+            while time.monotonic() < deadline:
+                label, call = calls[rng.choices(names, weights=[weights[name] for name in names])[0]]
+                term = rng.choice(terms)
+                started = time.monotonic()
+                try:
+                    response = call(rng, term)
+                    failed, detail = response.status_code >= 500 or response.status_code == 429, response.text[:200]
+                except requests.RequestException as exc:
+                    failed, detail = True, str(exc)
+                with lock:
+                    latencies[label].append(time.monotonic() - started)
+                    if failed:
+                        errors[label] += 1
+                        locked += "locked" in detail or "busy" in detail
+
+        for thread in [*probes, threading.Thread(target=sample_rss, daemon=True)]:
+            thread.start()
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=args.clients) as pool:
+            list(pool.map(client, range(args.clients)))
+        elapsed = time.monotonic() - started
+        stop.set()
+        for thread in probes:
+            thread.join(timeout=5)
+
+        report: Dict[str, Any] = {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "config": {key: value for key, value in vars(args).items() if key not in {"output", "save_baseline", "baseline"}},
+            "elapsed_seconds": round(elapsed, 1),
+            "endpoints": {},
+            "locked_errors": locked,
+            "lock_wait_ms": {name: percentiles(values) for name, values in lock_waits.items()},
+            "peak_rss_mb": {name: round(kb / 1024, 1) if kb else None for name, kb in peak_rss.items()},
+            "stub": {"calls": dict(stub.calls), "injected_failures": dict(stub.failures)},
+        }
+        print(f"{sum(len(v) for v in latencies.values())} peticiones en {elapsed:.0f}s, perfil {args.profile}, {args.clients} clientes")
+        for label, values in sorted(latencies.items()):
+            summary = {
+                "requests": len(values),
+                "errors": errors[label],
+                "error_rate": round(errors[label] / len(values), 4),
+                "throughput_rps": round(len(values) / elapsed, 3),
+                "latency_ms": percentiles(values),
+            }
+            report["endpoints"][label] = summary
+            latency = summary["latency_ms"]
+            print(
+                f"  {label:<24} n={len(values):<5} {summary['throughput_rps']:7.2f} req/s  p50={latency['p50']:8.1f}ms "
+                f"p95={latency['p95']:8.1f}ms p99={latency['p99']:8.1f}ms errores={errors[label]}"
+            )
+        for name, waits in report["lock_wait_ms"].items():
+            print(f"  espera de bloqueo {name:<12} {waits}")
+        print(f"  RSS pico (MB): {report['peak_rss_mb']}  errores 'database is locked': {locked}")
+
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, ensure_ascii=False, indent=2)
+        if args.save_baseline:
+            with open(args.save_baseline, "w", encoding="utf-8") as handle:
+                json.dump(report, handle, ensure_ascii=False, indent=2)
+            print(f"Baseline guardada en {args.save_baseline}")
+        if args.baseline:
+            with open(args.baseline, "r", encoding="utf-8") as handle:
+                regressions = compare(report, json.load(handle), args.tolerance)
+            if regressions:
+                print(f"FAIL: {len(regressions)} regresiones frente a {args.baseline}")
+                for line in regressions:
+                    print(f"  {line}")
+                return 1
+            print(f"OK: sin regresiones frente a {args.baseline} (tolerancia {args.tolerance:.0%})")
+        return 0
+    finally:
+        stop.set()
+        for process in services.values():
+            process.terminate()
+        for process in services.values():
+            process.wait(timeout=30)
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
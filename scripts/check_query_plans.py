@@ -0,0 +1,141 @@
+"""Query-plan regression check for the Python services.
+
+Loads insights_service and analysis_service against a throwaway SQLite file, exercises every
+read path they expose while recording the SQL they issue, and runs EXPLAIN QUERY PLAN on each
+SELECT. Exits non-zero if a filtered query falls back to a full table scan or if a listing needs
+a temporary B-tree to sort.
+
+Usage: python scripts/check_query_plans.py
+"""
+from __future__ import annotations
+
+import importlib.util
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def load_service(name: str, directory: str):
+    sys.path.insert(0, os.path.join(ROOT, directory))
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, directory, "app.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def capture(conn: sqlite3.Connection, calls: Dict[str, Callable[[], object]]) -> Dict[str, List[str]]:
+    statements: Dict[str, List[str]] = {}
+    for label, call in calls.items():
+        issued: List[str] = []
+        conn.set_trace_callback(issued.append)
+        try:
+            call()
+        finally:
+            conn.set_trace_callback(None)
+        statements[label] = [sql for sql in issued if sql.lstrip().upper().startswith("SELECT")]
+    return statements
+
+
+def check_plans(conn: sqlite3.Connection, statements: Dict[str, List[str]]) -> List[str]:
+    failures: List[str] = []
+    for label, queries in statements.items():
+        for sql in queries:
+            plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()]
+            filtered = " WHERE " in sql.upper()
+            for detail in plan:
+                scan = FULL_SCAN.match(detail)
+                if scan and filtered:
+                    failures.append(f"{label}: full scan of {scan.group(1)}\n  {sql.strip()}\n  plan={plan}")
+                if "TEMP B-TREE FOR ORDER BY" in detail and "GROUP BY" not in sql.upper():
+                    failures.append(f"{label}: sort without index\n  {sql.strip()}\n  plan={plan}")
+    return failures
+
+
+def main() -> int:
+    workdir = tempfile.mkdtemp(prefix="query-plans-")
+    os.environ["INSIGHTS_DB_PATH"] = os.path.join(workdir, "insights.db")
+
+    insights = load_service("insights_app", "insights_service")
+    for index in range(3):
+        insights.store_insight_record(
+            "demo",
+            {"title": f"Noticia {index}", "description": "Descripción", "url": f"https://example.com/{index}"},
+            {"sentimiento": "neutro", "etiquetas": "banca,pagos", "marca": "Demo", "confianza": 0.5},
+        )
+    insights.create_classification_run("plan-check", "demo", "demo", [{"title": "Noticia"}])
+    analysis = load_service("analysis_app", "analysis_service")
+    import reclassify
+
+    analysis_id = analysis.persist_analysis(
+        "demo", [1, 2], {"insights": [], "oportunidades_negocio": [], "riesgos_reputacionales": []}, 2
+    )
+
+    stale_params = (0, insights.PROMPT_VERSION, insights.LLM_MODEL)
+
+    summary = insights.resolve_insight_columns("summary", None)
+    statements = capture(
+        insights.database.reader(),
+        {
+            "list_insights:all": lambda: insights.list_insights(None, 10, 0, columns=summary),
+            "list_insights:term": lambda: insights.list_insights("demo", 10, 0, columns=summary),
+            "list_insights:term+cursor": lambda: insights.list_insights("demo", 10, 0, columns=summary, cursor=3),
+            "list_insights:cursor": lambda: insights.list_insights(None, 10, 0, columns=summary, cursor=3),
+            "list_insights:facet": lambda: insights.list_insights(None, 10, 0, {"etiquetas": "banca"}, summary),
+            "load_insights_by_ids": lambda: insights.load_insights_by_ids([1, 2]),
+            "search_similar:term": lambda: insights.search_similar(insights.embed_text("banca", insights.VECTOR_DIM), 5, "demo"),
+            "top_facet_values:term": lambda: insights.top_facet_values("etiquetas", "demo", "2024-01-01", 20),
+            "top_facet_values:all": lambda: insights.top_facet_values("etiquetas", None, "2024-01-01", 20),
+            "insight_stats:term": lambda: insights.insight_stats("demo", "2024-01-01", "2030-01-01"),
+            "backfill_vector_index": insights.backfill_vector_index,
+            "classification_run_response": lambda: insights.classification_run_response("plan-check"),
+            "llm_usage_summary:term": lambda: insights.llm_usage_summary("demo", "2024-01-01", None, None),
+            "llm_usage_summary:range": lambda: insights.llm_usage_summary(None, "2024-01-01", "2030-01-01", None),
+            "reclassify:stale": lambda: insights.database.reader().execute(
+                reclassify.stale_rows_query(None, False), (*stale_params, 10)
+            ).fetchall(),
+            "reclassify:stale+term": lambda: insights.database.reader().execute(
+                reclassify.stale_rows_query("demo", True), (*stale_params, "demo", 10)
+            ).fetchall(),
+        },
+    )
+    statements.update(
+        capture(
+            analysis.database.reader(),
+            {
+                "fetch_insight_rows:term": lambda: analysis.fetch_insight_rows("demo", 5, None),
+                "fetch_insight_rows:ids": lambda: analysis.fetch_insight_rows(None, 5, [1, 2]),
+                "fetch_insight_rows:latest": lambda: analysis.fetch_insight_rows(None, 5, None),
+                "analysis_history": lambda: analysis.analysis_history(limit=5, cursor=None, term=None),
+                "analysis_history:cursor+term": lambda: analysis.analysis_history(limit=5, cursor=10, term="demo"),
+                "analysis_detail": lambda: analysis.analysis_detail(analysis_id),
+                "hot_terms": analysis.hot_terms,
+                "scheduler_tokens_today": analysis.scheduler_tokens_today,
+                "newest_insight_id": lambda: analysis.newest_insight_id("demo"),
+                "cached_partial": lambda: analysis.cached_partial("plan-check"),
+                "latest_term_analysis": lambda: analysis.latest_term_analysis("demo"),
+                "fetch_insights_since": lambda: analysis.fetch_insights_since("demo", 1, 10),
+                "cached_analysis": lambda: analysis.cached_analysis(analysis.analysis_cache_key([1, 2])),
+            },
+        )
+    )
+
+    failures = check_plans(insights.database.reader(), statements)
+    checked = sum(len(queries) for queries in statements.values())
+    if failures:
+        print(f"{len(failures)} query-plan regression(s) in {checked} statements:")
+        for failure in failures:
+            print(f"- {failure}")
+        return 1
+    print(f"OK: {checked} statements across {len(statements)} query shapes use indexes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""LLM ledger check for the streamed analysis endpoint.
+
+Loads insights_service and analysis_service against a throwaway SQLite file, answers the model
+call with a canned streamed completion and runs ``POST /analysis/run/stream`` through FastAPI's
+TestClient. Exits non-zero unless the ledger row of that call carries the endpoint and term of
+the request.
+
+Usage: python scripts/check_stream_ledger.py
+"""
+from __future__ import annotations
+
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+from typing import Any, Dict, Iterator, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ANALYSIS = {
+    "insights": [{"titulo": "Tendencia", "descripcion": "Cobertura estable"}],
+    "oportunidades_negocio": [],
+    "riesgos_reputacionales": [],
+}
+
+
+def load_service(name: str, directory: str):
+    sys.path.insert(0, os.path.join(ROOT, directory))
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, directory, "app.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class CannedStream:
+    """Stand-in for a streamed ``requests`` response: the analysis split into SSE deltas plus usage."""
+
+    def __init__(self, text: str):
+        chunks: List[Dict[str, Any]] = [
+            {"choices": [{"delta": {"content": text[start : start + 16]}}]} for start in range(0, len(text), 16)
+        ]
+        chunks.append({"choices": [], "usage": {"prompt_tokens": 120, "completion_tokens": 40}})
+        self.lines = [f"data: {json.dumps(chunk)}" for chunk in chunks] + ["data: [DONE]"]
+
+    def raise_for_status(self) -> None:
+        pass
+
+    def iter_lines(self, decode_unicode: bool = False) -> Iterator[str]:
+        return iter(self.lines)
+
+    def __enter__(self) -> "CannedStream":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+
+def main() -> int:
+    workdir = tempfile.mkdtemp(prefix="stream-ledger-")
+    os.environ["INSIGHTS_DB_PATH"] = os.path.join(workdir, "insights.db")
+    os.environ["OPENAI_API_KEY"] = "check"
+    os.environ["ANALYSIS_SCHEDULER_ENABLED"] = "false"
+
+    insights = load_service("insights_app", "insights_service")
+    for index in range(3):
+        insights.store_insight_record(
+            "demo",
+            {"title": f"Noticia {index}", "description": "Descripción", "url": f"https://example.com/{index}"},
+            {"sentimiento": "neutro", "resumen": f"Resumen {index}"},
+        )
+    analysis = load_service("analysis_app", "analysis_service")
+    analysis.requests.post = lambda *args, **kwargs: CannedStream(json.dumps(ANALYSIS))
+
+    from fastapi.testclient import TestClient
+
+    response = TestClient(analysis.app).post("/analysis/run/stream", json={"term": "demo", "limit": 3})
+    if "event: done" not in response.text:
+        print(f"FAIL: stream did not finish\n{response.text}")
+        return 1
+    analysis.flush_llm_ledger()
+    rows = analysis.database.reader().execute(
+        "SELECT endpoint, term, status FROM llm_usage WHERE service = ?", (analysis.SERVICE_NAME,)
+    ).fetchall()
+    recorded = [tuple(row) for row in rows]
+    if recorded != [("/analysis/run/stream", "demo", "ok")]:
+        print(f"FAIL: expected one ledger row for /analysis/run/stream and term 'demo', got {recorded}")
+        return 1
+    print("OK: streamed analysis ledger row carries endpoint and term")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""Find where a slow request spent its time, from the JSONL spans the services export.
+
+Reads one or more `TRACE_EXPORT_PATH` files (news_service, insights_service and analysis_service can
+write to the same or to separate files), stitches spans by trace id and prints the slowest traces with
+their bottleneck, the span tree of one trace, or the self time aggregated per span name.
+
+    python scripts/trace_report.py /data/traces.jsonl --slowest 10
+    python scripts/trace_report.py traces-news.jsonl traces-insights.jsonl --tree            # la más lenta
+    python scripts/trace_report.py traces.jsonl --tree --trace 4bf92f3577b34da6a3ce929d0e0e4736
+    python scripts/trace_report.py traces.jsonl --by-name --name "GET /insights"
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+Span = Dict[str, Any]
+
+
+def load_traces(paths: List[str]) -> Dict[str, List[Span]]:
+    traces: Dict[str, List[Span]] = defaultdict(list)
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as handle:
+            for line in handle:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    traces[record["trace_id"]].append(record)
+    return traces
+
+
+def root_of(spans: List[Span]) -> Span:
+    """Earliest span whose parent is not in the trace (the first service hit by the client)."""
+    ids = {span["span_id"] for span in spans}
+    roots = [span for span in spans if span["parent_id"] not in ids] or spans
+    return min(roots, key=lambda span: span["start"])
+
+
+def children_of(spans: List[Span]) -> Dict[Optional[str], List[Span]]:
+    children: Dict[Optional[str], List[Span]] = defaultdict(list)
+    for span in spans:
+        children[span["parent_id"]].append(span)
+    for items in children.values():
+        items.sort(key=lambda span: span["start"])
+    return children
+
+
+def self_times(spans: List[Span]) -> Dict[str, float]:
+    """Duration minus time covered by direct children (overlapping children counted once)."""
+    children = children_of(spans)
+    result = {}
+    for span in spans:
+        covered, cursor = 0.0, span["start"]
+        for child in children.get(span["span_id"], []):
+            begin, end = max(child["start"], cursor), child["start"] + child["duration_ms"] / 1000
+            if end > begin:
+                covered += end - begin
+                cursor = end
+        result[span["span_id"]] = max(span["duration_ms"] - covered * 1000, 0.0)
+    return result
+
+
+def bottleneck(spans: List[Span]) -> Tuple[Span, float]:
+    selfs = self_times(spans)
+    span_id = max(selfs, key=selfs.get)
+    return next(span for span in spans if span["span_id"] == span_id), selfs[span_id]
+
+
+def describe(span: Span) -> str:
+    attributes = span.get("attributes") or {}
+    extra = [f"{key}={attributes[key]}" for key in ("attempt", "http.status_code", "error") if key in attributes]
+    if "statement" in attributes:
+        extra.append(attributes["statement"][:80])
+    return f"{span['service']}:{span['name']}" + (f"  [{' '.join(str(item) for item in extra)}]" if extra else "")
+
+
+def print_tree(spans: List[Span]) -> None:
+    root = root_of(spans)
+    children = children_of(spans)
+    selfs = self_times(spans)
+    print(f"trace {root['trace_id']}  {root['duration_ms']:.1f}ms  {len(spans)} spans")
+
+    def walk(span: Span, depth: int) -> None:
+        offset = (span["start"] - root["start"]) * 1000
+        marker = " !" if span["status"] == "error" else ""
+        print(
+            f"  {offset:9.1f}ms {span['duration_ms']:9.1f}ms self={selfs[span['span_id']]:8.1f}ms "
+            f"{'  ' * depth}{describe(span)}{marker}"
+        )
+        for child in children.get(span["span_id"], []):
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    span, self_ms = bottleneck(spans)
+    print(f"Cuello de botella: {describe(span)} ({self_ms:.1f}ms propios)")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Resumen de trazas exportadas en JSONL.")
+    parser.add_argument("paths", nargs="+", help="archivos TRACE_EXPORT_PATH")
+    parser.add_argument("--name", default=None, help="sólo trazas cuyo span raíz se llame así (p. ej. 'GET /insights')")
+    parser.add_argument("--slowest", type=int, default=10, help="trazas más lentas a listar")
+    parser.add_argument("--tree", action="store_true", help="árbol de spans de la traza más lenta o de --trace")
+    parser.add_argument("--trace", default=None, help="id de traza (cabecera traceparent de la respuesta)")
+    parser.add_argument("--by-name", action="store_true", help="tiempo propio agregado por servicio y span")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    traces = load_traces(args.paths)
+    if args.name:
+        traces = {trace_id: spans for trace_id, spans in traces.items() if root_of(spans)["name"] == args.name}
+    if not traces:
+        print("Sin trazas")
+        return 1
+    ranked = sorted(traces.items(), key=lambda item: root_of(item[1])["duration_ms"], reverse=True)
+
+    if args.tree:
+        trace_id = args.trace or ranked[0][0]
+        if trace_id not in traces:
+            print(f"Traza {trace_id} no encontrada", file=sys.stderr)
+            return 1
+        print_tree(traces[trace_id])
+        return 0
+
+    if args.by_name:
+        totals: Dict[str, List[float]] = defaultdict(list)
+        for spans in traces.values():
+            selfs = self_times(spans)
+            for span in spans:
+                totals[f"{span['service']}:{span['name']}"].append(selfs[span["span_id"]])
+        print(f"{'span':<60} {'n':>6} {'total ms':>11} {'p95 ms':>9}")
+        for name, values in sorted(totals.items(), key=lambda item: sum(item[1]), reverse=True)[:30]:
+            values.sort()
+            p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+            print(f"{name[:60]:<60} {len(values):>6} {sum(values):>11.1f} {p95:>9.1f}")
+        return 0
+
+    print(f"{len(traces)} trazas; las {min(args.slowest, len(ranked))} más lentas:")
+    for trace_id, spans in ranked[: args.slowest]:
+        root = root_of(spans)
+        span, self_ms = bottleneck(spans)
+        services = sorted({item["service"] for item in spans})
+        print(
+            f"  {trace_id} {root['duration_ms']:9.1f}ms {root['name']:<28} spans={len(spans):<4} "
+            f"{','.join(services)}  -> {span['service']}:{span['name']} {self_ms:.1f}ms"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())